@@ -1,5 +1,6 @@
 import sqlite3
-from flask import Flask, render_template, g, abort, url_for, current_app, jsonify, request
+from flask import Flask, render_template, g, abort, url_for, current_app, jsonify, request, Response, has_app_context
+from flask import before_render_template, template_rendered
 import os
 from urllib.parse import unquote, quote
 from collections import defaultdict
@@ -9,8 +10,28 @@ import math # Add math import for ceil
 import time # Add time for benchmarking population
 import re # Import regex for sorting
 import logging # Add logging import for logging
-
-DATABASE = 'panres_ontology.db'
+import logging.handlers
+import hashlib
+import fcntl
+import sys
+import bisect
+import base64
+from array import array
+from collections import OrderedDict
+import threading
+import gzip
+import zlib
+try:
+    import brotli
+except ImportError:
+    brotli = None # Optional: without it responses are only gzip-compressed
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess as prometheus_multiprocess
+except ImportError:
+    prometheus_client = None # Optional: without it /metrics is not available
+
+DATABASE = os.environ.get('PANRES_DATABASE', 'panres_ontology.db')
 CITATION_TEXT = "Hannah-Marie Martiny, Nikiforos Pyrounakis, Thomas N Petersen, Oksana Lukjančenko, Frank M Aarestrup, Philip T L C Clausen, Patrick Munk, ARGprofiler—a pipeline for large-scale analysis of antimicrobial resistance genes and their flanking regions in metagenomic datasets, <i>Bioinformatics</i>, Volume 40, Issue 3, March 2024, btae086, <a href=\"https://doi.org/10.1093/bioinformatics/btae086\" target=\"_blank\" rel=\"noopener noreferrer\" class=\"text-dtu-red hover:underline\">https://doi.org/10.1093/bioinformatics/btae086</a>"
 SITE_NAME = "PanRes 2.0 Database"
 
@@ -27,6 +48,7 @@ RDFS_COMMENT = 'rdfs:comment'
 HAS_RESISTANCE_CLASS = 'has_resistance_class'
 HAS_PREDICTED_PHENOTYPE = 'has_predicted_phenotype'
 IS_FROM_DATABASE = 'is_from_database'
+HAS_LENGTH = 'has_length'
 DESCRIPTION_PREDICATES = [RDFS_COMMENT, 'description', 'dc:description', 'skos:definition']
 PREDICATE_MAP = {
     RDF_TYPE: "Type",
@@ -35,7 +57,7 @@ PREDICATE_MAP = {
     'description': "Description",
     'dc:description': "Description",
     'skos:definition': "Definition",
-    'has_length': "Length",
+    HAS_LENGTH: "Length",
     'same_as': "Same As",
     'card_link': "CARD Link",
     'accession': "Accession",
@@ -52,14 +74,369 @@ PREDICATE_MAP = {
 
 # Define OWL namespace constant
 OWL_NAMED_INDIVIDUAL = 'owl:NamedIndividual'
+# Gene types that autocomplete standardizes to "PanGene"
+PANGENE_TYPES = {'PanGene', 'AntimicrobialResistanceGene', 'BiocideResistanceGene', 'MetalResistanceGene'}
+
+# Bump whenever the layout or content rules of the FTS tables change, so existing
+# databases get their index rebuilt even if the triples themselves did not change.
+FTS_SCHEMA_VERSION = 2
+FTS_META_TABLE = 'search_index_meta'
+FTS_LOCK_SUFFIX = '.fts.lock'
+FTS_REFRESH_RETRY_SECONDS = 30 # Between attempts of a worker to bring the FTS index up to a new build
+# Same idea for the summary tables behind the index page (index_category_counts,
+# index_distribution_counts) and the list pages (list_index, list_entries), which
+# also record the INDEX_CATEGORIES they were built for
+INDEX_SUMMARY_SCHEMA_VERSION = 2
+INDEX_SUMMARY_META_TABLE = 'index_summary_meta'
+INDEX_DISTRIBUTION_CHARTS = ('class', 'phenotype', 'database')
+# Predicates whose values details pages link to a '/list/related/...' page for
+LIST_PREDICATES = (HAS_RESISTANCE_CLASS, HAS_PREDICTED_PHENOTYPE, IS_FROM_DATABASE, RDF_TYPE)
+# Predicates the grouped category lists group PanGenes by
+GROUPING_PREDICATES = (HAS_RESISTANCE_CLASS, HAS_PREDICTED_PHENOTYPE)
+# Links the graph snapshot holds as adjacency arrays (see GraphSnapshot), and the flag it
+# sets on the objects of those that give an item its role (see get_item_category)
+SNAPSHOT_LINK_PREDICATES = (RDF_TYPE, 'same_as', HAS_RESISTANCE_CLASS, HAS_PREDICTED_PHENOTYPE, IS_FROM_DATABASE)
+SNAPSHOT_ROLE_FLAGS = {HAS_RESISTANCE_CLASS: 4, HAS_PREDICTED_PHENOTYPE: 8, IS_FROM_DATABASE: 16}
+SNAPSHOT_IS_SUBJECT = 1
+SNAPSHOT_HAS_LABEL = 2
+# Autocomplete terms need at least one letter/digit for FTS5 to produce a token to match on
+AUTOCOMPLETE_TOKEN_RE = re.compile(r'[^\W_]')
+# Endpoints whose responses are a pure function of the database build, the code and the
+# request, and so get an ETag and answer matching If-None-Match with 304 Not Modified
+CONDITIONAL_GET_ENDPOINTS = ('index', 'list_items', 'details')
+# Response types worth compressing (see compress_response)
+COMPRESSIBLE_MIMETYPES = ('text/html', 'application/json', 'text/css', 'text/javascript', 'application/javascript', 'text/plain')
+# Query plans log_slow_queries() keeps per worker
+SLOW_QUERY_PLAN_CACHE_SIZE = 256
+# Histogram buckets (seconds) of the request and per-request SQL time metrics
+REQUEST_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CASE_MARK_UPPER = '\u02c6'
+CASE_MARK_LOWER = '\u02cc'
 
 # Configure basic logging (adjust level and format as needed)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
 
-def create_and_populate_fts(db_path):
+def get_db_fingerprint(db_conn):
+    """
+    Returns a content fingerprint for the Triples table: '<row count>:<build id>'.
+    The build id is written to 'BuildInfo' by owl2sqlite.py. Databases converted
+    before that table existed fall back to a SHA-1 over all triples, which is
+    slower but still only changes when the content does.
+    """
+    triple_count = db_conn.execute("SELECT COUNT(*) FROM triples").fetchone()[0]
+    build_id = None
+    try:
+        row = db_conn.execute("SELECT value FROM BuildInfo WHERE key = 'build_id'").fetchone()
+        build_id = row[0] if row else None
+    except sqlite3.OperationalError:
+        pass # No BuildInfo table (older conversion)
+
+    if not build_id:
+        digest = hashlib.sha1()
+        for row in db_conn.execute("SELECT subject, predicate, object, object_is_literal, IFNULL(object_datatype, '') FROM triples ORDER BY rowid"):
+            digest.update('\x1f'.join(str(part) for part in row).encode('utf-8'))
+            digest.update(b'\x1e')
+        build_id = f"sha1-{digest.hexdigest()}"
+
+    return f"{triple_count}:{build_id}"
+
+def get_changed_items(db_conn, from_fingerprint, to_fingerprint):
+    """
+    Items touched by the incremental updates (owl2sqlite.py --update) leading from the
+    build in `from_fingerprint` to the one in `to_fingerprint`, as {item_id:
+    label_changed}, read from BuildHistory/BuildChangelog. Returns None if there is no
+    such chain of updates (e.g. a full conversion happened in between), in which case
+    anything derived from the old build has to be rebuilt from scratch.
+    """
+    if not from_fingerprint or not to_fingerprint:
+        return None
+    from_build = from_fingerprint.partition(':')[2]
+    build = to_fingerprint.partition(':')[2]
+    changed = {}
+    seen = set()
+    try:
+        while build != from_build:
+            if build in seen:
+                return None
+            seen.add(build)
+            row = db_conn.execute("SELECT parent_build_id FROM BuildHistory WHERE build_id = ?", (build,)).fetchone()
+            if not row or not row[0]:
+                return None
+            for item_id, label_changed in db_conn.execute("SELECT item_id, label_changed FROM BuildChangelog WHERE build_id = ?", (build,)):
+                changed[item_id] = changed.get(item_id, False) or bool(label_changed)
+            build = row[0]
+    except sqlite3.OperationalError:
+        return None # No update history in this database
+    return changed
+
+def get_fts_index_state(db_conn):
+    """Returns the metadata recorded by the last successful FTS build ({} if none)."""
+    try:
+        rows = db_conn.execute(f"SELECT key, value FROM {FTS_META_TABLE}").fetchall()
+    except sqlite3.OperationalError:
+        return {} # Index never built
+    return {row[0]: row[1] for row in rows}
+
+def is_fts_index_current(db_conn, fingerprint):
+    state = get_fts_index_state(db_conn)
+    return (state.get('fingerprint') == fingerprint
+            and state.get('schema_version') == str(FTS_SCHEMA_VERSION))
+
+def ensure_fts_index(db_path, wait=True):
+    """
+    Builds the FTS index only if it does not match the current triples fingerprint
+    and FTS_SCHEMA_VERSION. A file lock next to the database makes sure a single
+    process builds; the others either block until it is done (wait=True) or return
+    immediately so they can serve without search in the meantime.
+
+    Returns (is_ready, fingerprint).
+    """
+    db = sqlite3.connect(db_path)
+    try:
+        fingerprint = get_db_fingerprint(db)
+        if is_fts_index_current(db, fingerprint):
+            print(f"FTS index is up to date (fingerprint {fingerprint}), skipping rebuild.")
+            return True, fingerprint
+    finally:
+        db.close()
+
+    with open(db_path + FTS_LOCK_SUFFIX, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print("FTS index is being built by another process; serving without search until it completes.")
+            return False, fingerprint
+        try:
+            # Another process may have finished the build while we were waiting on the lock
+            db = sqlite3.connect(db_path)
+            try:
+                if is_fts_index_current(db, fingerprint):
+                    print("FTS index was built by another process, skipping rebuild.")
+                    return True, fingerprint
+                # An index of an earlier build that reached this one through incremental
+                # updates only needs the rows of the items those updates touched
+                state = get_fts_index_state(db)
+                changed = None
+                if state.get('schema_version') == str(FTS_SCHEMA_VERSION):
+                    changed = get_changed_items(db, state.get('fingerprint'), fingerprint)
+            finally:
+                db.close()
+            if changed is not None:
+                update_fts_index(db_path, fingerprint, changed)
+            else:
+                create_and_populate_fts(db_path, fingerprint=fingerprint)
+            return True, fingerprint
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def get_type_indicator(item_id, item_all_types, class_ids, phenotype_ids, database_ids, label_lookup):
+    """
+    Standardized type shown next to an autocomplete suggestion. Roles (being the object
+    of has_resistance_class etc.) take priority over rdf:type; gene types collapse to
+    "PanGene". `label_lookup` resolves a type ID to its display label.
+    """
+    if item_id in class_ids: return "Resistance Class"
+    if item_id in phenotype_ids: return "Predicted Phenotype"
+    if item_id in database_ids: return "Source Database"
+    if any(t in PANGENE_TYPES for t in item_all_types): return "PanGene"
+    if 'OriginalGene' in item_all_types: return "OriginalGene"
+    # Fallback: find a preferred type label (non-OWL, non-NamedIndividual)
+    preferred_type = next((t for t in item_all_types if t != OWL_NAMED_INDIVIDUAL and not t.startswith('owl:')), None)
+    if preferred_type:
+        return label_lookup(preferred_type)
+    if item_all_types: # If only OWL/NamedIndividual types, use the first one's label
+        return label_lookup(item_all_types[0])
+    return "Other"
+
+def get_autocomplete_entries(db_conn):
+    """
+    Returns [(item_id, search_keys, display_name, type_indicator), ...] for every
+    subject, sorted by item_id. Search keys are the ID itself plus all of its labels.
+    Uses a fixed handful of full-table queries rather than per-item lookups.
+    """
+    labels_by_subject = defaultdict(list)
+    for row in db_conn.execute("SELECT subject, object FROM triples WHERE predicate = ? ORDER BY rowid", (RDFS_LABEL,)):
+        labels_by_subject[row[0]].append(row[1])
+
+    types_by_subject = defaultdict(list)
+    for row in db_conn.execute("SELECT subject, object FROM triples WHERE predicate = ? ORDER BY rowid", (RDF_TYPE,)):
+        types_by_subject[row[0]].append(row[1])
+
+    def objects_of(predicate):
+        return {row[0] for row in db_conn.execute("SELECT DISTINCT object FROM triples WHERE predicate = ?", (predicate,))}
+    class_ids = objects_of(HAS_RESISTANCE_CLASS)
+    phenotype_ids = objects_of(HAS_PREDICTED_PHENOTYPE)
+    database_ids = objects_of(IS_FROM_DATABASE)
+
+    def label_lookup(item_id):
+        item_labels = labels_by_subject.get(item_id)
+        return item_labels[-1] if item_labels else item_id
+
+    entries = []
+    for (item_id,) in db_conn.execute("SELECT DISTINCT subject FROM triples ORDER BY subject"):
+        if not item_id: continue
+        item_labels = labels_by_subject.get(item_id, [])
+        search_keys = [item_id] + [label for label in dict.fromkeys(item_labels) if label and label != item_id]
+        type_indicator = get_type_indicator(item_id, types_by_subject.get(item_id, []),
+                                            class_ids, phenotype_ids, database_ids, label_lookup)
+        entries.append((item_id, search_keys, label_lookup(item_id), type_indicator))
+    # Python string order (code points) == SQLite BINARY order for UTF-8, but sort anyway
+    # so callers can rely on it regardless of the query plan.
+    entries.sort(key=lambda entry: entry[0])
+    return entries
+
+def encode_case_key(text):
+    """
+    Follows every ASCII letter with a marker for its case ('blaT' -> 'bˌlˌaˌtˆ'), so a
+    prefix query through the case-folding 'ascii' tokenizer only matches keys with the
+    same case. Markers are non-ASCII, which that tokenizer treats as token characters.
+    """
+    return ''.join(
+        (char.lower() + (CASE_MARK_UPPER if char.isupper() else CASE_MARK_LOWER)) if char.isascii() and char.isalpha() else char
+        for char in text
+    )
+
+def populate_autocomplete_fts(cur):
+    """
+    Fills item_autocomplete_fts. Rows are inserted in item_id order so that rowid order
+    equals item_id order, which lets queries walk matches already sorted by ID.
+    """
+    rows = []
+    for item_id, search_keys, display_name, type_indicator in get_autocomplete_entries(cur.connection):
+        for key in search_keys:
+            rows.append((key, encode_case_key(key), item_id, display_name, type_indicator))
+    cur.executemany("INSERT INTO item_autocomplete_fts (search_key, case_key, item_id, display_name, type_indicator) VALUES (?, ?, ?, ?, ?)", rows)
+    print(f"    Inserted {len(rows)} autocomplete keys.")
+
+def write_fts_index_state(cur, fingerprint):
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {FTS_META_TABLE} (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    cur.execute(f"DELETE FROM {FTS_META_TABLE}")
+    cur.executemany(f"INSERT INTO {FTS_META_TABLE} (key, value) VALUES (?, ?)", [
+        ('fingerprint', fingerprint or ''),
+        ('schema_version', str(FTS_SCHEMA_VERSION)),
+        ('built_at', datetime.datetime.now(datetime.timezone.utc).isoformat()),
+    ])
+
+def fetch_fts_labels(cur, item_ids):
+    """Returns {item_id: label} for the given IDs (any ID with several labels keeps the last one read)."""
+    labels = {}
+    label_list = list(item_ids)
+    label_batch_size = 10000 # IDs per query, passed as one JSON array
+    label_query = "SELECT subject, object FROM triples WHERE predicate = ? AND subject IN (SELECT value FROM json_each(?))"
+    for i in range(0, len(label_list), label_batch_size):
+        cur.execute(label_query, (RDFS_LABEL, json.dumps(label_list[i:i+label_batch_size])))
+        for row in cur.fetchall():
+            labels[row[0]] = row[1]
+    return labels
+
+def get_search_fts_rows(cur, subject_list, labels):
+    """
+    Returns the item_search_fts rows, [(item_id, term), ...], for the given subjects:
+    their ID and label plus every predicate, literal, object ID and object label of
+    their triples. `labels` must cover the subjects and their URI objects.
+    """
+    fts_data = []
+    processed_count = 0
+    batch_size = 10000 # Process subjects in batches
+    for i in range(0, len(subject_list), batch_size):
+        batch_ids = subject_list[i:i+batch_size]
+
+        # Fetch all triples for the current batch of subjects
+        batch_triples_query = """
+            SELECT subject, predicate, object, object_is_literal
+            FROM triples
+            WHERE subject IN (SELECT value FROM json_each(?))
+        """
+        cur.execute(batch_triples_query, (json.dumps(batch_ids),))
+        batch_triples = cur.fetchall()
+
+        # Organize triples by subject for easier processing
+        triples_by_subject = defaultdict(list)
+        for row in batch_triples:
+            triples_by_subject[row[0]].append(row)
+
+        # Process each subject in the batch
+        for subject_id in batch_ids:
+            processed_count += 1
+            subject_label = labels.get(subject_id)
+
+            # Add the subject's ID and label to its searchable terms
+            terms_for_subject = {subject_id}
+            if subject_label:
+                terms_for_subject.add(subject_label)
+
+            # Add terms from its triples
+            for _, predicate, obj, is_literal in triples_by_subject[subject_id]:
+                terms_for_subject.add(predicate) # Add the predicate itself
+
+                if is_literal:
+                    terms_for_subject.add(obj) # Add literal value
+                else:
+                    # For URI objects, add the URI and its label (if found)
+                    terms_for_subject.add(obj)
+                    object_label = labels.get(obj)
+                    if object_label:
+                        terms_for_subject.add(object_label)
+
+            # Add entries to fts_data: (item_id, term)
+            for term in terms_for_subject:
+                if term: # Ensure term is not empty/None
+                    fts_data.append((subject_id, str(term)))
+
+            if processed_count % 5000 == 0: # Log less frequently for potentially larger runs
+                 print(f"    Processed {processed_count}/{len(subject_list)} subjects...")
+    return fts_data
+
+def update_fts_index(db_path, fingerprint, changed_items):
+    """
+    Incremental counterpart of create_and_populate_fts for a database brought forward
+    with owl2sqlite.py --update. `changed_items` is {item_id: label_changed} from
+    get_changed_items. item_search_fts rows are replaced only for those items and,
+    where a label changed, for the items linking to them (their rows carry the label).
+    item_autocomplete_fts is refilled as a whole since its rows must stay in item_id
+    order; that only takes a few full-table queries. Single transaction, like the
+    full build.
+    """
+    start_time = time.time()
+    print(f"Updating FTS index for {len(changed_items)} changed items...")
+    db = sqlite3.connect(db_path)
+    try:
+        db.execute("PRAGMA journal_mode=WAL;")
+        cur = db.cursor()
+        cur.execute("BEGIN IMMEDIATE;")
+        affected = set(changed_items)
+        relabeled = [item_id for item_id, label_changed in changed_items.items() if label_changed]
+        if relabeled:
+            cur.execute("SELECT DISTINCT subject FROM triples WHERE object IN (SELECT value FROM json_each(?))", (json.dumps(relabeled),))
+            affected.update(row[0] for row in cur.fetchall())
+        affected_json = json.dumps(sorted(affected))
+
+        cur.execute("DELETE FROM item_search_fts WHERE item_id IN (SELECT value FROM json_each(?))", (affected_json,))
+        cur.execute("SELECT DISTINCT subject FROM triples WHERE subject IN (SELECT value FROM json_each(?))", (affected_json,))
+        subject_list = [row[0] for row in cur.fetchall() if row[0]]
+        cur.execute("SELECT DISTINCT object FROM triples WHERE object_is_literal = 0 AND subject IN (SELECT value FROM json_each(?))", (affected_json,))
+        labels = fetch_fts_labels(cur, set(subject_list) | {row[0] for row in cur.fetchall()})
+        fts_data = get_search_fts_rows(cur, subject_list, labels)
+        cur.executemany("INSERT INTO item_search_fts (item_id, search_term) VALUES (?, ?)", fts_data)
+
+        cur.execute("DELETE FROM item_autocomplete_fts;")
+        populate_autocomplete_fts(cur)
+        write_fts_index_state(cur, fingerprint)
+        db.commit()
+        print(f" -> Replaced search rows of {len(subject_list)} items ({len(affected)} affected) in {time.time() - start_time:.2f}s.")
+    except sqlite3.Error as e:
+        print(f"!!! Database error during incremental FTS update: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def create_and_populate_fts(db_path, fingerprint=None):
     """
     Creates/Recreates an FTS5 table indexing terms associated with ALL distinct subjects.
     Indexes the subject's ID, label, and all associated predicates and objects (values or labels).
+    The rebuild, including the metadata row recording `fingerprint`, runs as a single
+    transaction so readers see either the previous index or the complete new one.
     """
     db = None
     start_time = time.time()
@@ -70,6 +447,7 @@ def create_and_populate_fts(db_path):
         # Use WAL mode for potentially better write performance during population
         db.execute("PRAGMA journal_mode=WAL;")
         cur = db.cursor()
+        cur.execute("BEGIN IMMEDIATE;")
 
         print(" -> Dropping existing FTS table (if any)...")
         cur.execute("DROP TABLE IF EXISTS item_search_fts;")
@@ -83,7 +461,26 @@ def create_and_populate_fts(db_path):
                 tokenize = 'unicode61 remove_diacritics 0'
             );
         """)
-        db.commit()
+
+        print(" -> Creating new FTS table 'item_autocomplete_fts'...")
+        # Schema: one row per (item, prefix-searchable key), where keys are the subject ID
+        # and its rdfs:label values. case_key is search_key with the case of every ASCII
+        # letter spelled out (see encode_case_key), which gives a case-sensitive index on
+        # top of the case-folding tokenizer. Display name and type indicator are
+        # precomputed so /autocomplete can answer from this table alone. prefix= keeps
+        # short prefix queries (the first keystrokes) on dedicated index entries.
+        cur.execute("DROP TABLE IF EXISTS item_autocomplete_fts;")
+        cur.execute("""
+            CREATE VIRTUAL TABLE item_autocomplete_fts USING fts5(
+                search_key,
+                case_key,
+                item_id UNINDEXED,
+                display_name UNINDEXED,
+                type_indicator UNINDEXED,
+                tokenize = 'ascii',
+                prefix = '1 2 3 4 6'
+            );
+        """)
 
         print(f" -> Finding ALL distinct subjects...")
         cur.execute(f"SELECT DISTINCT subject FROM triples")
@@ -93,12 +490,11 @@ def create_and_populate_fts(db_path):
 
         if not all_subject_ids:
             print(" -> No subjects found. FTS table will be empty.")
+            write_fts_index_state(cur, fingerprint)
+            db.commit()
             return
 
         print(" -> Preparing data for FTS insertion...")
-        fts_data = []
-        processed_count = 0
-        batch_size = 10000 # Process subjects in batches
         subject_list = list(all_subject_ids)
 
         # Pre-fetch all labels to avoid repeated queries inside the loop
@@ -110,86 +506,30 @@ def create_and_populate_fts(db_path):
         potential_object_uris = {row['object'] for row in potential_object_uris_rows if row['object']}
         all_ids_to_label.update(potential_object_uris)
 
-        labels = {}
+        labels = fetch_fts_labels(cur, all_ids_to_label)
         if all_ids_to_label:
-            label_list = list(all_ids_to_label)
-            label_batch_size = 900 # SQLite variable limit is often 999
-            for i in range(0, len(label_list), label_batch_size):
-                 batch_label_ids = label_list[i:i+label_batch_size]
-                 placeholders = ','.join('?' * len(batch_label_ids))
-                 label_query = f"SELECT subject, object FROM triples WHERE predicate = ? AND subject IN ({placeholders})"
-                 cur.execute(label_query, (RDFS_LABEL, *batch_label_ids))
-                 label_results = cur.fetchall()
-                 for row in label_results:
-                     labels[row['subject']] = row['object']
             print(f"    Fetched {len(labels)} labels.")
         else:
             print("    No IDs found needing labels.")
 
 
         print(" -> Processing subjects and their triples for FTS...")
-        for i in range(0, len(subject_list), batch_size):
-            batch_ids = subject_list[i:i+batch_size]
-            placeholders = ','.join('?' * len(batch_ids))
-
-            # Fetch all triples for the current batch of subjects
-            batch_triples_query = f"""
-                SELECT subject, predicate, object, object_is_literal
-                FROM triples
-                WHERE subject IN ({placeholders})
-            """
-            cur.execute(batch_triples_query, batch_ids)
-            batch_triples = cur.fetchall()
-
-            # Organize triples by subject for easier processing
-            triples_by_subject = defaultdict(list)
-            for row in batch_triples:
-                triples_by_subject[row['subject']].append(row)
-
-            # Process each subject in the batch
-            for subject_id in batch_ids:
-                processed_count += 1
-                subject_label = labels.get(subject_id)
-
-                # Add the subject's ID and label to its searchable terms
-                terms_for_subject = {subject_id}
-                if subject_label:
-                    terms_for_subject.add(subject_label)
-
-                # Add terms from its triples
-                for triple in triples_by_subject[subject_id]:
-                    predicate = triple['predicate']
-                    obj = triple['object']
-                    is_literal = triple['object_is_literal']
-
-                    terms_for_subject.add(predicate) # Add the predicate itself
-
-                    if is_literal:
-                        terms_for_subject.add(obj) # Add literal value
-                    else:
-                        # For URI objects, add the URI and its label (if found)
-                        terms_for_subject.add(obj)
-                        object_label = labels.get(obj)
-                        if object_label:
-                            terms_for_subject.add(object_label)
-
-                # Add entries to fts_data: (item_id, term)
-                for term in terms_for_subject:
-                    if term: # Ensure term is not empty/None
-                        fts_data.append((subject_id, str(term)))
-
-                if processed_count % 5000 == 0: # Log less frequently for potentially larger runs
-                     print(f"    Processed {processed_count}/{len(subject_list)} subjects...")
+        fts_data = get_search_fts_rows(cur, subject_list, labels)
 
         print(f" -> Inserting {len(fts_data)} entries into FTS table...")
         # Use executemany for bulk insertion
         cur.executemany("INSERT INTO item_search_fts (item_id, search_term) VALUES (?, ?)", fts_data)
+
+        print(" -> Populating autocomplete FTS table...")
+        populate_autocomplete_fts(cur)
+        write_fts_index_state(cur, fingerprint)
         db.commit()
         print(" -> FTS insertion complete.")
 
         # Optional: Optimize the FTS index
         print(" -> Optimizing FTS index...")
         cur.execute("INSERT INTO item_search_fts(item_search_fts) VALUES('optimize');")
+        cur.execute("INSERT INTO item_autocomplete_fts(item_autocomplete_fts) VALUES('optimize');")
         db.commit()
         print(" -> FTS index optimized.")
 
@@ -211,35 +551,1402 @@ def create_and_populate_fts(db_path):
         end_time = time.time()
         print(f"FTS population finished in {end_time - start_time:.2f} seconds.")
 
+class PackedStrings:
+    """
+    Immutable sequence of strings stored as one UTF-8 buffer and an array of offsets.
+    However many strings it holds, it is three objects, so reading an entry (which
+    decodes a new str) never writes to the refcount of a long-lived object. With
+    hashed=True it also keeps an open-addressing table of positions by hash(), for
+    find(). str hashes are per process, which is fine for a structure that is only
+    ever shared with forked children.
+    """
+
+    def __init__(self, strings, hashed=False):
+        parts = []
+        self.offsets = array('I', [0])
+        for value in strings:
+            encoded = value.encode('utf-8')
+            parts.append(encoded)
+            self.offsets.append(self.offsets[-1] + len(encoded))
+        self.buffer = b''.join(parts)
+        self.slots = None
+        if hashed:
+            capacity = 1 << max(3, (2 * len(self)).bit_length()) # At most half full
+            self.slots = array('i', [-1]) * capacity
+            for position in range(len(self)):
+                slot = hash(self[position]) & (capacity - 1)
+                while self.slots[slot] >= 0:
+                    slot = (slot + 1) & (capacity - 1)
+                self.slots[slot] = position
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        offsets = self.offsets
+        return self.buffer[offsets[position]:offsets[position + 1]].decode('utf-8')
+
+    def find(self, value):
+        """Position of `value`, or -1 (needs hashed=True)."""
+        slots = self.slots
+        mask = len(slots) - 1
+        slot = hash(value) & mask
+        while True:
+            position = slots[slot]
+            if position < 0 or self[position] == value:
+                return position
+            slot = (slot + 1) & mask
+
+    def nbytes(self):
+        slots_bytes = self.slots.itemsize * len(self.slots) if self.slots is not None else 0
+        return len(self.buffer) + self.offsets.itemsize * len(self.offsets) + slots_bytes
+
+def build_autocomplete_index(entries, fingerprint=None):
+    """
+    Builds the in-process autocomplete index from get_autocomplete_entries() output
+    of the database build `fingerprint`.
+
+    Items are stored in item_id order, so an item's position doubles as its sort key.
+    Every search key (ID or label) appears twice: in `case_keys` as-is and in
+    `folded_keys` lowercased, each sorted with a parallel array of item positions, so
+    a prefix maps to a contiguous bisect range in either array. The strings are kept
+    in PackedStrings rather than lists, so workers forked after the index was built
+    (see gunicorn.conf.py) search it without copying its pages. The result cache is
+    per worker and guarded by its own lock, since gthread workers share the index.
+    """
+    item_ids, display_names, type_indicators = [], [], []
+    case_pairs, folded_pairs = [], []
+    for position, (item_id, search_keys, display_name, type_indicator) in enumerate(entries):
+        item_ids.append(item_id)
+        display_names.append(display_name)
+        type_indicators.append(sys.intern(type_indicator))
+        for key in search_keys:
+            folded = key.lower()
+            case_pairs.append((key, position))
+            # Share the string object when lowercasing is a no-op (most IDs)
+            folded_pairs.append((key if folded == key else folded, position))
+    case_pairs.sort()
+    folded_pairs.sort()
+    index = {
+        'item_ids': PackedStrings(item_ids),
+        'display_names': PackedStrings(display_names),
+        'type_indicators': type_indicators,
+        'case_keys': PackedStrings(key for key, _ in case_pairs),
+        'case_key_items': array('I', (position for _, position in case_pairs)),
+        'folded_keys': PackedStrings(key for key, _ in folded_pairs),
+        'folded_key_items': array('I', (position for _, position in folded_pairs)),
+        'result_cache': OrderedDict(), # (term, limit) -> [item position, ...]
+        'result_cache_lock': threading.Lock(),
+        'fingerprint': fingerprint,
+    }
+    return index
+
+def get_autocomplete_index_stats(index):
+    """Approximate memory held by the index (buffer and array sizes, shared type strings counted once)."""
+    type_indicators = index['type_indicators']
+    component_bytes = {
+        'item_ids': index['item_ids'].nbytes(),
+        'display_names': index['display_names'].nbytes(),
+        'type_indicators': sys.getsizeof(type_indicators) + sum(sys.getsizeof(value) for value in set(type_indicators)),
+        'case_keys': index['case_keys'].nbytes() + sys.getsizeof(index['case_key_items']),
+        'folded_keys': index['folded_keys'].nbytes() + sys.getsizeof(index['folded_key_items']),
+    }
+    total_bytes = sum(component_bytes.values())
+    return {
+        'fingerprint': index['fingerprint'],
+        'items': len(index['item_ids']),
+        'keys': len(index['case_keys']),
+        'component_bytes': component_bytes,
+        'total_mb': round(total_bytes / (1024 * 1024), 2),
+    }
+
+def load_autocomplete_index(db_path, budget_mb, fingerprint=None):
+    """
+    Loads the in-memory autocomplete index for this worker and reports its size.
+    Returns None (so callers fall back to the SQLite-backed paths) if the index is
+    larger than `budget_mb` or cannot be built. Without a fingerprint, it is taken
+    in the same read transaction as the entries, like load_graph_snapshot.
+    """
+    start_time = time.time()
+    db = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        db.execute("BEGIN")
+        index = build_autocomplete_index(get_autocomplete_entries(db), fingerprint or get_db_fingerprint(db))
+    finally:
+        db.close()
+    stats = get_autocomplete_index_stats(index)
+    logging.info(f"Autocomplete index: {stats['items']} items, {stats['keys']} keys, "
+                 f"~{stats['total_mb']} MB of {budget_mb} MB budget, built in {time.time() - start_time:.2f}s "
+                 f"({', '.join(f'{k}={v // 1024} KiB' for k, v in stats['component_bytes'].items())})")
+    if stats['total_mb'] > budget_mb:
+        logging.warning("Autocomplete index exceeds its memory budget; falling back to the SQLite-backed autocomplete.")
+        return None
+    return index
+
+class LabelCache:
+    """
+    Process-wide LRU cache of resolve_entities() records ({'exists', 'label',
+    'primary_type'} per ID), shared by every request a worker serves.
+
+    Entries belong to one database fingerprint: the first lookup made with a
+    different fingerprint empties the cache, so loading a new ontology build
+    invalidates it without a restart.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.fingerprint = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def _check_fingerprint(self, fingerprint):
+        if fingerprint != self.fingerprint:
+            self.entries.clear()
+            self.fingerprint = fingerprint
+
+    def get_many(self, item_ids, fingerprint):
+        """Returns {item_id: record} for the cached subset of item_ids."""
+        found = {}
+        with self.lock:
+            self._check_fingerprint(fingerprint)
+            for item_id in item_ids:
+                record = self.entries.get(item_id)
+                if record is None:
+                    self.misses += 1
+                else:
+                    self.entries.move_to_end(item_id)
+                    found[item_id] = record
+                    self.hits += 1
+        return found
+
+    def put_many(self, records, fingerprint):
+        with self.lock:
+            self._check_fingerprint(fingerprint)
+            for item_id, record in records.items():
+                self.entries[item_id] = record
+                self.entries.move_to_end(item_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def rebase(self, old_fingerprint, new_fingerprint, changed_ids):
+        """
+        Carries the cache over from one build to the next when only `changed_ids` differ
+        between them (see get_changed_items), instead of starting empty.
+        """
+        with self.lock:
+            if self.fingerprint != old_fingerprint:
+                return
+            for item_id in changed_ids:
+                self.entries.pop(item_id, None)
+            self.fingerprint = new_fingerprint
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'fingerprint': self.fingerprint,
+            }
+
+def warm_label_cache(cache, db_path, fingerprint):
+    """
+    Preloads `cache` with a record for every subject (up to its capacity), using
+    three full scans instead of one lookup per ID.
+    """
+    start_time = time.time()
+    db = sqlite3.connect(db_path)
+    try:
+        labels, primary_types = {}, {}
+        for subject, label in db.execute("SELECT subject, object FROM triples WHERE predicate = ? ORDER BY rowid", (RDFS_LABEL,)):
+            labels.setdefault(subject, label)
+        for subject, type_id in db.execute("SELECT subject, object FROM triples WHERE predicate = ? ORDER BY rowid", (RDF_TYPE,)):
+            primary_types.setdefault(subject, type_id)
+        records = {}
+        for (subject,) in db.execute("SELECT DISTINCT subject FROM triples"):
+            records[subject] = {'exists': True, 'label': labels.get(subject, subject), 'primary_type': primary_types.get(subject)}
+            if len(records) >= cache.max_entries:
+                break
+    finally:
+        db.close()
+    cache.put_many(records, fingerprint)
+    logging.info(f"Label cache warmed with {len(records)} entries in {time.time() - start_time:.2f}s.")
+
+class GraphSnapshot:
+    """
+    Read-only snapshot of the graph the pages walk, for one database fingerprint.
+
+    Nodes (every subject, and every object of a SNAPSHOT_LINK_PREDICATES triple)
+    get integer ids in sorted ID order. Each link predicate is held as CSR
+    adjacency in both directions: the objects of node i are
+    targets[offsets[i]:offsets[i + 1]] of links[predicate], its subjects the same
+    slice of reverse_links[predicate], each in triple order. Per node there are
+    also its first label and flags: whether it is a subject at all and the roles
+    linking to it gives it (SNAPSHOT_ROLE_FLAGS). Multi-hop questions, such as the
+    databases a PanGene's OriginalGenes come from, are then walks over these
+    arrays (see hop()) instead of self-joins.
+
+    All per-node data lives in arrays and PackedStrings, never in per-node Python
+    objects, so when gunicorn builds it before forking (PANRES_PRELOAD, see
+    gunicorn.conf.py) the workers keep sharing its pages: nothing they do to it
+    changes a refcount or a GC header inside them.
+    """
+
+    def __init__(self, db_conn, fingerprint):
+        start_time = time.time()
+        self.fingerprint = fingerprint
+        subjects = {subject for (subject,) in db_conn.execute("SELECT DISTINCT subject FROM triples")}
+        objects = {object_value for (object_value,) in db_conn.execute(
+            f"SELECT DISTINCT object FROM triples WHERE predicate IN ({', '.join('?' * len(SNAPSHOT_LINK_PREDICATES))})",
+            SNAPSHOT_LINK_PREDICATES)}
+        node_ids = sorted(subjects | objects)
+        positions = {node_id: position for position, node_id in enumerate(node_ids)}
+        self.nodes = PackedStrings(node_ids, hashed=True)
+        node_count = len(node_ids)
+        del node_ids, objects
+
+        self.flags = array('B', bytes(node_count))
+        for subject in subjects:
+            self.flags[positions[subject]] |= SNAPSHOT_IS_SUBJECT
+        del subjects
+        labels = [''] * node_count
+        for subject, label in db_conn.execute("SELECT subject, object FROM triples WHERE predicate = ? ORDER BY rowid", (RDFS_LABEL,)):
+            position = positions[subject]
+            if not self.flags[position] & SNAPSHOT_HAS_LABEL:
+                labels[position] = label
+                self.flags[position] |= SNAPSHOT_HAS_LABEL
+        self.labels = PackedStrings(labels)
+        del labels
+
+        self.links, self.reverse_links = {}, {} # {predicate: (offsets, targets)}
+        for predicate in SNAPSHOT_LINK_PREDICATES:
+            edges = [(positions[subject], positions[object_value]) for subject, object_value in
+                     db_conn.execute("SELECT subject, object FROM triples WHERE predicate = ? ORDER BY rowid", (predicate,))]
+            self.links[predicate] = self._adjacency(edges, node_count)
+            self.reverse_links[predicate] = self._adjacency([(target, source) for source, target in edges], node_count)
+            role_flag = SNAPSHOT_ROLE_FLAGS.get(predicate)
+            if role_flag:
+                for _, target in edges:
+                    self.flags[target] |= role_flag
+        self.build_seconds = time.time() - start_time
+
+    @staticmethod
+    def _adjacency(edges, node_count):
+        """(offsets, targets) arrays for (source, target) pairs given in triple order."""
+        edges.sort(key=lambda edge: edge[0]) # Stable: triple order within a source
+        offsets = array('I', [0]) * (node_count + 1)
+        for source, _ in edges:
+            offsets[source + 1] += 1
+        for position in range(node_count):
+            offsets[position + 1] += offsets[position]
+        return offsets, array('I', (target for _, target in edges))
+
+    def position(self, item_id):
+        """Integer id of item_id, or -1 if it is not a node."""
+        return self.nodes.find(item_id)
+
+    def hop(self, positions, predicate, reverse=False):
+        """
+        Integer ids one `predicate` link away from any of `positions`, from subject
+        to object (or object to subject with reverse=True), without duplicates and in
+        the order reached.
+        """
+        offsets, targets = (self.reverse_links if reverse else self.links)[predicate]
+        reached = {}
+        for position in positions:
+            if position >= 0:
+                reached.update(dict.fromkeys(targets[offsets[position]:offsets[position + 1]]))
+        return list(reached)
+
+    def of_type(self, positions, type_id):
+        """The subset of `positions` that have rdf:type type_id."""
+        type_position = self.nodes.find(type_id)
+        offsets, targets = self.links[RDF_TYPE]
+        return [position for position in positions if type_position in targets[offsets[position]:offsets[position + 1]]]
+
+    def _name_cache(self):
+        """Function from integer id to ID that decodes each id once, for answers naming a node many times."""
+        names = {}
+        def name(position):
+            if position not in names:
+                names[position] = self.nodes[position]
+            return names[position]
+        return name
+
+    def resolve(self, item_ids):
+        """Same records as fetch_entities(): {item_id: {'exists', 'label', 'primary_type'}}."""
+        offsets, targets = self.links[RDF_TYPE]
+        resolved = {}
+        for item_id in item_ids:
+            position = self.nodes.find(item_id)
+            flags = self.flags[position] if position >= 0 else 0
+            has_type = position >= 0 and offsets[position] < offsets[position + 1]
+            resolved[item_id] = {
+                'exists': bool(flags & SNAPSHOT_IS_SUBJECT),
+                'label': self.labels[position] if flags & SNAPSHOT_HAS_LABEL else item_id,
+                'primary_type': self.nodes[targets[offsets[position]]] if has_type else None,
+            }
+        return resolved
+
+    def label(self, item_id):
+        position = self.nodes.find(item_id)
+        return self.labels[position] if position >= 0 and self.flags[position] & SNAPSHOT_HAS_LABEL else item_id
+
+    def has_role(self, item_id, predicate):
+        """True if some triple links to item_id with `predicate` (one of SNAPSHOT_ROLE_FLAGS)."""
+        position = self.nodes.find(item_id)
+        return position >= 0 and bool(self.flags[position] & SNAPSHOT_ROLE_FLAGS[predicate])
+
+    def linked(self, item_id, predicate):
+        """Objects of item_id's `predicate` triples (one of SNAPSHOT_LINK_PREDICATES), in triple order."""
+        position = self.nodes.find(item_id)
+        if position < 0:
+            return []
+        offsets, targets = self.links[predicate]
+        return [self.nodes[target] for target in targets[offsets[position]:offsets[position + 1]]]
+
+    def pangene_databases(self, pangen_id):
+        """Source databases of the OriginalGenes a PanGene is the same as."""
+        originals = self.of_type(self.hop([self.nodes.find(pangen_id)], 'same_as'), 'OriginalGene')
+        return [self.nodes[position] for position in self.hop(originals, IS_FROM_DATABASE)]
+
+    def database_gene_classes(self, database_id):
+        """{OriginalGene ID: [resistance class ID, ...]} for the OriginalGenes from a source database, by ID."""
+        type_offsets, types = self.links[RDF_TYPE]
+        class_offsets, classes = self.links[HAS_RESISTANCE_CLASS]
+        original_type = self.nodes.find('OriginalGene')
+        name = self._name_cache()
+        gene_classes = {}
+        for gene in sorted(self.hop([self.nodes.find(database_id)], IS_FROM_DATABASE, reverse=True)):
+            if original_type in types[type_offsets[gene]:type_offsets[gene + 1]]:
+                gene_classes[name(gene)] = [name(class_position) for class_position in
+                                            dict.fromkeys(classes[class_offsets[gene]:class_offsets[gene + 1]])]
+        return gene_classes
+
+    def class_pangenes_by_database(self, class_id):
+        """{database ID: [PanGene ID, ...]} for the PanGenes of a resistance class, by the databases of their OriginalGenes."""
+        type_offsets, types = self.links[RDF_TYPE]
+        same_as_offsets, same_as = self.links['same_as']
+        database_offsets, databases = self.links[IS_FROM_DATABASE]
+        pangene_type, original_type = self.nodes.find('PanGene'), self.nodes.find('OriginalGene')
+        name = self._name_cache()
+        grouped = defaultdict(list)
+        for pangene in self.hop([self.nodes.find(class_id)], HAS_RESISTANCE_CLASS, reverse=True):
+            if pangene_type not in types[type_offsets[pangene]:type_offsets[pangene + 1]]:
+                continue
+            pangene_databases = {}
+            for original in same_as[same_as_offsets[pangene]:same_as_offsets[pangene + 1]]:
+                if original_type in types[type_offsets[original]:type_offsets[original + 1]]:
+                    pangene_databases.update(dict.fromkeys(databases[database_offsets[original]:database_offsets[original + 1]]))
+            for database in pangene_databases:
+                grouped[name(database)].append(name(pangene))
+        return dict(grouped)
+
+    def stats(self):
+        link_bytes = sum(offsets.itemsize * len(offsets) + targets.itemsize * len(targets)
+                         for adjacency in (self.links, self.reverse_links) for offsets, targets in adjacency.values())
+        component_bytes = {
+            'nodes': self.nodes.nbytes(),
+            'labels': self.labels.nbytes(),
+            'flags': len(self.flags),
+            'links': link_bytes,
+        }
+        return {
+            'fingerprint': self.fingerprint,
+            'nodes': len(self.nodes),
+            'links': {predicate: len(targets) for predicate, (_, targets) in self.links.items()},
+            'component_bytes': component_bytes,
+            'total_mb': round(sum(component_bytes.values()) / (1024 * 1024), 2),
+            'build_seconds': round(self.build_seconds, 2),
+        }
+
+def load_graph_snapshot(db_path, fingerprint=None):
+    """
+    Builds the graph snapshot of the database at db_path. Without a fingerprint, it
+    is taken in the same read transaction as the snapshot, so the two always agree.
+    """
+    db = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        db.execute("BEGIN")
+        snapshot = GraphSnapshot(db, fingerprint or get_db_fingerprint(db))
+    finally:
+        db.close()
+    stats = snapshot.stats()
+    logging.info(f"Graph snapshot: {stats['nodes']} nodes, {sum(stats['links'].values())} links, "
+                 f"~{stats['total_mb']} MB, built in {stats['build_seconds']:.2f}s "
+                 f"({', '.join(f'{k}={v // 1024} KiB' for k, v in stats['component_bytes'].items())})")
+    return snapshot
+
+class PageCache:
+    """
+    Cache of rendered pages, keyed by their ETag (see get_page_etag), which already
+    covers the route, its arguments, the database fingerprint and the code, so a new
+    build or deployment simply stops hitting the old entries. Each entry holds the
+    page as rendered and any Content-Encoding variants of it (see compress_body),
+    so a hit does no compression work either.
+
+    The memory tier is a per-worker LRU holding at most `max_bytes` of page bodies.
+    With `disk_dir` set, pages are also written there, shared by every worker and
+    kept across restarts; a memory miss that finds the page on disk promotes it.
+    The disk tier is trimmed back to `disk_max_bytes`, least recently used first
+    (by file mtime, touched on every disk hit), once this worker has written a
+    tenth of that budget since it last trimmed.
+    """
+
+    def __init__(self, max_bytes, disk_dir=None, disk_max_bytes=0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.entries = OrderedDict() # {key: {encoding or None: body}}
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self.disk_bytes_since_trim = 0
+        self.endpoint_stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+        self.lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key, encoding=None):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.{encoding}" if encoding else key)
+
+    def _put_memory(self, key, body, encoding):
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            variants = self.entries.pop(key, {})
+            previous = variants.get(encoding)
+            if previous is not None:
+                self.bytes -= len(previous)
+            variants[encoding] = body
+            self.entries[key] = variants
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= sum(len(variant) for variant in evicted.values())
+                self.evictions += 1
+
+    def _read_disk(self, key, encoding):
+        path = self._disk_path(key, encoding)
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        self._put_memory(key, body, encoding)
+        return body
+
+    def get(self, key, endpoint, encoding=None):
+        """
+        Returns (body, body_encoding) for `key`, preferring the variant in `encoding`
+        and falling back to the page as rendered (body_encoding None), or (None, None).
+        """
+        preferred = (encoding, None) if encoding else (None,)
+        with self.lock:
+            variants = self.entries.get(key)
+            if variants is not None:
+                self.entries.move_to_end(key)
+                for candidate in preferred:
+                    if candidate in variants:
+                        self.hits += 1
+                        self.endpoint_stats[endpoint]['hits'] += 1
+                        return variants[candidate], candidate
+        if self.disk_dir:
+            for candidate in preferred:
+                body = self._read_disk(key, candidate)
+                if body is not None:
+                    with self.lock:
+                        self.disk_hits += 1
+                        self.endpoint_stats[endpoint]['hits'] += 1
+                    return body, candidate
+        with self.lock:
+            self.misses += 1
+            self.endpoint_stats[endpoint]['misses'] += 1
+        return None, None
+
+    def put(self, key, body, encoding=None):
+        self._put_memory(key, body, encoding)
+        if not self.disk_dir or len(body) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key, encoding)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, 'wb') as f:
+                f.write(body)
+            os.replace(temp_path, path) # Atomic, so other workers never read a partial page
+        except OSError as e:
+            logging.warning(f"Page cache: could not write {path}: {e}")
+            return
+        with self.lock:
+            self.disk_bytes_since_trim += len(body)
+            trim = self.disk_bytes_since_trim * 10 >= self.disk_max_bytes
+            if trim:
+                self.disk_bytes_since_trim = 0
+        if trim:
+            self.trim_disk()
+
+    def trim_disk(self):
+        """Deletes the least recently used pages on disk until they fit in disk_max_bytes."""
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue # Removed by another worker meanwhile
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        files.sort()
+        removed = 0
+        for _, size, path in files:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+            total -= size
+        with self.lock:
+            self.disk_evictions += removed
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+                'disk_dir': self.disk_dir,
+                'disk_max_bytes': self.disk_max_bytes if self.disk_dir else None,
+                'disk_evictions': self.disk_evictions,
+                'endpoints': {endpoint: dict(counts) for endpoint, counts in self.endpoint_stats.items()},
+            }
+
+def normalize_sql(sql):
+    """Folds literals, IN lists and whitespace, so the same query with other values has one shape."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", '?', sql)
+    sql = re.sub(r"\s+", ' ', sql).strip()
+    return re.sub(r"\?(?:\s*,\s*\?)+", '?', sql)
+
+def start_query_entry(sql, parameters):
+    """Appends a [sql, ms, rows, parameters] entry to the current request's g.query_stats, if it is being timed."""
+    if not has_app_context():
+        return None
+    stats = g.get('query_stats')
+    if stats is None:
+        return None
+    entry = [sql, 0.0, 0, parameters]
+    stats.append(entry)
+    return entry
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that charges the time spent executing its statement and fetching the
+    rows to the statement's entry in g.query_stats (see start_request_timing).
+    Outside a timed request it behaves exactly like sqlite3.Cursor.
+    """
+    entry = None
+
+    def execute(self, sql, parameters=()):
+        self.entry = start_query_entry(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._charge(start, 0)
+
+    def _charge(self, start, rows):
+        if self.entry is not None:
+            self.entry[1] += (time.perf_counter() - start) * 1000
+            self.entry[2] += rows
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._charge(start, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._charge(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._charge(start, len(rows))
+        return rows
+
+    def __iter__(self):
+        if self.entry is None:
+            return self
+        return self._iter_timed()
+
+    def _iter_timed(self):
+        # Rows are stepped in chunks, so timing costs a couple of calls per chunk rather than per row
+        while True:
+            rows = self.fetchmany(256)
+            if not rows:
+                return
+            yield from rows
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, including those of the execute() shortcut, are InstrumentedCursors."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+class SharedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler that several worker processes can write to: each record is
+    written (and the file rotated) under an exclusive lock on a file next to the log,
+    and a process reopens the log if another one has rotated it away.
+    """
+
+    def emit(self, record):
+        with open(self.baseFilename + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if self.stream is not None:
+                    try:
+                        rotated = os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+                    except FileNotFoundError:
+                        rotated = True
+                    if rotated:
+                        self.stream.close()
+                        self.stream = None # Reopened by the emit below
+                super().emit(record)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def create_slow_query_logger(log_file, max_bytes, backup_count):
+    """
+    The 'panres.slow_queries' logger. With a log file, records go only to that file
+    (rotated at max_bytes, keeping backup_count old files); without one they go to
+    the application log like any other warning.
+    """
+    logger = logging.getLogger('panres.slow_queries')
+    if log_file:
+        handler = SharedRotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.propagate = False
+    return logger
+
+def get_parameter_cardinality(parameters):
+    """Number of bound parameters, and the length of each that is a JSON array (an ID list for json_each)."""
+    values = list(parameters.values()) if isinstance(parameters, dict) else list(parameters or ())
+    list_lengths = []
+    for value in values:
+        if isinstance(value, str) and value.startswith('['):
+            try:
+                decoded = json.loads(value)
+            except ValueError:
+                continue
+            if isinstance(decoded, list):
+                list_lengths.append(len(decoded))
+    return {'count': len(values), 'list_lengths': list_lengths}
+
+def explain_query_plan(db_conn, sql, parameters):
+    """EXPLAIN QUERY PLAN of a statement as indented lines, one per plan step."""
+    cursor = db_conn.cursor(factory=sqlite3.Cursor) # Not an InstrumentedCursor: not part of the request's own queries
+    cursor.row_factory = None
+    depths = {0: -1}
+    lines = []
+    for step_id, parent_id, _, detail in cursor.execute("EXPLAIN QUERY PLAN " + sql, parameters):
+        depths[step_id] = depths.get(parent_id, -1) + 1
+        lines.append('  ' * depths[step_id] + detail)
+    return lines
+
+class ConnectionPool:
+    """
+    Read-only SQLite connections kept open across requests, one per thread of a
+    worker (sync workers have one thread, gthread workers one per thread), so a
+    request doesn't pay for connecting, parsing the schema and a cold page cache.
+
+    Connections are opened with the URI flag mode=ro, or immutable=1 with
+    `immutable` set, which also skips SQLite's file locking and change detection,
+    then PRAGMA query_only, mmap_size and cache_size, as InstrumentedConnections
+    so requests can time their statements. Each keeps up to
+    `cached_statements` prepared statements. A connection is reopened when the
+    database file is replaced (new inode, e.g. a fresh owl2sqlite.py build), and
+    with immutable=1 when the file changes at all, which SQLite then can't notice
+    itself. A forked child drops the connections it inherited and opens its own.
+    """
+
+    def __init__(self, db_path, mmap_bytes, cache_kib, cached_statements, immutable=False):
+        self.db_path = db_path
+        self.mmap_bytes = mmap_bytes
+        self.cache_kib = cache_kib
+        self.cached_statements = cached_statements
+        self.immutable = immutable
+        self.local = threading.local()
+        self.pid = os.getpid()
+        self.connections = {} # {thread ident: local state}, for stats
+        self.opened = 0
+        self.reopened = 0
+        self.checkouts = 0
+        self.lock = threading.Lock()
+
+    def open_connection(self):
+        """A new connection with the pool's settings, owned by the caller."""
+        flags = 'mode=ro&immutable=1' if self.immutable else 'mode=ro'
+        conn = sqlite3.connect(f"file:{quote(os.path.abspath(self.db_path))}?{flags}", uri=True,
+                               detect_types=sqlite3.PARSE_DECLTYPES, cached_statements=self.cached_statements,
+                               factory=InstrumentedConnection)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = 1")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_bytes)}")
+        conn.execute(f"PRAGMA cache_size = {-int(self.cache_kib)}") # Negative: KiB rather than pages
+        return conn
+
+    def _stamp(self):
+        stamp = get_db_file_stamp(self.db_path)
+        if self.immutable:
+            return stamp
+        # mode=ro connections follow changes made in place; only a replaced file (new inode) needs a reopen
+        return stamp[0][0] if stamp else None
+
+    def get(self):
+        """This thread's connection, opened (or reopened) if needed."""
+        pid = os.getpid()
+        if pid != self.pid:
+            with self.lock:
+                if pid != self.pid:
+                    self.pid = pid
+                    self.local = threading.local()
+                    self.connections = {}
+                    self.opened = self.reopened = self.checkouts = 0
+        state = self.local
+        stamp = self._stamp()
+        conn = getattr(state, 'conn', None)
+        if conn is not None and state.stamp != stamp:
+            conn.close()
+            conn = None
+            with self.lock:
+                self.reopened += 1
+        if conn is None:
+            state.conn = conn = self.open_connection()
+            state.stamp = stamp
+            state.opened_at = time.time()
+            state.uses = 0
+            with self.lock:
+                self.opened += 1
+                self.connections[threading.get_ident()] = state
+        state.uses += 1
+        with self.lock:
+            self.checkouts += 1
+        return conn
+
+    def release(self, conn):
+        """Called at the end of each request; the connection stays open for the next one."""
+        if conn.in_transaction:
+            conn.rollback()
+
+    def stats(self):
+        with self.lock:
+            alive = {thread.ident for thread in threading.enumerate()}
+            # Connections of threads that have exited are closed with their thread-local state
+            for ident in [ident for ident in self.connections if ident not in alive]:
+                del self.connections[ident]
+            now = time.time()
+            return {
+                'pid': self.pid,
+                'mode': 'immutable' if self.immutable else 'ro',
+                'open_connections': len(self.connections),
+                'opened': self.opened,
+                'reopened': self.reopened,
+                'checkouts': self.checkouts,
+                'reuse_ratio': round(1 - self.opened / self.checkouts, 4) if self.checkouts else None,
+                'mmap_bytes': self.mmap_bytes,
+                'cache_kib': self.cache_kib,
+                'cached_statements': self.cached_statements,
+                'connections': [{'uses': state.uses, 'age_seconds': round(now - state.opened_at, 1)}
+                                for state in self.connections.values()],
+            }
+
+def get_db_file_stamp(db_path):
+    """Cheap change detector for the database file (and its WAL, if any)."""
+    stamp = []
+    for path in (db_path, db_path + '-wal'):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        stamp.append((st.st_ino, st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+def compute_category_counts(db_conn):
+    """Item count of every INDEX_CATEGORIES entry, computed from the triples."""
+    counts = {}
+    for key, info in INDEX_CATEGORIES.items():
+        count = 0
+        if info['query_type'] == 'type':
+            query = "SELECT COUNT(DISTINCT subject) as count FROM triples WHERE predicate = ? AND object = ?"
+            result = db_conn.execute(query, (RDF_TYPE, info['value'])).fetchone()
+            count = result[0] if result else 0
+        elif info['query_type'] == 'predicate_object':
+            if 'filter_subject_type' in info:
+                query = """
+                    SELECT COUNT(DISTINCT T1.object) as count
+                    FROM triples T1
+                    JOIN triples T2 ON T1.subject = T2.subject
+                    WHERE T1.predicate = ? AND T2.predicate = ? AND T2.object = ?
+                """
+                result = db_conn.execute(query, (info['value'], RDF_TYPE, info['filter_subject_type'])).fetchone()
+            else:
+                query = "SELECT COUNT(DISTINCT object) as count FROM triples WHERE predicate = ?"
+                result = db_conn.execute(query, (info['value'],)).fetchone()
+            count = result[0] if result else 0
+        elif info['query_type'] == 'predicate_subject':
+            query = "SELECT COUNT(DISTINCT subject) as count FROM triples WHERE predicate = ?"
+            result = db_conn.execute(query, (info['value'],)).fetchone()
+            count = result[0] if result else 0
+
+        counts[key] = count
+    return counts
+
+def compute_pangen_distribution_counts(db_conn):
+    """
+    Number of PanGenes per Antibiotic Class, Predicted Phenotype and Source Database,
+    computed from the triples, as {chart: {item_id: count}} for INDEX_DISTRIBUTION_CHARTS.
+    Dict order is the order items were first seen, which decides ties when sorting.
+    """
+    distribution_counts = {chart: {} for chart in INDEX_DISTRIBUTION_CHARTS}
+
+    # Everything is joined and aggregated in SQLite from the PanGene type rows, so
+    # the SQL text stays the same size however many PanGenes there are.
+    # ORDER BY MIN(rowid) keeps the order items were first seen in.
+
+    # --- Distribution by Antibiotic Class and by Predicted Phenotype ---
+    for chart, predicate in (('class', HAS_RESISTANCE_CLASS), ('phenotype', HAS_PREDICTED_PHENOTYPE)):
+        query = """
+            SELECT T1.object, COUNT(*)
+            FROM triples P
+            JOIN triples T1 ON T1.subject = P.subject AND T1.predicate = ?
+            WHERE P.predicate = ? AND P.object = 'PanGene'
+            GROUP BY T1.object
+            ORDER BY MIN(T1.rowid)
+        """
+        distribution_counts[chart] = {row[0]: row[1] for row in db_conn.execute(query, (predicate, RDF_TYPE))}
+
+    # --- Distribution by Source Database (PanGene -same_as-> OriginalGene -is_from_database-> Database) ---
+    query = """
+        SELECT D.object, COUNT(DISTINCT S.subject)
+        FROM triples P
+        JOIN triples S ON S.subject = P.subject AND S.predicate = 'same_as'
+        JOIN triples O ON O.subject = S.object AND O.predicate = ? AND O.object = 'OriginalGene'
+        JOIN triples D ON D.subject = S.object AND D.predicate = ?
+        WHERE P.predicate = ? AND P.object = 'PanGene'
+        GROUP BY D.object
+        ORDER BY MIN(S.rowid)
+    """
+    distribution_counts['database'] = {row[0]: row[1] for row in db_conn.execute(query, (RDF_TYPE, IS_FROM_DATABASE, RDF_TYPE))}
+
+    return distribution_counts
+
+def fetch_category_item_ids(db_conn, category_key):
+    """IDs of the items of an INDEX_CATEGORIES entry, computed from the triples."""
+    category_info = INDEX_CATEGORIES.get(category_key)
+    if not category_info:
+        return []
+
+    if category_info['query_type'] == 'type':
+        query = "SELECT DISTINCT subject FROM triples WHERE predicate = ? AND object = ? ORDER BY subject"
+        results = db_conn.execute(query, (RDF_TYPE, category_info['value']))
+    elif category_info['query_type'] == 'predicate_object':
+        if 'filter_subject_type' in category_info:
+            query = """
+                SELECT DISTINCT T1.object
+                FROM triples T1
+                JOIN triples T2 ON T1.subject = T2.subject
+                WHERE T1.predicate = ? AND T2.predicate = ? AND T2.object = ?
+                ORDER BY T1.object
+            """
+            results = db_conn.execute(query, (category_info['value'], RDF_TYPE, category_info['filter_subject_type']))
+        else:
+            query = "SELECT DISTINCT object FROM triples WHERE predicate = ? ORDER BY object"
+            results = db_conn.execute(query, (category_info['value'],))
+    elif category_info['query_type'] == 'predicate_subject':
+        query = "SELECT DISTINCT subject FROM triples WHERE predicate = ? ORDER BY subject"
+        results = db_conn.execute(query, (category_info['value'],))
+    else:
+        return []
+    return [row[0] for row in results]
+
+def fetch_list_members(db_conn, kind, predicate, object_value=None):
+    """
+    IDs in one list, computed from the triples. Lists are identified by (kind, predicate, object_value):
+      'related'  - subjects with `predicate` = `object_value` (the /list/related/... pages)
+      'PanGene'  - PanGenes with `predicate` = `object_value`, or without any `predicate`
+                   if object_value is None (one group of a grouped category list)
+      'category' - the items of the INDEX_CATEGORIES entry named `predicate`
+    """
+    if kind == 'related':
+        query = "SELECT DISTINCT subject FROM triples WHERE predicate = ? AND object = ?"
+        return [row[0] for row in db_conn.execute(query, (predicate, object_value))]
+    if kind == 'PanGene' and object_value is not None:
+        query = """
+            SELECT DISTINCT T1.subject
+            FROM triples T1
+            JOIN triples T2 ON T1.subject = T2.subject
+            WHERE T1.predicate = ? AND T1.object = ?
+              AND T2.predicate = ? AND T2.object = 'PanGene'
+        """
+        return [row[0] for row in db_conn.execute(query, (predicate, object_value, RDF_TYPE))]
+    if kind == 'PanGene':
+        query = """
+            SELECT DISTINCT T2.subject FROM triples T2
+            WHERE T2.predicate = ? AND T2.object = 'PanGene'
+              AND NOT EXISTS (SELECT 1 FROM triples T1 WHERE T1.subject = T2.subject AND T1.predicate = ?)
+        """
+        return [row[0] for row in db_conn.execute(query, (RDF_TYPE, predicate))]
+    if kind == 'category':
+        return fetch_category_item_ids(db_conn, predicate)
+    raise ValueError(f"Unknown list kind '{kind}'")
+
+def fetch_list_groups(db_conn, predicate):
+    """
+    Objects of `predicate` that at least one PanGene has, i.e. the groups of a grouped
+    category list, plus None if some PanGene has no `predicate` at all.
+    """
+    query = """
+        SELECT DISTINCT T1.object
+        FROM triples T1
+        JOIN triples T2 ON T1.subject = T2.subject
+        WHERE T1.predicate = ? AND T2.predicate = ? AND T2.object = 'PanGene'
+    """
+    groups = [row[0] for row in db_conn.execute(query, (predicate, RDF_TYPE))]
+    query = """
+        SELECT 1 FROM triples T2
+        WHERE T2.predicate = ? AND T2.object = 'PanGene'
+          AND NOT EXISTS (SELECT 1 FROM triples T1 WHERE T1.subject = T2.subject AND T1.predicate = ?)
+        LIMIT 1
+    """
+    if db_conn.execute(query, (RDF_TYPE, predicate)).fetchone():
+        groups.append(None)
+    return groups
+
+def write_list_index(db_conn):
+    """
+    Materializes every list the list pages page through into list_entries, keyed
+    (list_id, label, item_id), so that any page is one primary-key range read.
+    Labels are those resolve_entities() shows: the first rdfs:label, else the ID.
+    """
+    labels = {}
+    for subject, label in db_conn.execute("SELECT subject, object FROM triples WHERE predicate = ? ORDER BY rowid", (RDFS_LABEL,)):
+        labels.setdefault(subject, label)
+
+    lists = [('category', category_key, None) for category_key in INDEX_CATEGORIES]
+    for predicate in LIST_PREDICATES:
+        lists += [('related', predicate, row[0]) for row in db_conn.execute("SELECT DISTINCT object FROM triples WHERE predicate = ?", (predicate,))]
+    for predicate in GROUPING_PREDICATES:
+        lists += [('PanGene', predicate, object_value) for object_value in fetch_list_groups(db_conn, predicate)]
+
+    db_conn.execute("DROP TABLE IF EXISTS list_entries")
+    db_conn.execute("DROP TABLE IF EXISTS list_index")
+    db_conn.execute("""
+        CREATE TABLE list_index (
+            list_id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL, -- See fetch_list_members()
+            predicate TEXT NOT NULL,
+            object TEXT,
+            item_count INTEGER NOT NULL
+        )
+    """)
+    db_conn.execute("CREATE UNIQUE INDEX idx_list_index_key ON list_index (kind, predicate, object)")
+    db_conn.execute("""
+        CREATE TABLE list_entries (
+            list_id INTEGER NOT NULL,
+            label TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            PRIMARY KEY (list_id, label, item_id)
+        ) WITHOUT ROWID
+    """)
+    entry_count = 0
+    for list_id, (kind, predicate, object_value) in enumerate(lists, start=1):
+        item_ids = fetch_list_members(db_conn, kind, predicate, object_value)
+        db_conn.execute("INSERT INTO list_index (list_id, kind, predicate, object, item_count) VALUES (?, ?, ?, ?, ?)",
+                        (list_id, kind, predicate, object_value, len(item_ids)))
+        db_conn.executemany("INSERT INTO list_entries (list_id, label, item_id) VALUES (?, ?, ?)",
+                            ((list_id, labels.get(item_id, item_id), item_id) for item_id in item_ids))
+        entry_count += len(item_ids)
+    return len(lists), entry_count
+
+def is_index_summary_current(db_conn, fingerprint):
+    try:
+        rows = db_conn.execute(f"SELECT key, value FROM {INDEX_SUMMARY_META_TABLE} WHERE key IN ('fingerprint', 'schema_version', 'categories')").fetchall()
+    except sqlite3.OperationalError:
+        return False # Never built
+    state = {row[0]: row[1] for row in rows}
+    return (state.get('fingerprint') == fingerprint
+            and state.get('schema_version') == str(INDEX_SUMMARY_SCHEMA_VERSION)
+            and state.get('categories') == json.dumps(INDEX_CATEGORIES, sort_keys=True))
+
+def write_index_summary(db_path, fingerprint):
+    """
+    Recomputes the index page aggregates and the list tables. Like the FTS build, this
+    runs as one transaction together with the metadata recording `fingerprint`. It is
+    always a full recompute, also after owl2sqlite.py --update: the counts and list
+    positions of an item depend on other items, and the whole pass is a few grouped
+    scans of triples.
+    """
+    start_time = time.time()
+    db = sqlite3.connect(db_path)
+    try:
+        cur = db.cursor()
+        cur.execute("BEGIN IMMEDIATE;")
+        category_counts = compute_category_counts(db)
+        distribution_counts = compute_pangen_distribution_counts(db)
+        list_count, entry_count = write_list_index(db)
+
+        cur.execute("CREATE TABLE IF NOT EXISTS index_category_counts (category TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS index_distribution_counts (
+                chart TEXT NOT NULL,
+                position INTEGER NOT NULL, -- Order the item was first seen in, for stable ties
+                item_id TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (chart, position)
+            ) WITHOUT ROWID
+        """)
+        cur.execute("DELETE FROM index_category_counts")
+        cur.execute("DELETE FROM index_distribution_counts")
+        cur.executemany("INSERT INTO index_category_counts (category, count) VALUES (?, ?)", category_counts.items())
+        cur.executemany("INSERT INTO index_distribution_counts (chart, position, item_id, count) VALUES (?, ?, ?, ?)",
+                        [(chart, position, item_id, count)
+                         for chart, counts in distribution_counts.items()
+                         for position, (item_id, count) in enumerate(counts.items())])
+
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {INDEX_SUMMARY_META_TABLE} (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        cur.execute(f"DELETE FROM {INDEX_SUMMARY_META_TABLE}")
+        cur.executemany(f"INSERT INTO {INDEX_SUMMARY_META_TABLE} (key, value) VALUES (?, ?)", [
+            ('fingerprint', fingerprint),
+            ('schema_version', str(INDEX_SUMMARY_SCHEMA_VERSION)),
+            ('categories', json.dumps(INDEX_CATEGORIES, sort_keys=True)),
+            ('built_at', datetime.datetime.now(datetime.timezone.utc).isoformat()),
+        ])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    logging.info(f"Summary tables rebuilt in {time.time() - start_time:.2f}s ({list_count} lists, {entry_count} list entries).")
+
+def ensure_index_summary(db_path, fingerprint, wait=True):
+    """
+    Makes sure the summary tables were computed from the build `fingerprint`,
+    recomputing them if not, under the same lock file as the FTS build. With
+    wait=False, returns False right away if another process holds the lock.
+    Returns True once the tables are current.
+    """
+    db = sqlite3.connect(db_path)
+    try:
+        if is_index_summary_current(db, fingerprint):
+            return True
+    finally:
+        db.close()
+
+    with open(db_path + FTS_LOCK_SUFFIX, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        try:
+            db = sqlite3.connect(db_path)
+            try:
+                if is_index_summary_current(db, fingerprint):
+                    return True
+            finally:
+                db.close()
+            write_index_summary(db_path, fingerprint)
+            return True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def create_metrics():
+    """
+    The Prometheus metrics /metrics exports, or None without prometheus_client. With
+    PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py), each worker writes its values
+    to files in that directory and /metrics aggregates them over all workers.
+    """
+    multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+    Counter, Gauge, Histogram = prometheus_client.Counter, prometheus_client.Gauge, prometheus_client.Histogram
+    return {
+        'request_seconds': Histogram('panres_request_duration_seconds', "Time to handle a request, by endpoint",
+                                     ['endpoint'], buckets=REQUEST_LATENCY_BUCKETS),
+        'requests': Counter('panres_requests_total', "Requests handled, by endpoint and status", ['endpoint', 'status']),
+        'sql_queries': Counter('panres_sql_queries_total', "SQL statements run while handling requests, by endpoint", ['endpoint']),
+        'sql_seconds': Histogram('panres_request_sql_duration_seconds', "SQL time per request, by endpoint",
+                                 ['endpoint'], buckets=REQUEST_LATENCY_BUCKETS),
+        'cache_hits': Counter('panres_cache_hits_total', "Lookups answered from a cache, by cache", ['cache']),
+        'cache_misses': Counter('panres_cache_misses_total', "Lookups a cache could not answer, by cache", ['cache']),
+        # One series per live worker (the collector adds a 'pid' label in multiprocess mode)
+        'build_info': Gauge('panres_build_info', "Database build and code release being served (value 1)",
+                            ['fingerprint', 'fts_ready', 'release'], multiprocess_mode='liveall'),
+        'db_file_bytes': Gauge('panres_db_file_bytes', "Size of the database file and of its WAL",
+                               ['file'], multiprocess_mode='livemostrecent'),
+    }
+
+def get_cache_counts():
+    return {
+        ('label', 'cache_hits'): label_cache.hits,
+        ('label', 'cache_misses'): label_cache.misses,
+        ('page', 'cache_hits'): page_cache.hits + page_cache.disk_hits,
+        ('page', 'cache_misses'): page_cache.misses,
+    }
+
+def sync_cache_metrics():
+    """
+    Adds what the label and page caches counted since the last call to the cache
+    counters. The label cache only counts lookups the graph snapshot did not answer.
+    """
+    with metrics_lock:
+        counts = get_cache_counts()
+        for (cache, metric), count in counts.items():
+            delta = count - metrics_state['cache_counts'].get((cache, metric), 0)
+            if delta > 0:
+                metrics[metric].labels(cache).inc(delta)
+        metrics_state['cache_counts'] = counts
+
+def reset_metrics_state():
+    """
+    Runs in every process forked after the app was imported (gunicorn's preload, see
+    gunicorn.conf.py): the worker counts from what the master had already counted, so
+    its first request is reported in full, and publishes its own panres_build_info.
+    """
+    global metrics_lock
+    metrics_lock = threading.Lock() # Another thread may have held the parent's at fork time
+    metrics_state.update(cache_counts=get_cache_counts(), build_labels=None)
+
+def update_build_metrics():
+    """
+    Flips panres_build_info to the labels of the build served now, when they changed.
+    Called per request and when get_current_db_fingerprint sees a new build.
+    """
+    labels = (db_fingerprint_state['fingerprint'] or '', str(bool(current_app.config['FTS_READY'])).lower(),
+              current_app.config['RELEASE_ID'])
+    with metrics_lock:
+        if labels == metrics_state['build_labels']:
+            return
+        if metrics_state['build_labels']:
+            metrics['build_info'].labels(*metrics_state['build_labels']).set(0)
+        metrics['build_info'].labels(*labels).set(1)
+        metrics_state['build_labels'] = labels
+
+def observe_request_metrics(timing):
+    endpoint = timing['endpoint'] or 'unmatched'
+    metrics['request_seconds'].labels(endpoint).observe(timing['total_ms'] / 1000)
+    metrics['requests'].labels(endpoint, str(timing['status'])).inc()
+    metrics['sql_queries'].labels(endpoint).inc(timing['queries'])
+    metrics['sql_seconds'].labels(endpoint).observe(timing['sql_ms'] / 1000)
+    sync_cache_metrics()
+    update_build_metrics()
+
+def get_release_id(template_folder):
+    """
+    Digest of app.py and the templates, part of every page ETag, so a deployment
+    that changes the markup doesn't get 304s for pages rendered by the old code.
+    """
+    digest = hashlib.sha1()
+    paths = [os.path.abspath(__file__)]
+    for root, _, files in os.walk(template_folder):
+        paths += [os.path.join(root, name) for name in files]
+    for path in sorted(paths):
+        digest.update(path.encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+def get_cache_control_config(endpoints):
+    """
+    Cache-Control value per endpoint: PANRES_CACHE_CONTROL for all of them, or
+    PANRES_CACHE_CONTROL_<ENDPOINT> (e.g. PANRES_CACHE_CONTROL_DETAILS) for one.
+    The default lets browsers and proxies keep pages but revalidate them with the
+    ETag on every use, which is correct straight after an --update.
+    """
+    default = os.environ.get('PANRES_CACHE_CONTROL', 'public, no-cache')
+    return {endpoint: os.environ.get(f"PANRES_CACHE_CONTROL_{endpoint.upper()}", default) for endpoint in endpoints}
+
 app = Flask(__name__)
 app.config['DATABASE'] = DATABASE
 app.config['SITE_NAME'] = SITE_NAME
 app.config['CITATION_TEXT'] = CITATION_TEXT
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'a_default_secret_key_for_development')
+# Workers that lose the race for the FTS build lock block until the index is ready by
+# default. Set PANRES_FTS_WAIT=0 to let them start serving right away without search.
+app.config['FTS_WAIT_FOR_BUILD'] = os.environ.get('PANRES_FTS_WAIT', '1') != '0'
+app.config['FTS_READY'] = False
+app.config['DB_FINGERPRINT'] = None
+# Autocomplete backend: 'memory' (in-process sorted arrays), 'fts' (item_autocomplete_fts)
+# or 'sql' (direct scans over triples). 'memory' and 'fts' degrade to the next path down
+# while their index is unavailable.
+app.config['AUTOCOMPLETE_BACKEND'] = os.environ.get('PANRES_AUTOCOMPLETE_BACKEND', 'memory')
+app.config['AUTOCOMPLETE_MEMORY_BUDGET_MB'] = float(os.environ.get('PANRES_AUTOCOMPLETE_MEMORY_BUDGET_MB', '256'))
+app.config['AUTOCOMPLETE_RESULT_CACHE_SIZE'] = int(os.environ.get('PANRES_AUTOCOMPLETE_RESULT_CACHE_SIZE', '1024'))
+# The 'memory' index is built at startup and again, in the background, for each new
+# fingerprint (see get_autocomplete_index), like the graph snapshot below
+autocomplete_index = None
+autocomplete_index_state = {'requested': None} # Fingerprint the last build was started for
+autocomplete_index_lock = threading.Lock()
+# Items per page of the list pages, and per group of the grouped ones
+app.config['LIST_PAGE_SIZE'] = int(os.environ.get('PANRES_LIST_PAGE_SIZE', '100'))
+# Cache-Control header of the pages that support conditional GET (empty value: header not set)
+app.config['CACHE_CONTROL'] = get_cache_control_config(CONDITIONAL_GET_ENDPOINTS)
+app.config['RELEASE_ID'] = get_release_id(os.path.join(app.root_path, app.template_folder))
+# Rendered-page cache (see PageCache): memory budget per worker, optional shared disk
+# tier, and the endpoints it applies to (any of CONDITIONAL_GET_ENDPOINTS)
+app.config['PAGE_CACHE_MB'] = float(os.environ.get('PANRES_PAGE_CACHE_MB', '64'))
+app.config['PAGE_CACHE_DIR'] = os.environ.get('PANRES_PAGE_CACHE_DIR') or None
+app.config['PAGE_CACHE_DISK_MB'] = float(os.environ.get('PANRES_PAGE_CACHE_DISK_MB', '1024'))
+app.config['PAGE_CACHE_ENDPOINTS'] = {name.strip() for name in os.environ.get('PANRES_PAGE_CACHE_ENDPOINTS', ','.join(CONDITIONAL_GET_ENDPOINTS)).split(',') if name.strip()}
+page_cache = PageCache(int(app.config['PAGE_CACHE_MB'] * 1024 * 1024), app.config['PAGE_CACHE_DIR'], int(app.config['PAGE_CACHE_DISK_MB'] * 1024 * 1024))
+# Read-only SQLite connections reused across requests (see ConnectionPool). PANRES_DB_POOL=0
+# opens one per request instead; PANRES_DB_IMMUTABLE=1 is for files that are never updated
+# in place while the site runs (it skips locking, and a change is only noticed per request)
+app.config['DB_POOL'] = os.environ.get('PANRES_DB_POOL', '1') != '0'
+app.config['DB_IMMUTABLE'] = os.environ.get('PANRES_DB_IMMUTABLE', '0') == '1'
+app.config['DB_MMAP_MB'] = float(os.environ.get('PANRES_DB_MMAP_MB', '256'))
+app.config['DB_CACHE_MB'] = float(os.environ.get('PANRES_DB_CACHE_MB', '32'))
+app.config['DB_CACHED_STATEMENTS'] = int(os.environ.get('PANRES_DB_CACHED_STATEMENTS', '256'))
+db_pool = ConnectionPool(DATABASE, int(app.config['DB_MMAP_MB'] * 1024 * 1024), int(app.config['DB_CACHE_MB'] * 1024),
+                         app.config['DB_CACHED_STATEMENTS'], immutable=app.config['DB_IMMUTABLE'])
+# Content-Encodings offered, in order of preference ('br' needs the brotli package and is
+# dropped without it; an empty list turns compression off), and the smallest body compressed
+app.config['COMPRESSION_ENCODINGS'] = [name.strip() for name in os.environ.get('PANRES_COMPRESSION', 'br,gzip').split(',')
+                                       if name.strip() == 'gzip' or (name.strip() == 'br' and brotli is not None)]
+app.config['COMPRESSION_MIN_BYTES'] = int(os.environ.get('PANRES_COMPRESSION_MIN_BYTES', '1024'))
+app.config['GZIP_LEVEL'] = int(os.environ.get('PANRES_GZIP_LEVEL', '6'))
+app.config['BROTLI_QUALITY'] = int(os.environ.get('PANRES_BROTLI_QUALITY', '5'))
+# Largest ID list POST /api/annotate accepts in one call
+app.config['ANNOTATE_MAX_IDS'] = int(os.environ.get('PANRES_ANNOTATE_MAX_IDS', '50000'))
+# PanGenes annotated per round trip while streaming /api/export (memory use scales with this only)
+app.config['EXPORT_BATCH_SIZE'] = int(os.environ.get('PANRES_EXPORT_BATCH_SIZE', '1000'))
+# Per-request SQL and render timing (see start_request_timing): the Server-Timing header,
+# a JSON log line per request on the 'panres.timing' logger, and with PANRES_QUERY_DEBUG=1
+# a JSON dump of every statement for requests that add ?_debug=queries
+app.config['SERVER_TIMING'] = os.environ.get('PANRES_SERVER_TIMING', '1') != '0'
+app.config['TIMING_LOG'] = os.environ.get('PANRES_TIMING_LOG', '1') != '0'
+app.config['QUERY_DEBUG'] = os.environ.get('PANRES_QUERY_DEBUG', '0') == '1'
+timing_logger = logging.getLogger('panres.timing')
+# Statements (executing plus fetching) that take PANRES_SLOW_QUERY_MS or longer are logged
+# with their query plan (see log_slow_queries); 0 turns this off. With PANRES_SLOW_QUERY_LOG
+# set they go to that file, rotated at PANRES_SLOW_QUERY_LOG_MB, not to the application log
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('PANRES_SLOW_QUERY_MS', '100'))
+app.config['SLOW_QUERY_LOG'] = os.environ.get('PANRES_SLOW_QUERY_LOG') or None
+app.config['SLOW_QUERY_LOG_MB'] = float(os.environ.get('PANRES_SLOW_QUERY_LOG_MB', '10'))
+app.config['SLOW_QUERY_LOG_BACKUPS'] = int(os.environ.get('PANRES_SLOW_QUERY_LOG_BACKUPS', '5'))
+slow_query_logger = create_slow_query_logger(app.config['SLOW_QUERY_LOG'], int(app.config['SLOW_QUERY_LOG_MB'] * 1024 * 1024),
+                                             app.config['SLOW_QUERY_LOG_BACKUPS'])
+slow_query_plans = OrderedDict() # {(fingerprint, shape): plan lines}, see log_slow_queries()
+slow_query_plans_lock = threading.Lock()
+# Prometheus metrics at /metrics (see create_metrics), when prometheus_client is installed
+app.config['METRICS'] = prometheus_client is not None and os.environ.get('PANRES_METRICS', '1') != '0'
+metrics = create_metrics() if app.config['METRICS'] else None
+# What sync_cache_metrics() and update_build_metrics() last reported, in this process
+metrics_state = {'cache_counts': {}, 'build_labels': None}
+metrics_lock = threading.Lock()
+if metrics is not None:
+    os.register_at_fork(after_in_child=reset_metrics_state)
+# Label cache (see LabelCache) for resolve_entities(). It only serves lookups while no
+# graph snapshot matches the database (PANRES_GRAPH_SNAPSHOT=0, or a rebuild in progress):
+# the snapshot answers first, so with it on the cache's hit/miss counts stay flat and the
+# warm-up is skipped
+app.config['LABEL_CACHE_SIZE'] = int(os.environ.get('PANRES_LABEL_CACHE_SIZE', '50000'))
+app.config['LABEL_CACHE_WARMUP'] = os.environ.get('PANRES_LABEL_CACHE_WARMUP', '0') == '1'
+label_cache = LabelCache(app.config['LABEL_CACHE_SIZE'])
+# Array-backed snapshot of labels, types, roles and links (see GraphSnapshot), built at startup
+# and again, in the background, for each new fingerprint the database gets (SQL is used until
+# it is ready). With gunicorn's preload (PANRES_PRELOAD=1, see gunicorn.conf.py) it is built once, in the
+# master, and shared by all workers
+app.config['GRAPH_SNAPSHOT'] = os.environ.get('PANRES_GRAPH_SNAPSHOT', '1') != '0'
+graph_snapshot = None
+# Fingerprint the last snapshot build was started for, see get_graph_snapshot()
+graph_snapshot_state = {'requested': None}
+graph_snapshot_lock = threading.Lock()
+# Last seen (file stamp, fingerprint) of the database, see get_current_db_fingerprint()
+db_fingerprint_state = {'stamp': None, 'fingerprint': None}
+db_fingerprint_lock = threading.Lock()
+# Fingerprint the summary tables are known to match, see use_index_summary()
+index_summary_state = {'fingerprint': None}
+# Fingerprint the last FTS refresh was started for, and when, see start_fts_refresh()
+fts_refresh_state = {'requested': None, 'started_at': 0.0}
+fts_refresh_lock = threading.Lock()
 
 if os.path.exists(DATABASE):
     try:
-        # Check if FTS table is empty, repopulate if needed (or always repopulate on start)
-        # For simplicity, let's always try to populate/update on startup.
-        # A more robust check would verify schema or content version.
+        # Only rebuilds when the triples fingerprint or FTS_SCHEMA_VERSION changed
         print(f"Initializing FTS index for {DATABASE}...")
-        create_and_populate_fts(DATABASE)
+        app.config['FTS_READY'], app.config['DB_FINGERPRINT'] = ensure_fts_index(DATABASE, wait=app.config['FTS_WAIT_FOR_BUILD'])
         print("FTS initialization complete.")
     except Exception as e:
         # Allow app to start but log error, search might fail
         print(f"!!! WARNING: Failed to initialize FTS index: {e}. Search may not work.")
         # raise RuntimeError(f"Failed to initialize FTS index: {e}") from e # Or raise to prevent startup
+    if app.config['AUTOCOMPLETE_BACKEND'] == 'memory':
+        try:
+            autocomplete_index_state['requested'] = app.config['DB_FINGERPRINT']
+            autocomplete_index = load_autocomplete_index(DATABASE, app.config['AUTOCOMPLETE_MEMORY_BUDGET_MB'], app.config['DB_FINGERPRINT'])
+        except Exception as e:
+            print(f"!!! WARNING: Failed to build in-memory autocomplete index: {e}. Using the SQLite-backed autocomplete.")
+    if app.config['DB_FINGERPRINT']:
+        db_fingerprint_state.update(stamp=get_db_file_stamp(DATABASE), fingerprint=app.config['DB_FINGERPRINT'])
+        try:
+            # Only recomputed when the build changed, like the FTS index
+            if ensure_index_summary(DATABASE, app.config['DB_FINGERPRINT'], wait=app.config['FTS_WAIT_FOR_BUILD']):
+                index_summary_state['fingerprint'] = app.config['DB_FINGERPRINT']
+        except Exception as e:
+            print(f"!!! WARNING: Failed to build the summary tables: {e}. Computing the index and list pages per request.")
+        if app.config['GRAPH_SNAPSHOT']:
+            try:
+                graph_snapshot = load_graph_snapshot(DATABASE, app.config['DB_FINGERPRINT'])
+                graph_snapshot_state['requested'] = graph_snapshot.fingerprint
+            except Exception as e:
+                print(f"!!! WARNING: Failed to build the graph snapshot: {e}. Resolving labels and roles with SQL.")
+        if app.config['LABEL_CACHE_WARMUP'] and graph_snapshot is None:
+            try:
+                warm_label_cache(label_cache, DATABASE, app.config['DB_FINGERPRINT'])
+            except Exception as e:
+                print(f"!!! WARNING: Failed to warm the label cache: {e}")
 else:
     raise FileNotFoundError(f"Database file '{DATABASE}' not found. Cannot initialize FTS index.")
 
 def get_db():
     if 'db' not in g:
         try:
-            g.db = sqlite3.connect(
-                current_app.config['DATABASE'],
-                detect_types=sqlite3.PARSE_DECLTYPES
-            )
-            g.db.row_factory = sqlite3.Row
+            if current_app.config['DB_POOL']:
+                g.db = db_pool.get()
+            else:
+                g.db = db_pool.open_connection()
         except sqlite3.Error as e:
             abort(500, description="Database connection failed.")
     return g.db
@@ -248,7 +1955,129 @@ def get_db():
 def close_db(error):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        if current_app.config['DB_POOL']:
+            db_pool.release(db)
+        else:
+            db.close()
+
+def is_fts_ready(db_conn=None):
+    """
+    True if the FTS index matches the database as it is now. Otherwise the metadata
+    table is re-checked (one small query) until the index catches up, which happens
+    once another process's build finishes or, after the database changed under a
+    running worker, once start_fts_refresh has brought it forward. Callers use the
+    direct path meanwhile.
+    """
+    fingerprint = get_current_db_fingerprint()
+    if current_app.config['FTS_READY'] and current_app.config['DB_FINGERPRINT'] == fingerprint:
+        return True
+    db = db_conn or get_db()
+    try:
+        ready = is_fts_index_current(db, fingerprint)
+    except sqlite3.Error:
+        ready = False
+    current_app.config['FTS_READY'], current_app.config['DB_FINGERPRINT'] = ready, fingerprint
+    if not ready and fingerprint:
+        start_fts_refresh(current_app.config['DATABASE'], fingerprint)
+    return ready
+
+def start_fts_refresh(db_path, fingerprint):
+    """
+    Brings the FTS index forward to `fingerprint` in a background thread (see
+    ensure_fts_index: incrementally after owl2sqlite.py --update, under the build
+    lock). Started once per fingerprint, and again every FTS_REFRESH_RETRY_SECONDS
+    while the index is still behind, since the attempt returns without building if
+    another process holds the lock.
+    """
+    with fts_refresh_lock:
+        if (fts_refresh_state['requested'] == fingerprint
+                and time.time() - fts_refresh_state['started_at'] < FTS_REFRESH_RETRY_SECONDS):
+            return
+        fts_refresh_state.update(requested=fingerprint, started_at=time.time())
+    threading.Thread(target=refresh_fts_index, args=(db_path,), name='fts-refresh', daemon=True).start()
+
+def refresh_fts_index(db_path):
+    try:
+        ensure_fts_index(db_path, wait=False)
+    except Exception as e:
+        logging.warning(f"Could not refresh the FTS index: {e}. Searching the triples directly meanwhile.")
+
+def get_current_db_fingerprint():
+    """
+    Fingerprint of the database as it is now, for keying caches. Only recomputed
+    when the file's inode, size or mtime changed since the last check, and at most
+    once per request. A new fingerprint also starts the FTS refresh.
+    """
+    if 'db_fingerprint' not in g:
+        stamp = get_db_file_stamp(current_app.config['DATABASE'])
+        with db_fingerprint_lock:
+            if stamp != db_fingerprint_state['stamp']:
+                previous = db_fingerprint_state['fingerprint']
+                fingerprint = get_db_fingerprint(get_db())
+                if previous and fingerprint != previous:
+                    # After owl2sqlite.py --update only the touched items need evicting
+                    changed = get_changed_items(get_db(), previous, fingerprint)
+                    if changed is not None:
+                        label_cache.rebase(previous, fingerprint, changed)
+                    start_fts_refresh(current_app.config['DATABASE'], fingerprint)
+                db_fingerprint_state.update(stamp=stamp, fingerprint=fingerprint)
+                if metrics is not None and fingerprint != previous:
+                    update_build_metrics()
+            g.db_fingerprint = db_fingerprint_state['fingerprint']
+    return g.db_fingerprint
+
+def get_graph_snapshot():
+    """
+    The graph snapshot, if it matches the database as it is now. Otherwise a new one
+    is built in a background thread, once per fingerprint, and callers use SQL until
+    it is ready. Snapshots rebuilt this way belong to the worker that built them.
+    """
+    fingerprint = get_current_db_fingerprint()
+    snapshot = graph_snapshot
+    if snapshot is not None and snapshot.fingerprint == fingerprint:
+        return snapshot
+    if current_app.config['GRAPH_SNAPSHOT'] and fingerprint:
+        with graph_snapshot_lock:
+            if graph_snapshot_state['requested'] == fingerprint:
+                return None
+            graph_snapshot_state['requested'] = fingerprint
+        threading.Thread(target=rebuild_graph_snapshot, args=(current_app.config['DATABASE'],),
+                         name='graph-snapshot', daemon=True).start()
+    return None
+
+def get_autocomplete_index():
+    """
+    The in-memory autocomplete index, if it matches the database as it is now.
+    Otherwise it is rebuilt in a background thread, once per fingerprint, and
+    autocomplete uses the FTS or direct path until it is ready.
+    """
+    fingerprint = get_current_db_fingerprint()
+    index = autocomplete_index
+    if index is not None and index['fingerprint'] == fingerprint:
+        return index
+    if current_app.config['AUTOCOMPLETE_BACKEND'] == 'memory' and fingerprint:
+        with autocomplete_index_lock:
+            if autocomplete_index_state['requested'] == fingerprint:
+                return None
+            autocomplete_index_state['requested'] = fingerprint
+        threading.Thread(target=rebuild_autocomplete_index,
+                         args=(current_app.config['DATABASE'], current_app.config['AUTOCOMPLETE_MEMORY_BUDGET_MB']),
+                         name='autocomplete-index', daemon=True).start()
+    return None
+
+def rebuild_autocomplete_index(db_path, budget_mb):
+    global autocomplete_index
+    try:
+        autocomplete_index = load_autocomplete_index(db_path, budget_mb)
+    except Exception as e:
+        logging.warning(f"Could not rebuild the in-memory autocomplete index: {e}. Using the SQLite-backed autocomplete.")
+
+def rebuild_graph_snapshot(db_path):
+    global graph_snapshot
+    try:
+        graph_snapshot = load_graph_snapshot(db_path)
+    except Exception as e:
+        logging.warning(f"Could not rebuild the graph snapshot: {e}. Resolving labels and roles with SQL.")
 
 def query_db(query, args=(), one=False, db_conn=None):
     conn_to_use = db_conn or g.get('db')
@@ -270,15 +2099,93 @@ def query_db(query, args=(), one=False, db_conn=None):
         raise
 
 def get_label(item_id, db_conn=None):
-    result = query_db("SELECT object FROM triples WHERE subject = ? AND predicate = ?", (item_id, RDFS_LABEL), one=True, db_conn=db_conn)
-    return result['object'] if result else item_id
+    return resolve_entities([item_id], db_conn=db_conn)[item_id]['label']
+
+def resolve_entities(item_ids, db_conn=None):
+    """
+    Resolves a set of IDs from the graph snapshot when one matches the database.
+    Otherwise they go through the shared label cache, querying the database in one
+    statement for whatever is not cached, however many IDs that is.
+
+    Returns {item_id: {'exists': bool, 'label': str, 'primary_type': str or None}}
+    where 'exists' means the ID is the subject of at least one triple, 'label' falls
+    back to the ID itself and 'primary_type' is the first rdf:type stored for it.
+    The IDs travel as one JSON array bound to json_each, so there is no per-ID
+    placeholder and no host-parameter limit to worry about.
+    """
+    unique_ids = list(dict.fromkeys(item_id for item_id in item_ids if item_id is not None))
+    if not unique_ids:
+        return {}
+    fingerprint = get_current_db_fingerprint()
+    snapshot = get_graph_snapshot()
+    if snapshot is not None:
+        return snapshot.resolve(unique_ids)
+    resolved = label_cache.get_many(unique_ids, fingerprint)
+    missing_ids = [item_id for item_id in unique_ids if item_id not in resolved]
+    if missing_ids:
+        fetched = fetch_entities(missing_ids, db_conn=db_conn)
+        label_cache.put_many(fetched, fingerprint)
+        resolved.update(fetched)
+    return resolved
+
+def fetch_entities(unique_ids, db_conn=None):
+    """Uncached part of resolve_entities: one query for all of unique_ids."""
+    # '+predicate' keeps the planner on the subject index: a subject has a handful of
+    # triples, whereas a predicate such as rdfs:label can have one per entity
+    query = """
+        SELECT ids.value AS id,
+               EXISTS (SELECT 1 FROM triples WHERE subject = ids.value) AS is_subject,
+               (SELECT object FROM triples WHERE subject = ids.value AND +predicate = ? ORDER BY rowid LIMIT 1) AS label,
+               (SELECT object FROM triples WHERE subject = ids.value AND +predicate = ? ORDER BY rowid LIMIT 1) AS primary_type
+        FROM json_each(?) AS ids
+    """
+    rows = query_db(query, (RDFS_LABEL, RDF_TYPE, json.dumps(unique_ids)), db_conn=db_conn or get_db())
+    return {
+        row['id']: {
+            'exists': bool(row['is_subject']),
+            'label': row['label'] if row['label'] is not None else row['id'],
+            'primary_type': row['primary_type'],
+        }
+        for row in rows
+    }
+
+def get_item_category(item_id, primary_type, db_conn=None, check_roles=True):
+    """
+    Maps an item to how the site presents it, based on its primary rdf:type or, for
+    individuals without a category type, on how other items link to it (skipped when
+    check_roles is False, e.g. because the item is already known to be a PanGene).
+    Returns (primary_type_display, primary_type_category_key, view_item_type).
+    """
+    if not primary_type:
+        return None, None, None
+    db = db_conn or get_db()
+    for cat_key, cat_info in INDEX_CATEGORIES.items():
+        if cat_info['query_type'] == 'type' and cat_info['value'] == primary_type:
+            return cat_key, cat_key, ('PanGene' if primary_type == 'PanGene' else None)
+
+    role_checks = [
+        (HAS_RESISTANCE_CLASS, "Antibiotic Class", "Antibiotic Classes", 'AntibioticClass'),
+        (HAS_PREDICTED_PHENOTYPE, "Predicted Phenotype", "Predicted Phenotypes", 'PredictedPhenotype'),
+        (IS_FROM_DATABASE, "Source Database", "Source Databases", 'SourceDatabase'),
+    ]
+    snapshot = get_graph_snapshot() if check_roles else None
+    for predicate, type_display, category_key, view_item_type in role_checks:
+        if not check_roles:
+            continue
+        if snapshot is not None:
+            has_role = snapshot.has_role(item_id, predicate)
+        else:
+            has_role = query_db("SELECT 1 FROM triples WHERE predicate = ? AND object = ? LIMIT 1", (predicate, item_id), one=True, db_conn=db)
+        if has_role:
+            return type_display, category_key, view_item_type
+    return primary_type, None, None
 
 def get_item_details(item_id):
     db = get_db()
     predicate_map = PREDICATE_MAP
     details = {
         'id': item_id,
-        'label': get_label(item_id, db_conn=db),
+        'label': item_id,
         'properties': defaultdict(list),
         'raw_properties': defaultdict(list),
         'referencing_items': [],
@@ -295,7 +2202,7 @@ def get_item_details(item_id):
 
     properties_cursor = None
     try:
-        properties_cursor = db.execute("SELECT predicate, object FROM triples WHERE subject = ?", (item_id,))
+        properties_cursor = db.execute("SELECT predicate, object FROM triples WHERE subject = ? ORDER BY rowid", (item_id,))
         for row in properties_cursor:
             predicate, obj = row['predicate'], row['object']
             details['raw_properties'][predicate].append(obj)
@@ -311,82 +2218,65 @@ def get_item_details(item_id):
         if properties_cursor:
             properties_cursor.close()
 
-    check_cur = None
-    try:
-        check_cur = db.cursor()
-        for predicate, objects in details['raw_properties'].items():
-            pred_display = predicate_map.get(predicate, predicate)
-            processed_values = []
-            for obj_val in objects:
-                check_cur.execute("SELECT 1 FROM triples WHERE subject = ? LIMIT 1", (obj_val,))
-                is_link = check_cur.fetchone() is not None
-                display_val = get_label(obj_val, db_conn=db) if is_link else obj_val
-
-                list_link_info = None
-                if is_link and predicate in [HAS_RESISTANCE_CLASS, HAS_PREDICTED_PHENOTYPE, IS_FROM_DATABASE, RDF_TYPE]:
-                     list_link_info = {
-                         'predicate_key': predicate,
-                         'predicate_display': pred_display,
-                         'object_value_encoded': quote(obj_val)
-                     }
-
-                processed_values.append({
-                    'value': obj_val,
-                    'display': display_val,
-                    'is_link': is_link,
-                    'list_link_info': list_link_info
-                })
-            details['properties'][pred_display] = sorted(processed_values, key=lambda x: x['display'])
-    finally:
-        if check_cur:
-            check_cur.close()
-
-    del details['raw_properties']
-
-    raw_referencing_items = []
+    raw_references = []
     references_cursor = None
     try:
-        references_cursor = db.execute("SELECT subject, predicate FROM triples WHERE object = ?", (item_id,))
-        for row in references_cursor:
-            raw_referencing_items.append({
-                'ref_id': row['subject'],
-                'predicate': row['predicate'],
-                'ref_label': get_label(row['subject'], db_conn=db)
-            })
+        references_cursor = db.execute("SELECT subject, predicate FROM triples WHERE object = ? ORDER BY rowid", (item_id,))
+        raw_references = [(row['subject'], row['predicate']) for row in references_cursor]
     finally:
         if references_cursor:
             references_cursor.close()
 
+    # Existence and labels for the item, every object value and every referencing item
+    # in one batched lookup instead of two queries per value
+    resolved = resolve_entities(
+        [item_id]
+        + [obj_val for objects in details['raw_properties'].values() for obj_val in objects]
+        + [ref_id for ref_id, _ in raw_references],
+        db_conn=db
+    )
+    details['label'] = resolved[item_id]['label']
+
+    for predicate, objects in details['raw_properties'].items():
+        pred_display = predicate_map.get(predicate, predicate)
+        processed_values = []
+        for obj_val in objects:
+            is_link = resolved[obj_val]['exists']
+            display_val = resolved[obj_val]['label'] if is_link else obj_val
+
+            list_link_info = None
+            if is_link and predicate in LIST_PREDICATES:
+                 list_link_info = {
+                     'predicate_key': predicate,
+                     'predicate_display': pred_display,
+                     'object_value_encoded': quote(obj_val)
+                 }
+
+            processed_values.append({
+                'value': obj_val,
+                'display': display_val,
+                'is_link': is_link,
+                'list_link_info': list_link_info
+            })
+        details['properties'][pred_display] = sorted(processed_values, key=lambda x: x['display'])
+
+    del details['raw_properties']
+
+    raw_referencing_items = [{
+        'ref_id': ref_id,
+        'predicate': predicate,
+        'ref_label': resolved[ref_id]['label']
+    } for ref_id, predicate in raw_references]
+
     raw_referencing_items.sort(key=lambda x: x['ref_label'])
 
     if details['primary_type']:
-        details['primary_type_display'] = details['primary_type']
-        for cat_key, cat_info in INDEX_CATEGORIES.items():
-            if cat_info['query_type'] == 'type' and cat_info['value'] == details['primary_type']:
-                details['primary_type_display'] = cat_key
-                details['primary_type_category_key'] = cat_key
-                if details['primary_type'] == 'PanGene':
-                     details['view_item_type'] = 'PanGene'
-                break
-
+        primary_type_display, category_key, view_item_type = get_item_category(
+            item_id, details['primary_type'], db_conn=db, check_roles=not details['view_item_type'])
+        details['primary_type_display'] = primary_type_display
+        details['primary_type_category_key'] = category_key
         if not details['view_item_type']:
-            is_class = query_db("SELECT 1 FROM triples WHERE predicate = ? AND object = ? LIMIT 1", (HAS_RESISTANCE_CLASS, item_id), one=True, db_conn=db)
-            if is_class:
-                 details['primary_type_display'] = "Antibiotic Class"
-                 details['primary_type_category_key'] = "Antibiotic Classes"
-                 details['view_item_type'] = 'AntibioticClass'
-            else:
-                 is_phenotype = query_db("SELECT 1 FROM triples WHERE predicate = ? AND object = ? LIMIT 1", (HAS_PREDICTED_PHENOTYPE, item_id), one=True, db_conn=db)
-                 if is_phenotype:
-                     details['primary_type_display'] = "Predicted Phenotype"
-                     details['primary_type_category_key'] = "Predicted Phenotypes"
-                     details['view_item_type'] = 'PredictedPhenotype'
-                 else:
-                     is_database = query_db("SELECT 1 FROM triples WHERE predicate = ? AND object = ? LIMIT 1", (IS_FROM_DATABASE, item_id), one=True, db_conn=db)
-                     if is_database:
-                         details['primary_type_display'] = "Source Database"
-                         details['primary_type_category_key'] = "Source Databases"
-                         details['view_item_type'] = 'SourceDatabase'
+            details['view_item_type'] = view_item_type
 
     if details['view_item_type'] in ['SourceDatabase', 'AntibioticClass', 'PredictedPhenotype']:
         details['properties'] = {k: v for k, v in details['properties'].items() if k not in TECHNICAL_PROPS_DISPLAY}
@@ -396,26 +2286,37 @@ def get_item_details(item_id):
         if details['view_item_type'] == 'SourceDatabase':
             details['grouping_basis'] = 'Antibiotic Class'
             grouped = defaultdict(list)
-            original_gene_query = """
-                SELECT T1.subject
-                FROM triples T1
-                JOIN triples T2 ON T1.subject = T2.subject
-                WHERE T1.predicate = ? AND T1.object = ? AND T2.predicate = ? AND T2.object = 'OriginalGene'
-            """
-            gene_results = query_db(original_gene_query, (IS_FROM_DATABASE, item_id, RDF_TYPE), db_conn=db)
-            gene_ids = [row['subject'] for row in gene_results] if gene_results else []
-
-            if gene_ids:
-                placeholders = ','.join('?' * len(gene_ids))
-                class_query = f"""
-                    SELECT subject, object FROM triples
-                    WHERE predicate = ? AND subject IN ({placeholders})
+            snapshot = get_graph_snapshot()
+            if snapshot is not None:
+                # OriginalGenes of this database and their classes, read off the adjacency arrays
+                gene_to_classes = snapshot.database_gene_classes(item_id)
+                gene_ids = list(gene_to_classes)
+            else:
+                original_gene_query = """
+                    SELECT T1.subject
+                    FROM triples T1
+                    JOIN triples T2 ON T1.subject = T2.subject
+                    WHERE T1.predicate = ? AND T1.object = ? AND T2.predicate = ? AND T2.object = 'OriginalGene'
                 """
-                class_results = query_db(class_query, (HAS_RESISTANCE_CLASS, *gene_ids), db_conn=db)
+                gene_results = query_db(original_gene_query, (IS_FROM_DATABASE, item_id, RDF_TYPE), db_conn=db)
+                gene_ids = [row['subject'] for row in gene_results] if gene_results else []
                 gene_to_classes = defaultdict(list)
-                if class_results:
-                    for row in class_results:
-                        gene_to_classes[row['subject']].append(row['object'])
+                if gene_ids:
+                    # Classes of the same OriginalGenes, joined rather than passed back in as an ID list
+                    class_query = """
+                        SELECT C.subject, C.object
+                        FROM triples T1
+                        JOIN triples T2 ON T1.subject = T2.subject
+                        JOIN triples C ON C.subject = T1.subject AND C.predicate = ?
+                        WHERE T1.predicate = ? AND T1.object = ? AND T2.predicate = ? AND T2.object = 'OriginalGene'
+                    """
+                    class_results = query_db(class_query, (HAS_RESISTANCE_CLASS, IS_FROM_DATABASE, item_id, RDF_TYPE), db_conn=db)
+                    if class_results:
+                        for row in class_results:
+                            gene_to_classes[row['subject']].append(row['object'])
+
+            if gene_ids:
+                class_labels = resolve_entities({class_id for classes in gene_to_classes.values() for class_id in classes}, db_conn=db)
 
                 gene_info_map = {item['ref_id']: item for item in raw_referencing_items}
                 for gene_id in gene_ids:
@@ -425,7 +2326,7 @@ def get_item_details(item_id):
                     classes = gene_to_classes.get(gene_id)
                     if classes:
                         for class_name in classes:
-                            class_label = get_label(class_name, db_conn=db)
+                            class_label = class_labels[class_name]['label']
                             grouped[class_label].append(gene_item)
                     else:
                         grouped['No Class Assigned'].append(gene_item)
@@ -453,189 +2354,139 @@ def get_item_details(item_id):
 
     return details
 
+def use_index_summary():
+    """
+    True if the summary tables match the database as it is now. When the database
+    changed under a running worker they are recomputed once, by whichever worker
+    gets the build lock first; the others keep computing from the triples meanwhile.
+    """
+    fingerprint = get_current_db_fingerprint()
+    if index_summary_state['fingerprint'] != fingerprint:
+        try:
+            if ensure_index_summary(current_app.config['DATABASE'], fingerprint, wait=False):
+                index_summary_state['fingerprint'] = fingerprint
+        except sqlite3.Error as e:
+            logging.warning(f"Could not refresh the summary tables: {e}")
+    return index_summary_state['fingerprint'] == fingerprint
+
 def get_category_counts():
     db = get_db()
+    if not use_index_summary():
+        return compute_category_counts(db)
     counts = {}
-    for key, info in INDEX_CATEGORIES.items():
-        count = 0
-        if info['query_type'] == 'type':
-            query = "SELECT COUNT(DISTINCT subject) as count FROM triples WHERE predicate = ? AND object = ?"
-            result = query_db(query, (RDF_TYPE, info['value']), one=True, db_conn=db)
-            count = result['count'] if result else 0
-        elif info['query_type'] == 'predicate_object':
-            if 'filter_subject_type' in info:
-                query = """
-                    SELECT COUNT(DISTINCT T1.object) as count
-                    FROM triples T1
-                    JOIN triples T2 ON T1.subject = T2.subject
-                    WHERE T1.predicate = ? AND T2.predicate = ? AND T2.object = ?
-                """
-                result = query_db(query, (info['value'], RDF_TYPE, info['filter_subject_type']), one=True, db_conn=db)
-            else:
-                query = "SELECT COUNT(DISTINCT object) as count FROM triples WHERE predicate = ?"
-                result = query_db(query, (info['value'],), one=True, db_conn=db)
-            count = result['count'] if result else 0
-        elif info['query_type'] == 'predicate_subject':
-            query = "SELECT COUNT(DISTINCT subject) as count FROM triples WHERE predicate = ?"
-            result = query_db(query, (info['value'],), one=True, db_conn=db)
-            count = result['count'] if result else 0
-
-        counts[key] = count
+    for key in INDEX_CATEGORIES:
+        row = query_db("SELECT count FROM index_category_counts WHERE category = ?", (key,), one=True, db_conn=db)
+        counts[key] = row['count'] if row else 0
     return counts
 
-def get_items_for_category(category_key):
-    db = get_db()
-    items = []
-    total_count = 0
-    category_info = INDEX_CATEGORIES.get(category_key)
-
-    if not category_info:
-        return items, total_count
-
-    if category_info['query_type'] == 'type':
-        query = "SELECT DISTINCT subject FROM triples WHERE predicate = ? AND object = ? ORDER BY subject"
-        results = query_db(query, (RDF_TYPE, category_info['value']), db_conn=db)
-        if results:
-            items = [{'id': row['subject']} for row in results]
-            total_count = len(items)
-
-    elif category_info['query_type'] == 'predicate_object':
-        if 'filter_subject_type' in category_info:
-            query = """
-                SELECT DISTINCT T1.object
-                FROM triples T1
-                JOIN triples T2 ON T1.subject = T2.subject
-                WHERE T1.predicate = ? AND T2.predicate = ? AND T2.object = ?
-                ORDER BY T1.object
-            """
-            results = query_db(query, (category_info['value'], RDF_TYPE, category_info['filter_subject_type']), db_conn=db)
-        else:
-            query = "SELECT DISTINCT object FROM triples WHERE predicate = ? ORDER BY object"
-            results = query_db(query, (category_info['value'],), db_conn=db)
-
-        if results:
-            items = [{'id': row['object']} for row in results]
-            total_count = len(items)
-
-    elif category_info['query_type'] == 'predicate_subject':
-        query = "SELECT DISTINCT subject FROM triples WHERE predicate = ? ORDER BY subject"
-        results = query_db(query, (category_info['value'],), db_conn=db)
-        if results:
-            items = [{'id': row['subject']} for row in results]
-            total_count = len(items)
-
-    return items, total_count
-
-def get_grouped_pangen_data():
-    db = get_db()
-    grouped_by_class = defaultdict(list)
-    grouped_by_phenotype = defaultdict(list)
-    all_pangen_ids = set()
-    gene_labels = {}
+def encode_list_cursor(position):
+    """Opaque URL-safe cursor for a list position: (label, item_id), or (group, label, item_id) in grouped lists."""
+    return base64.urlsafe_b64encode(json.dumps(list(position), separators=(',', ':')).encode('utf-8')).decode('ascii').rstrip('=')
 
-    pangen_query = f"""
-        SELECT T1.subject, T3.object as label
-        FROM triples T1
-        JOIN triples T2 ON T1.subject = T2.subject
-        LEFT JOIN triples T3 ON T1.subject = T3.subject AND T3.predicate = ?
-        WHERE T2.predicate = ? AND T2.object = 'PanGene'
-    """
-    pangen_cursor = None
+def decode_list_cursor(cursor, length):
+    """Inverse of encode_list_cursor(); aborts with 400 on anything that is not a cursor of `length` parts."""
+    if cursor is None:
+        return None
     try:
-        pangen_cursor = db.execute(pangen_query, (RDFS_LABEL, RDF_TYPE))
-        for row in pangen_cursor:
-            gene_id = row['subject']
-            all_pangen_ids.add(gene_id)
-            gene_labels[gene_id] = row['label'] if row['label'] else gene_id
-    finally:
-        if pangen_cursor:
-            pangen_cursor.close()
-
-    total_count = len(all_pangen_ids)
-
-    if not all_pangen_ids:
-        return {}, {}, 0
-
-    placeholders = ','.join('?' * len(all_pangen_ids))
-    pangen_list = list(all_pangen_ids)
-
-    class_query = f"""
-        SELECT subject, object
-        FROM triples
-        WHERE predicate = ? AND subject IN ({placeholders})
-    """
-    class_results = query_db(class_query, (HAS_RESISTANCE_CLASS, *pangen_list), db_conn=db)
-    pangen_to_class = defaultdict(list)
-    if class_results:
-        for row in class_results:
-            pangen_to_class[row['subject']].append(row['object'])
-
-    phenotype_query = f"""
-        SELECT subject, object
-        FROM triples
-        WHERE predicate = ? AND subject IN ({placeholders})
-    """
-    phenotype_results = query_db(phenotype_query, (HAS_PREDICTED_PHENOTYPE, *pangen_list), db_conn=db)
-    pangen_to_phenotype = defaultdict(list)
-    if phenotype_results:
-        for row in phenotype_results:
-            pangen_to_phenotype[row['subject']].append(row['object'])
-
-    for gene_id in all_pangen_ids:
-        gene_display_name = gene_labels[gene_id]
-        gene_entry = (gene_id, gene_display_name)
-
-        classes = pangen_to_class.get(gene_id)
-        if classes:
-            for class_id in classes:
-                class_label = get_label(class_id, db_conn=db)
-                grouped_by_class[class_label].append(gene_entry)
+        position = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        abort(400, description="Invalid page cursor.")
+    if not isinstance(position, list) or len(position) != length or not all(isinstance(part, str) or part is None for part in position[:-2]) \
+            or not all(isinstance(part, str) for part in position[-2:]):
+        abort(400, description="Invalid page cursor.")
+    return tuple(position)
+
+def get_list_page(kind, predicate, object_value=None, after=None, before=None):
+    """
+    One page of a list (see fetch_list_members), ordered by (label, item_id) and read
+    with keyset pagination: `after`/`before` are (label, item_id) positions taken from
+    the neighbouring page. Returns {'entries': [(label, item_id), ...], 'total': N,
+    'prev': position or None, 'next': position or None}.
+
+    From list_entries every page is one primary-key range read of LIST_PAGE_SIZE + 1
+    rows, so page N costs what page 1 does. Lists that are not materialized (related
+    lists of other predicates, or while the summary tables are being rebuilt) are
+    computed and sorted per request instead.
+    """
+    db = get_db()
+    page_size = current_app.config['LIST_PAGE_SIZE']
+    stored = None
+    if use_index_summary():
+        stored = query_db("SELECT list_id, item_count FROM list_index WHERE kind = ? AND predicate = ? AND object IS ?",
+                          (kind, predicate, object_value), one=True, db_conn=db)
+
+    # Up to page_size + 1 entries in paging direction (descending for `before`); the extra one tells whether there is more
+    if stored:
+        total = stored['item_count']
+        if before:
+            query = "SELECT label, item_id FROM list_entries WHERE list_id = ? AND (label, item_id) < (?, ?) ORDER BY label DESC, item_id DESC LIMIT ?"
+            rows = query_db(query, (stored['list_id'], *before, page_size + 1), db_conn=db)
+        elif after:
+            query = "SELECT label, item_id FROM list_entries WHERE list_id = ? AND (label, item_id) > (?, ?) ORDER BY label, item_id LIMIT ?"
+            rows = query_db(query, (stored['list_id'], *after, page_size + 1), db_conn=db)
         else:
-            grouped_by_class['No Class Assigned'].append(gene_entry)
-
-        phenotypes = pangen_to_phenotype.get(gene_id)
-        if phenotypes:
-            for phenotype_id in phenotypes:
-                phenotype_label = get_label(phenotype_id, db_conn=db)
-                grouped_by_phenotype[phenotype_label].append(gene_entry)
+            query = "SELECT label, item_id FROM list_entries WHERE list_id = ? ORDER BY label, item_id LIMIT ?"
+            rows = query_db(query, (stored['list_id'], page_size + 1), db_conn=db)
+        window = [(row['label'], row['item_id']) for row in rows]
+    else:
+        item_ids = fetch_list_members(db, kind, predicate, object_value)
+        resolved = resolve_entities(item_ids, db_conn=db)
+        entries = sorted((resolved[item_id]['label'], item_id) for item_id in set(item_ids))
+        total = len(entries)
+        if before:
+            end = bisect.bisect_left(entries, tuple(before))
+            window = entries[max(0, end - page_size - 1):end][::-1]
+        elif after:
+            start = bisect.bisect_right(entries, tuple(after))
+            window = entries[start:start + page_size + 1]
         else:
-            grouped_by_phenotype['No Phenotype Assigned'].append(gene_entry)
+            window = entries[:page_size + 1]
 
-    def sort_grouped_data(grouped_dict):
-        sorted_dict = {}
-        sorted_keys = sorted(grouped_dict.keys(), key=lambda k: (k.startswith("No "), k))
-        for key in sorted_keys:
-            sorted_genes = sorted(grouped_dict[key], key=lambda g: g[1])
-            sorted_dict[key] = sorted_genes
-        return sorted_dict
-
-    return sort_grouped_data(grouped_by_class), sort_grouped_data(grouped_by_phenotype), total_count
+    has_more = len(window) > page_size
+    window = window[:page_size]
+    if before:
+        window.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = after is not None, has_more
+    return {
+        'entries': window,
+        'total': total,
+        'prev': window[0] if window and has_prev else None,
+        'next': window[-1] if window and has_next else None,
+    }
 
-def get_related_subjects(predicate, object_value):
+def get_grouped_pangen_page(predicate, ungrouped_name=None, after=None, before=None):
+    """
+    PanGenes grouped by the object of `predicate`, as a list of groups sorted by name
+    (with "No ..." groups last): {'object': object_id, 'name': label, 'page': get_list_page()}.
+    Every group holds its first page, except the group named in the (group, label,
+    item_id) cursor `after` or `before`, which holds the page next to it. PanGenes
+    without `predicate` form a group named `ungrouped_name`, if given.
+    """
     db = get_db()
-    items = []
-    total_count = 0
-    query = "SELECT DISTINCT subject FROM triples WHERE predicate = ? AND object = ? ORDER BY subject"
-    results = query_db(query, (predicate, object_value), db_conn=db)
-
-    if results:
-        subject_ids = [row['subject'] for row in results]
-        labels = {}
-        if subject_ids:
-            placeholders = ','.join('?' * len(subject_ids))
-            label_query = f"SELECT subject, object FROM triples WHERE predicate = ? AND subject IN ({placeholders})"
-            label_results = query_db(label_query, (RDFS_LABEL, *subject_ids), db_conn=db)
-            if label_results:
-                labels = {row['subject']: row['object'] for row in label_results}
-
-        items = [{'id': row['subject'],
-                  'display_name': labels.get(row['subject'], row['subject']),
-                  'link': url_for('details', item_id=quote(row['subject']))}
-                 for row in results]
-        total_count = len(items)
-        items.sort(key=lambda x: x['display_name'])
-
-    return items, total_count
+    if use_index_summary():
+        rows = query_db("SELECT object FROM list_index WHERE kind = 'PanGene' AND predicate = ?", (predicate,), db_conn=db)
+        object_ids = [row['object'] for row in rows]
+    else:
+        object_ids = fetch_list_groups(db, predicate)
+    if ungrouped_name is None:
+        object_ids = [object_id for object_id in object_ids if object_id is not None]
+
+    resolved = resolve_entities([object_id for object_id in object_ids if object_id is not None], db_conn=db)
+    groups = []
+    for object_id in object_ids:
+        name = resolved[object_id]['label'] if object_id is not None else ungrouped_name
+        group_after = after[1:] if after and after[0] == object_id else None
+        group_before = before[1:] if before and before[0] == object_id else None
+        groups.append({
+            'object': object_id,
+            'name': name,
+            'page': get_list_page('PanGene', predicate, object_id, after=group_after, before=group_before),
+            'is_paged': bool(group_after or group_before),
+        })
+    groups.sort(key=lambda group: (group['name'].startswith("No "), group['name'], group['object'] or ''))
+    return [group for group in groups if group['page']['total']]
 
 @app.context_processor
 def inject_global_vars():
@@ -645,100 +2496,243 @@ def inject_global_vars():
         'citation_text': CITATION_TEXT
     }
 
-def get_pangen_distribution_data(limit=8):
+def get_page_etag():
     """
-    Calculates the distribution of PanGenes by Antibiotic Class,
-    Predicted Phenotype, and Source Database. Returns top N + Others.
+    Strong ETag of the page the current request asks for: a digest of the database
+    fingerprint, the code and templates, the path and the query arguments. The year
+    is included too, as the footer shows it.
     """
-    db = get_db()
-    distributions = {
-        'class': {'labels': [], 'counts': []},
-        'phenotype': {'labels': [], 'counts': []},
-        'database': {'labels': [], 'counts': []}
-    }
+    key = json.dumps([
+        get_current_db_fingerprint(),
+        current_app.config['RELEASE_ID'],
+        datetime.datetime.now().year,
+        request.path,
+        sorted(request.args.items(multi=True)),
+    ])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def set_page_cache_headers(response, etag):
+    response.set_etag(etag)
+    cache_control = current_app.config['CACHE_CONTROL'].get(request.endpoint)
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    return response
+
+def is_page_cached(endpoint):
+    return endpoint in current_app.config['PAGE_CACHE_ENDPOINTS'] and (page_cache.max_bytes > 0 or page_cache.disk_dir)
+
+def choose_content_encoding():
+    """The first of COMPRESSION_ENCODINGS the client's Accept-Encoding allows, or None."""
+    for encoding in current_app.config['COMPRESSION_ENCODINGS']:
+        if request.accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+def compress_body(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=current_app.config['BROTLI_QUALITY'])
+    # mtime=0: the same page always compresses to the same bytes
+    return gzip.compress(body, compresslevel=current_app.config['GZIP_LEVEL'], mtime=0)
+
+def variant_etag(etag, encoding):
+    """ETags are per representation, so each Content-Encoding of a page gets its own."""
+    return f"{etag}-{encoding}" if encoding else etag
+
+def set_encoded_body(response, body, encoding):
+    response.set_data(body)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+def compress_response(response):
+    """
+    Compresses a 200 response of a COMPRESSIBLE_MIMETYPES type in place when it is
+    at least COMPRESSION_MIN_BYTES and the client accepts one of the encodings.
+    Returns the encoding used, or None.
+    """
+    if (not current_app.config['COMPRESSION_ENCODINGS'] or response.status_code != 200 or response.is_streamed
+            or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return None
+    response.vary.add('Accept-Encoding')
+    encoding = g.content_encoding if 'content_encoding' in g else choose_content_encoding()
+    body = response.get_data()
+    if encoding is None or len(body) < current_app.config['COMPRESSION_MIN_BYTES']:
+        return None
+    set_encoded_body(response, compress_body(body, encoding), encoding)
+    return encoding
+
+def is_request_timed():
+    config = current_app.config
+    return (config['SERVER_TIMING'] or config['TIMING_LOG'] or config['QUERY_DEBUG'] or metrics is not None
+            or config['SLOW_QUERY_MS'] > 0)
+
+@app.before_request
+def start_request_timing():
+    """
+    Starts collecting the statements the request runs (see InstrumentedCursor) and
+    its template render time. Registered before answer_conditional_get, so the
+    fingerprint check behind a 304 or a page cache hit is counted too.
+    """
+    if is_request_timed():
+        g.request_start = time.perf_counter()
+        g.query_stats = []
+        g.render_ms = 0.0
 
-    # --- Get all PanGene IDs ---
-    pangen_ids_result = query_db(
-        "SELECT DISTINCT subject FROM triples WHERE predicate = ? AND object = 'PanGene'",
-        (RDF_TYPE,), db_conn=db
-    )
-    if not pangen_ids_result:
-        return distributions # Return empty if no PanGenes found
-
-    pangen_ids = [row['subject'] for row in pangen_ids_result]
-    placeholders = ','.join('?' * len(pangen_ids))
-
-    # --- Distribution by Antibiotic Class ---
-    class_counts = defaultdict(int)
-    class_query = f"""
-        SELECT object FROM triples
-        WHERE predicate = ? AND subject IN ({placeholders})
-    """
-    class_results = query_db(class_query, (HAS_RESISTANCE_CLASS, *pangen_ids), db_conn=db)
-    if class_results:
-        for row in class_results:
-            class_counts[row['object']] += 1
-    distributions['class'] = process_distribution_counts(db, class_counts, limit)
-
-    # --- Distribution by Predicted Phenotype ---
-    phenotype_counts = defaultdict(int)
-    phenotype_query = f"""
-        SELECT object FROM triples
-        WHERE predicate = ? AND subject IN ({placeholders})
-    """
-    phenotype_results = query_db(phenotype_query, (HAS_PREDICTED_PHENOTYPE, *pangen_ids), db_conn=db)
-    if phenotype_results:
-        for row in phenotype_results:
-            phenotype_counts[row['object']] += 1
-    distributions['phenotype'] = process_distribution_counts(db, phenotype_counts, limit)
-
-    # --- Distribution by Source Database (via OriginalGene and same_as) ---
-    # 1. Find OriginalGenes linked to our PanGenes
-    original_gene_map = defaultdict(list) # {original_gene_id: [pangen_id, ...]}
-    same_as_query = f"""
-        SELECT subject, object FROM triples
-        WHERE predicate = 'same_as' AND subject IN ({placeholders})
-    """
-    same_as_results = query_db(same_as_query, (*pangen_ids,), db_conn=db)
-    original_gene_ids = set()
-    pangen_to_original = defaultdict(set) # {pangen_id: {original_gene_id, ...}}
-    if same_as_results:
-        for row in same_as_results:
-            pangen_id = row['subject']
-            original_gene_id = row['object']
-            original_gene_ids.add(original_gene_id)
-            pangen_to_original[pangen_id].add(original_gene_id)
-
-    # 2. Find Databases for these OriginalGenes
-    db_counts = defaultdict(int)
-    if original_gene_ids:
-        og_placeholders = ','.join('?' * len(original_gene_ids))
-        db_query = f"""
-            SELECT T1.subject as original_gene, T1.object as database_id
-            FROM triples T1
-            JOIN triples T2 ON T1.subject = T2.subject
-            WHERE T1.predicate = ?
-              AND T1.subject IN ({og_placeholders})
-              AND T2.predicate = ? AND T2.object = 'OriginalGene'
-        """
-        db_results = query_db(db_query, (IS_FROM_DATABASE, *list(original_gene_ids), RDF_TYPE), db_conn=db)
+@before_render_template.connect_via(app)
+def start_render_timing(sender, template, context, **extra):
+    g.render_start = time.perf_counter()
 
-        # 3. Count unique PanGenes per Database
-        database_pangenes = defaultdict(set) # {database_id: {pangen_id, ...}}
-        if db_results:
-            original_to_db = {row['original_gene']: row['database_id'] for row in db_results}
-            for pangen_id, linked_original_ids in pangen_to_original.items():
-                for og_id in linked_original_ids:
-                    database_id = original_to_db.get(og_id)
-                    if database_id:
-                        database_pangenes[database_id].add(pangen_id)
+@template_rendered.connect_via(app)
+def stop_render_timing(sender, template, context, **extra):
+    if 'render_start' in g and 'render_ms' in g:
+        g.render_ms += (time.perf_counter() - g.pop('render_start')) * 1000
 
-        for db_id, unique_pangenes in database_pangenes.items():
-            db_counts[db_id] = len(unique_pangenes)
+def log_slow_queries():
+    """
+    Logs each statement of the request that took PANRES_SLOW_QUERY_MS or longer
+    (executing and fetching) as one JSON line on the 'panres.slow_queries' logger:
+    its shape (see normalize_sql), the parameter cardinality, the elapsed time and
+    rows, and the EXPLAIN QUERY PLAN output. Plans are kept per shape and build, so
+    a hub entity that is slow on every request costs one EXPLAIN, not one each time.
+    """
+    threshold = current_app.config['SLOW_QUERY_MS']
+    for sql, ms, rows, parameters in g.query_stats:
+        if ms < threshold:
+            continue
+        shape = normalize_sql(sql)
+        plan_key = (db_fingerprint_state['fingerprint'], shape)
+        with slow_query_plans_lock:
+            plan = slow_query_plans.get(plan_key)
+        if plan is None and 'db' in g:
+            try:
+                plan = explain_query_plan(g.db, sql, parameters)
+            except sqlite3.Error as e:
+                plan = [f"EXPLAIN QUERY PLAN failed: {e}"]
+            with slow_query_plans_lock:
+                slow_query_plans[plan_key] = plan
+                if len(slow_query_plans) > SLOW_QUERY_PLAN_CACHE_SIZE:
+                    slow_query_plans.popitem(last=False)
+        slow_query_logger.warning(json.dumps({
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'endpoint': request.endpoint,
+            'path': request.full_path if request.query_string else request.path,
+            'ms': round(ms, 2),
+            'rows': rows,
+            'shape': shape,
+            'sql': re.sub(r'\s+', ' ', sql).strip(),
+            'parameters': get_parameter_cardinality(parameters),
+            'plan': plan,
+        }))
+
+def get_request_timing(response):
+    """Summary of the current request's timing, as logged (and dumped with ?_debug=queries)."""
+    stats = g.query_stats
+    slowest = max(stats, key=lambda entry: entry[1], default=None)
+    return {
+        'method': request.method,
+        'path': request.full_path if request.query_string else request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'total_ms': round((time.perf_counter() - g.request_start) * 1000, 2),
+        'queries': len(stats),
+        'sql_ms': round(sum(entry[1] for entry in stats), 2),
+        'slowest_sql_ms': round(slowest[1], 2) if slowest else None,
+        'slowest_sql': re.sub(r'\s+', ' ', slowest[0]).strip()[:300] if slowest else None,
+        'render_ms': round(g.render_ms, 2),
+        'page_cache': response.headers.get('X-Page-Cache'),
+    }
 
-    distributions['database'] = process_distribution_counts(db, db_counts, limit)
+@app.after_request
+def add_request_timing(response):
+    """
+    Adds the Server-Timing header, logs the request's timing as one JSON line on
+    the 'panres.timing' logger and records it in the Prometheus metrics. Registered before finalize_response, so it runs after
+    it (after_request functions run in reverse order) and the total covers compression.
+    With PANRES_QUERY_DEBUG=1, ?_debug=queries swaps the response for a JSON dump of
+    every statement the request ran.
+    """
+    if 'query_stats' not in g:
+        return response
+    timing = get_request_timing(response)
+    if current_app.config['TIMING_LOG']:
+        timing_logger.info(json.dumps(timing))
+    if metrics is not None:
+        observe_request_metrics(timing)
+    if current_app.config['SLOW_QUERY_MS'] > 0:
+        log_slow_queries()
+    if current_app.config['QUERY_DEBUG'] and request.args.get('_debug') == 'queries':
+        timing['statements'] = [{'sql': re.sub(r'\s+', ' ', sql).strip(), 'ms': round(ms, 3), 'rows': rows}
+                                for sql, ms, rows, _ in g.query_stats]
+        response = jsonify(timing)
+    if current_app.config['SERVER_TIMING']:
+        server_timing = [f'db;dur={timing["sql_ms"]};desc="{timing["queries"]} queries"']
+        if timing['slowest_sql_ms'] is not None:
+            server_timing.append(f"db-slowest;dur={timing['slowest_sql_ms']}")
+        server_timing += [f"render;dur={timing['render_ms']}", f"total;dur={timing['total_ms']}"]
+        response.headers['Server-Timing'] = ', '.join(server_timing)
+    return response
+
+@app.before_request
+def answer_conditional_get():
+    """
+    Answers If-None-Match for an unchanged page with 304, and serves pages found in
+    the page cache (compressing and caching the variant the client wants if it is
+    not there yet), before any SQL or rendering is done.
+    """
+    if request.method not in ('GET', 'HEAD') or request.endpoint not in CONDITIONAL_GET_ENDPOINTS:
+        return None
+    g.page_etag = get_page_etag()
+    g.content_encoding = choose_content_encoding()
+    for encoding in {None, g.content_encoding}:
+        if request.if_none_match.contains(variant_etag(g.page_etag, encoding)):
+            response = current_app.response_class(status=304)
+            response.vary.add('Accept-Encoding')
+            return set_page_cache_headers(response, variant_etag(g.page_etag, encoding))
+    if is_page_cached(request.endpoint):
+        body, body_encoding = page_cache.get(g.page_etag, request.endpoint, g.content_encoding)
+        if body is not None:
+            g.page_cache_hit = True
+            if body_encoding != g.content_encoding and len(body) >= current_app.config['COMPRESSION_MIN_BYTES']:
+                body, body_encoding = compress_body(body, g.content_encoding), g.content_encoding
+                page_cache.put(g.page_etag, body, body_encoding)
+            response = set_encoded_body(current_app.response_class(mimetype='text/html'), body, body_encoding)
+            response.headers['X-Page-Cache'] = 'hit'
+            return set_page_cache_headers(response, variant_etag(g.page_etag, body_encoding))
+    return None
+
+@app.after_request
+def finalize_response(response):
+    if g.get('page_cache_hit'):
+        return response
+    # Only successful renders: a 404 for a missing item must not be revalidated as current
+    is_page = 'page_etag' in g and response.status_code == 200
+    cache_page = is_page and request.method == 'GET' and is_page_cached(request.endpoint) and not response.direct_passthrough
+    if cache_page:
+        page_cache.put(g.page_etag, response.get_data())
+        response.headers['X-Page-Cache'] = 'miss'
+    encoding = compress_response(response)
+    if cache_page and encoding:
+        page_cache.put(g.page_etag, response.get_data(), encoding)
+    if is_page:
+        set_page_cache_headers(response, variant_etag(g.page_etag, encoding))
+    return response
 
-    return distributions
+def get_pangen_distribution_data(limit=8):
+    """
+    Calculates the distribution of PanGenes by Antibiotic Class,
+    Predicted Phenotype, and Source Database. Returns top N + Others.
+    """
+    db = get_db()
+    if use_index_summary():
+        distribution_counts = {}
+        for chart in INDEX_DISTRIBUTION_CHARTS:
+            rows = query_db("SELECT item_id, count FROM index_distribution_counts WHERE chart = ? ORDER BY position", (chart,), db_conn=db)
+            distribution_counts[chart] = {row['item_id']: row['count'] for row in rows}
+    else:
+        distribution_counts = compute_pangen_distribution_counts(db)
+    return {chart: process_distribution_counts(db, distribution_counts[chart], limit) for chart in INDEX_DISTRIBUTION_CHARTS}
 
 
 def process_distribution_counts(db, counts_dict, limit):
@@ -755,17 +2749,10 @@ def process_distribution_counts(db, counts_dict, limit):
     final_counts = []
 
     # Get labels for top items
-    top_ids = [item[0] for item in top_items]
-    labels = {}
-    if top_ids:
-        placeholders = ','.join('?' * len(top_ids))
-        label_query = f"SELECT subject, object FROM triples WHERE predicate = ? AND subject IN ({placeholders})"
-        label_results = query_db(label_query, (RDFS_LABEL, *top_ids), db_conn=db)
-        if label_results:
-            labels = {row['subject']: row['object'] for row in label_results}
+    labels = resolve_entities([item[0] for item in top_items], db_conn=db)
 
     for item_id, count in top_items:
-        final_labels.append(labels.get(item_id, item_id))
+        final_labels.append(labels[item_id]['label'])
         final_counts.append(count)
 
     # Add 'Others' if necessary
@@ -801,12 +2788,53 @@ def list_items(category_key=None, predicate=None, object_value=None):
     grouping_predicate_display = None
     grouping_value_display = None
     parent_category_key = None
+    page_links = {}
+
+    # Keyset pagination: ?after=<cursor> / ?before=<cursor>, see get_list_page()
+    after_cursor = request.args.get('after')
+    before_cursor = request.args.get('before')
+
+    def page_url(**cursor_args):
+        return url_for('list_items', **request.view_args, **cursor_args)
+
+    def flat_list(kind, list_predicate, list_object=None):
+        page = get_list_page(kind, list_predicate, list_object,
+                             after=decode_list_cursor(after_cursor, 2), before=decode_list_cursor(before_cursor, 2))
+        page_items = [{
+            'id': item_id,
+            'display_name': label,
+            'link': url_for('details', item_id=quote(item_id))
+        } for label, item_id in page['entries']]
+        links = {
+            'prev': page_url(before=encode_list_cursor(page['prev'])) if page['prev'] else None,
+            'next': page_url(after=encode_list_cursor(page['next'])) if page['next'] else None,
+        }
+        return page_items, page['total'], links
+
+    def grouped_list(grouping_predicate, ungrouped_name=None, with_original_info=False):
+        groups = get_grouped_pangen_page(grouping_predicate, ungrouped_name,
+                                         after=decode_list_cursor(after_cursor, 3), before=decode_list_cursor(before_cursor, 3))
+        original_info = {}
+        if with_original_info:
+            original_info = get_pangen_original_info({item_id for group in groups for _, item_id in group['page']['entries']})
+        rendered_groups = []
+        for group in groups:
+            page = group['page']
+            rendered_groups.append({
+                'name': group['name'],
+                'total': page['total'],
+                'items': [{'id': item_id, 'label': label, 'original_info': original_info.get(item_id, "")}
+                          for label, item_id in page['entries']],
+                'prev_url': page_url(before=encode_list_cursor((group['object'], *page['prev']))) if page['prev'] else None,
+                'next_url': page_url(after=encode_list_cursor((group['object'], *page['next']))) if page['next'] else None,
+                'is_open': group['is_paged'],
+            })
+        return rendered_groups
 
     if predicate and object_value:
         # --- Logic for listing items related via a predicate ---
         decoded_object_value = unquote(object_value)
-        # Use get_related_subjects which already returns items with display_name and link
-        items, total_item_count = get_related_subjects(predicate, decoded_object_value)
+        items, total_item_count, page_links = flat_list('related', predicate, decoded_object_value)
         predicate_display = predicate_map.get(predicate, predicate)
         object_label = get_label(decoded_object_value, db_conn=db)
 
@@ -816,9 +2844,8 @@ def list_items(category_key=None, predicate=None, object_value=None):
         grouping_value_display = object_label
 
         # Try to find a parent category link for the object itself
-        details_for_object = get_item_details(decoded_object_value)
-        if details_for_object and details_for_object.get('primary_type_category_key'):
-            parent_category_key = details_for_object['primary_type_category_key']
+        object_info = resolve_entities([decoded_object_value], db_conn=db)[decoded_object_value]
+        _, parent_category_key, _ = get_item_category(decoded_object_value, object_info['primary_type'], db_conn=db)
         # Ensure items is populated, grouped_items is None
         grouped_items = None
 
@@ -829,9 +2856,9 @@ def list_items(category_key=None, predicate=None, object_value=None):
         item_type = category_info.get('value', category_key) # Default item type
 
         if category_key == "PanRes Genes":
-            # Group PanGenes by Class (existing logic)
-            grouped_by_class, _, total_item_count = get_grouped_pangen_data() # Total count here is total PanGenes
-            grouped_items = grouped_by_class
+            # Group PanGenes by Class
+            grouped_items = grouped_list(HAS_RESISTANCE_CLASS, ungrouped_name='No Class Assigned')
+            total_item_count = get_category_counts()[category_key] # Total count here is total PanGenes
             grouping_predicate_display = predicate_map.get(HAS_RESISTANCE_CLASS)
             item_type = "PanGene" # Item type is the gene itself
             page_title = "PanRes Genes grouped by Antibiotic Class"
@@ -839,16 +2866,9 @@ def list_items(category_key=None, predicate=None, object_value=None):
 
         elif category_key == "Antibiotic Classes":
             # List Classes, group associated PanGenes under each class
-            class_items_raw, _ = get_items_for_category(category_key) # Get list of {'id': class_id}
-            class_ids = [item['id'] for item in class_items_raw]
-
-            # Use the helper function to get PanGenes grouped by Class
             # total_item_count here will be the number of classes with associated PanGenes
-            grouped_items, total_item_count = get_subjects_grouped_by_objects(
-                object_ids=class_ids,
-                predicate=HAS_RESISTANCE_CLASS,
-                subject_type_filter='PanGene' # Ensure we only group PanGenes
-            )
+            grouped_items = grouped_list(HAS_RESISTANCE_CLASS, with_original_info=True)
+            total_item_count = len(grouped_items)
 
             page_title = "Antibiotic Classes (with associated PanGenes)"
             item_type = "Antibiotic Class" # The primary item being listed is the class
@@ -857,16 +2877,9 @@ def list_items(category_key=None, predicate=None, object_value=None):
 
         elif category_key == "Predicted Phenotypes":
             # List Phenotypes, group associated PanGenes under each phenotype
-            phenotype_items_raw, _ = get_items_for_category(category_key)
-            phenotype_ids = [item['id'] for item in phenotype_items_raw]
-
-            # Use the helper function to get PanGenes grouped by Phenotype
             # total_item_count here will be the number of phenotypes with associated PanGenes
-            grouped_items, total_item_count = get_subjects_grouped_by_objects(
-                object_ids=phenotype_ids,
-                predicate=HAS_PREDICTED_PHENOTYPE,
-                subject_type_filter='PanGene'
-            )
+            grouped_items = grouped_list(HAS_PREDICTED_PHENOTYPE, with_original_info=True)
+            total_item_count = len(grouped_items)
 
             page_title = "Predicted Phenotypes (with associated PanGenes)"
             item_type = "Predicted Phenotype" # Primary item is the phenotype
@@ -875,33 +2888,14 @@ def list_items(category_key=None, predicate=None, object_value=None):
 
         # Keep Source Databases as a flat list for now, but ensure links work
         elif category_key == "Source Databases":
-            items_raw, total_item_count = get_items_for_category(category_key)
-            items = []
-            for item_raw in items_raw:
-                item_id = item_raw['id']
-                items.append({
-                    'id': item_id,
-                    'display_name': get_label(item_id, db_conn=db),
-                    'link': url_for('details', item_id=quote(item_id)) # Link to DB details page
-                })
-            items.sort(key=lambda x: x['display_name'])
+            items, total_item_count, page_links = flat_list('category', category_key)
             grouped_items = None # Ensure grouped_items is None
             page_title = "Source Databases" # Adjust title if needed
             item_type = "Source Database"
 
         else:
             # Default flat list logic for any other category
-            items_raw, total_item_count = get_items_for_category(category_key)
-            items = []
-            for item_raw in items_raw:
-                 item_id = item_raw['id']
-                 items.append({
-                     'id': item_id,
-                     'display_name': get_label(item_id, db_conn=db),
-                     # Link to the item's detail page
-                     'link': url_for('details', item_id=quote(item_id))
-                 })
-            items.sort(key=lambda x: x['display_name'])
+            items, total_item_count, page_links = flat_list('category', category_key)
             grouped_items = None # Ensure grouped_items is None
             # page_title and item_type are already set from category_info
 
@@ -920,6 +2914,7 @@ def list_items(category_key=None, predicate=None, object_value=None):
                            grouping_predicate_display=grouping_predicate_display,
                            grouping_value_display=grouping_value_display,
                            parent_category_key=parent_category_key,
+                           page_links=page_links,
                            )
 
 @app.route('/details/<path:item_id>')
@@ -980,10 +2975,200 @@ def test_db_connection():
 @app.route('/autocomplete')
 def autocomplete():
     search_term = request.args.get('q', '').strip()
-    # Call the direct query function with updated logic
-    suggestions = get_autocomplete_suggestions_direct(search_term)
+    backend = current_app.config['AUTOCOMPLETE_BACKEND']
+    index = get_autocomplete_index() if backend == 'memory' else None
+    if index is not None:
+        suggestions = get_autocomplete_suggestions_memory(search_term, index=index)
+    # Serve from the FTS index once it is built; the direct triples scan is the fallback
+    # while another worker is still building it, or for terms without any token characters
+    elif backend != 'sql' and is_fts_ready() and AUTOCOMPLETE_TOKEN_RE.search(search_term):
+        suggestions = get_autocomplete_suggestions_fts(search_term)
+    else:
+        suggestions = get_autocomplete_suggestions_direct(search_term)
     return jsonify(suggestions)
 
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify({'label_cache': label_cache.stats(), 'page_cache': page_cache.stats(), 'db_pool': db_pool.stats(),
+                    'graph_snapshot': graph_snapshot.stats() if graph_snapshot is not None else None})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus text exposition of the metrics, summed over all workers in multiprocess mode."""
+    if metrics is None:
+        return Response("Metrics are off (PANRES_METRICS=0) or prometheus_client is not installed.\n", status=404, mimetype='text/plain')
+    update_build_metrics()
+    db_path = current_app.config['DATABASE']
+    for name, path in (('db', db_path), ('wal', db_path + '-wal')):
+        metrics['db_file_bytes'].labels(name).set(os.path.getsize(path) if os.path.exists(path) else 0)
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = prometheus_client.CollectorRegistry()
+        prometheus_multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return Response(prometheus_client.generate_latest(registry), content_type=prometheus_client.CONTENT_TYPE_LATEST)
+
+@app.route('/autocomplete/stats')
+def autocomplete_stats():
+    stats = {'backend': current_app.config['AUTOCOMPLETE_BACKEND'], 'memory_index': None}
+    if autocomplete_index is not None:
+        stats['memory_index'] = get_autocomplete_index_stats(autocomplete_index)
+        stats['memory_index']['budget_mb'] = current_app.config['AUTOCOMPLETE_MEMORY_BUDGET_MB']
+    return jsonify(stats)
+
+@app.route('/api/annotate', methods=['POST'])
+def api_annotate():
+    """
+    Bulk annotation for pipelines: POST {"ids": ["pan_1", "ARO:3000026", ...]} (or a
+    bare JSON array) and get back {"count", "found", "results"} with one annotate_genes()
+    record per ID, in request order. Up to PANRES_ANNOTATE_MAX_IDS IDs per call.
+    Throughput target: 10,000 IDs per second or better for calls of 10,000 IDs
+    (checked by benchmarks/bench_annotate.py).
+    """
+    payload = request.get_json(silent=True)
+    gene_ids = payload.get('ids') if isinstance(payload, dict) else payload
+    if not isinstance(gene_ids, list) or not all(isinstance(gene_id, str) for gene_id in gene_ids):
+        return jsonify({'error': 'Expected a JSON body {"ids": [<string>, ...]}.'}), 400
+    max_ids = current_app.config['ANNOTATE_MAX_IDS']
+    if len(gene_ids) > max_ids:
+        return jsonify({'error': f"Too many IDs ({len(gene_ids)}); at most {max_ids} per call."}), 413
+    annotations = annotate_genes(get_db(), gene_ids)
+    results = [annotations[gene_id] for gene_id in gene_ids]
+    return jsonify({'count': len(results), 'found': sum(1 for result in results if result['found']), 'results': results})
+
+@app.route('/api/export/<export_format>')
+def api_export(export_format):
+    """
+    Streams every PanGene with its label, resistance classes, predicted phenotypes,
+    lengths, same_as aliases and source databases, as NDJSON (one annotate_genes()
+    record per line) or TSV (list values joined with ';'). gzip-compressed on the fly
+    when the client accepts it.
+    """
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown export format '{export_format}'; use one of: {', '.join(EXPORT_FORMATS)}."}), 404
+    mimetype, format_record = EXPORT_FORMATS[export_format]
+    chunks = iter_export_chunks(db_pool.open_connection, current_app.config['EXPORT_BATCH_SIZE'], format_record,
+                                header=EXPORT_TSV_HEADER if export_format == 'tsv' else None)
+    response = Response(chunks, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f"attachment; filename=panres_export.{export_format}"
+    if 'gzip' in current_app.config['COMPRESSION_ENCODINGS']:
+        response.vary.add('Accept-Encoding')
+        if request.accept_encodings['gzip'] > 0:
+            response.response = gzip_stream(chunks)
+            response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def get_autocomplete_suggestions_memory(term, limit=500, index=None):
+    """
+    Autocomplete answered from the in-process index (by default the current
+    autocomplete_index) without touching SQLite. Same contract as
+    get_autocomplete_suggestions_direct: prefix matches on subject ID or label,
+    case-sensitive matches first, then case-insensitive ones, each by ID.
+    """
+    if not term:
+        return []
+    if index is None:
+        index = autocomplete_index
+    result_cache, result_cache_lock = index['result_cache'], index['result_cache_lock']
+    cache_key = (term, limit)
+    with result_cache_lock:
+        positions = result_cache.get(cache_key)
+        if positions is not None:
+            result_cache.move_to_end(cache_key)
+    if positions is None:
+        sensitive = prefix_range_items(index['case_keys'], index['case_key_items'], term)
+        ordered = sorted(sensitive)[:limit]
+        if len(ordered) < limit:
+            insensitive = prefix_range_items(index['folded_keys'], index['folded_key_items'], term.lower())
+            ordered += sorted(insensitive - sensitive)[:limit - len(ordered)]
+        positions = ordered
+        with result_cache_lock:
+            result_cache[cache_key] = positions
+            if len(result_cache) > current_app.config['AUTOCOMPLETE_RESULT_CACHE_SIZE']:
+                result_cache.popitem(last=False)
+
+    item_ids, display_names, type_indicators = index['item_ids'], index['display_names'], index['type_indicators']
+    suggestions = []
+    for position in positions:
+        item_id = item_ids[position]
+        suggestions.append({
+            'id': item_id,
+            'display_name': display_names[position],
+            'link': url_for('details', item_id=quote(item_id)),
+            'type_indicator': type_indicators[position]
+        })
+    return suggestions
+
+def prefix_range_items(sorted_keys, key_items, prefix):
+    """Set of item positions whose key in `sorted_keys` starts with `prefix`."""
+    lo = bisect.bisect_left(sorted_keys, prefix)
+    hi = bisect.bisect_left(sorted_keys, prefix + '\U0010ffff', lo)
+    return set(key_items[lo:hi])
+
+def get_autocomplete_suggestions_fts(term, limit=500):
+    """
+    Autocomplete backed by item_autocomplete_fts. Same contract as
+    get_autocomplete_suggestions_direct: prefix matches on subject ID or label,
+    case-sensitive matches first, then case-insensitive ones, each sorted by ID.
+
+    Both groups come from column-initial phrase prefix queries (case_key for the
+    case-sensitive one, search_key for the rest). The tokenizer ignores punctuation,
+    so each candidate row is re-checked against the literal prefix. Rows are stored in
+    item_id order, which means each scan can stop as soon as it has enough items.
+    """
+    if not term:
+        return []
+
+    db = get_db()
+    term_lower = term.lower()
+    try:
+        # --- 1. Case-sensitive matches ---
+        sensitive = iter_autocomplete_matches(db, 'case_key', encode_case_key(term),
+                                              lambda key: key.startswith(term), limit)
+        # --- 2. Case-insensitive matches, only needed to fill up the remaining slots ---
+        insensitive = {}
+        if len(sensitive) < limit:
+            insensitive = iter_autocomplete_matches(db, 'search_key', term,
+                                                    lambda key: key.lower().startswith(term_lower),
+                                                    limit - len(sensitive), exclude=sensitive)
+    except sqlite3.Error as e:
+        logging.error(f"Autocomplete FTS Error: {e}", exc_info=True)
+        return []
+
+    return [{
+        'id': row['item_id'],
+        'display_name': row['display_name'],
+        'link': url_for('details', item_id=quote(row['item_id'])),
+        'type_indicator': row['type_indicator']
+    } for row in [*sensitive.values(), *insensitive.values()]]
+
+def iter_autocomplete_matches(db, column, phrase, is_match, limit, exclude=()):
+    """
+    Returns {item_id: row} for up to `limit` items (in item_id order) with a key that
+    passes `is_match`, using an FTS prefix query on `column` to find candidates.
+    """
+    # Quote the phrase as an FTS5 string so the tokenizer applies the same rules used at
+    # index time; embedded double quotes are escaped by doubling them
+    match_expr = '{} : ^ "{}" *'.format(column, phrase.replace('"', '""'))
+    matches = {}
+    cursor = db.execute("""
+        SELECT item_id, search_key, display_name, type_indicator
+        FROM item_autocomplete_fts
+        WHERE item_autocomplete_fts MATCH ?
+        ORDER BY rowid
+    """, (match_expr,))
+    try:
+        for row in cursor:
+            item_id = row['item_id']
+            if item_id in matches or item_id in exclude or not is_match(row['search_key']):
+                continue
+            if len(matches) == limit:
+                break
+            matches[item_id] = row
+    finally:
+        cursor.close()
+    return matches
+
 # Autocomplete function using direct queries with explicit case-sensitive grouping and robust type checking
 def get_autocomplete_suggestions_direct(term, limit=500):
     """
@@ -1061,19 +3246,19 @@ def get_autocomplete_suggestions_direct(term, limit=500):
         actual_ids_count = len(item_ids)
         if actual_ids_count == 0: return []
 
-        placeholders = ','.join('?' * actual_ids_count)
+        item_ids_json = json.dumps(item_ids) # One parameter for the whole ID list
 
         # --- 5. Fetch details (Labels, ALL Types) ---
         logging.info(f"Fetching details for {actual_ids_count} IDs...")
         labels = {}
-        label_query = f"SELECT subject, object FROM triples WHERE predicate = ? AND subject IN ({placeholders})"
-        label_results = query_db(label_query, (RDFS_LABEL, *item_ids), db_conn=db)
+        label_query = "SELECT subject, object FROM triples WHERE predicate = ? AND subject IN (SELECT value FROM json_each(?))"
+        label_results = query_db(label_query, (RDFS_LABEL, item_ids_json), db_conn=db)
         if label_results: labels = {row['subject']: row['object'] for row in label_results}
 
         # Fetch *all* types for each subject
         all_types_map = defaultdict(list)
-        type_query = f"SELECT subject, object FROM triples WHERE predicate = ? AND subject IN ({placeholders})"
-        type_results = query_db(type_query, (RDF_TYPE, *item_ids), db_conn=db)
+        type_query = "SELECT subject, object FROM triples WHERE predicate = ? AND subject IN (SELECT value FROM json_each(?))"
+        type_results = query_db(type_query, (RDF_TYPE, item_ids_json), db_conn=db)
         if type_results:
             for row in type_results: all_types_map[row['subject']].append(row['object'])
         logging.info(f"Fetched types for {len(all_types_map)} items.")
@@ -1082,22 +3267,21 @@ def get_autocomplete_suggestions_direct(term, limit=500):
 
         # --- 6. Check for Class/Phenotype/Database roles ---
         class_ids, phenotype_ids, database_ids = set(), set(), set()
-        check_query = f"SELECT DISTINCT object FROM triples WHERE predicate = ? AND object IN ({placeholders})"
+        check_query = "SELECT DISTINCT object FROM triples WHERE predicate = ? AND object IN (SELECT value FROM json_each(?))"
         # Run these checks only if the corresponding predicates exist in your PREDICATE_MAP or constants
         if HAS_RESISTANCE_CLASS:
-            class_res = query_db(check_query, (HAS_RESISTANCE_CLASS, *item_ids), db_conn=db)
+            class_res = query_db(check_query, (HAS_RESISTANCE_CLASS, item_ids_json), db_conn=db)
             if class_res: class_ids = {row['object'] for row in class_res}
         if HAS_PREDICTED_PHENOTYPE:
-            pheno_res = query_db(check_query, (HAS_PREDICTED_PHENOTYPE, *item_ids), db_conn=db)
+            pheno_res = query_db(check_query, (HAS_PREDICTED_PHENOTYPE, item_ids_json), db_conn=db)
             if pheno_res: phenotype_ids = {row['object'] for row in pheno_res}
         if IS_FROM_DATABASE:
-            db_res = query_db(check_query, (IS_FROM_DATABASE, *item_ids), db_conn=db)
+            db_res = query_db(check_query, (IS_FROM_DATABASE, item_ids_json), db_conn=db)
             if db_res: database_ids = {row['object'] for row in db_res}
         logging.debug(f"Checked roles: Classes({len(class_ids)}), Phenotypes({len(phenotype_ids)}), Databases({len(database_ids)})")
 
 
         # --- 7. Build suggestion list, respecting the order from step 4 ---
-        PANGENE_TYPES = {'PanGene', 'AntimicrobialResistanceGene', 'BiocideResistanceGene', 'MetalResistanceGene'}
         final_suggestions = []
         processed_ids = set() # Ensure no duplicates
 
@@ -1108,24 +3292,9 @@ def get_autocomplete_suggestions_direct(term, limit=500):
             display_name = labels.get(item_id, item_id)
             item_all_types = all_types_map.get(item_id, []) # Get all types
 
-            # Determine standardized type indicator based on all types
-            type_indicator = "Other" # Default
-            # Check specific roles first
-            if item_id in class_ids: type_indicator = "Resistance Class"
-            elif item_id in phenotype_ids: type_indicator = "Predicted Phenotype"
-            elif item_id in database_ids: type_indicator = "Source Database"
-            # Then check gene types using *all* types associated with the item
-            elif any(t in PANGENE_TYPES for t in item_all_types):
-                 type_indicator = "PanGene" # Standardize to PanGene if any relevant type exists
-            elif 'OriginalGene' in item_all_types:
-                 type_indicator = "OriginalGene"
-            else:
-                 # Fallback: find a preferred type label (non-OWL, non-NamedIndividual)
-                 preferred_type = next((t for t in item_all_types if t != OWL_NAMED_INDIVIDUAL and not t.startswith('owl:')), None)
-                 if preferred_type:
-                     type_indicator = get_label(preferred_type, db_conn=db)
-                 elif item_all_types: # If only OWL/NamedIndividual types, use the first one's label
-                     type_indicator = get_label(item_all_types[0], db_conn=db)
+            # Determine standardized type indicator based on roles and all types
+            type_indicator = get_type_indicator(item_id, item_all_types, class_ids, phenotype_ids, database_ids,
+                                                lambda type_id: get_label(type_id, db_conn=db))
 
             final_suggestions.append({
                 'id': item_id,
@@ -1154,156 +3323,189 @@ def get_autocomplete_suggestions_direct(term, limit=500):
 
 # Helper function to fetch labels in batches (can be reused)
 def get_labels_in_batches(db_conn, item_ids):
-    labels = {}
-    if not item_ids:
-        return labels
-    item_list = list(set(item_ids)) # Ensure unique IDs
-    batch_size = 900 # SQLite variable limit is often 999
-    for i in range(0, len(item_list), batch_size):
-        batch_ids = item_list[i:i+batch_size]
-        placeholders = ','.join('?' * len(batch_ids))
-        label_query = f"SELECT subject, object FROM triples WHERE predicate = ? AND subject IN ({placeholders})"
-        label_results = query_db(label_query, (RDFS_LABEL, *batch_ids), db_conn=db_conn)
-        if label_results:
-            for row in label_results:
-                labels[row['subject']] = row['object']
-    return labels
+    return {item_id: info['label'] for item_id, info in resolve_entities(item_ids, db_conn=db_conn).items()}
 
-def get_subjects_grouped_by_objects(object_ids, predicate, subject_type_filter=None):
+def get_pangen_original_info(pangen_ids):
     """
-    Fetches subjects linked to a list of object IDs via a specific predicate,
-    optionally filtering subjects by type, and groups them by object label.
-    Includes original gene/database info for subjects if they are PanGenes.
-
-    Args:
-        object_ids (list): A list of object IDs (e.g., class IDs, phenotype IDs).
-        predicate (str): The predicate linking subjects to these objects (e.g., HAS_RESISTANCE_CLASS).
-        subject_type_filter (str, optional): An RDF type to filter the subjects (e.g., 'PanGene'). Defaults to None.
-
-    Returns:
-        tuple: A tuple containing:
-            - grouped_data (dict): {object_label: [{'id': subject_id, 'label': subject_label, 'original_info': 'also called...'}, ...]}
-            - total_object_count (int): The number of unique object groups found.
+    Returns {pangen_id: "also called X in Y, ..."} naming the OriginalGenes each PanGene
+    is the same as and the database each comes from ("" if none).
     """
     db = get_db()
-    grouped_data = defaultdict(list)
-    if not object_ids:
-        return {}, 0
-
-    unique_object_ids = list(set(object_ids))
-    # Get labels for all object IDs first
-    object_labels = get_labels_in_batches(db, unique_object_ids)
-
-    # Find all subjects linked to these objects via the predicate, potentially filtered by type
-    subject_links_query = f"""
-        SELECT T1.subject, T1.object
-        FROM triples T1
-        { "JOIN triples T2 ON T1.subject = T2.subject" if subject_type_filter else "" }
-        WHERE T1.predicate = ?
-          AND T1.object IN ({','.join('?' * len(unique_object_ids))})
-        { "AND T2.predicate = ? AND T2.object =?" if subject_type_filter else "" }
-    """
-    query_params = [predicate, *unique_object_ids]
-    if subject_type_filter:
-        query_params.extend([RDF_TYPE, subject_type_filter])
-
-    subject_link_results = query_db(subject_links_query, tuple(query_params), db_conn=db)
-
-    subjects_found = set()
-    object_to_subjects = defaultdict(list) # {object_id: [subject_id, ...]}
-    if subject_link_results:
-        for row in subject_link_results:
-            subject_id = row['subject']
-            object_id = row['object']
-            subjects_found.add(subject_id)
-            object_to_subjects[object_id].append(subject_id)
-
-    # Get labels for all found subjects
-    subject_labels = get_labels_in_batches(db, list(subjects_found))
-
-    # --- Fetch Original Gene Info (Only if subject_type_filter is 'PanGene') ---
     pangen_original_info = defaultdict(str) # {pangen_id: "also called X in Y, ..."}
-    if subject_type_filter == 'PanGene' and subjects_found:
-        pangen_list = list(subjects_found)
-        placeholders_subj = ','.join('?' * len(pangen_list))
-
-        # 1. Find OriginalGene IDs linked via 'same_as'
-        same_as_query = f"SELECT subject, object FROM triples WHERE predicate = 'same_as' AND subject IN ({placeholders_subj})"
-        same_as_results = query_db(same_as_query, tuple(pangen_list), db_conn=db)
-        pangen_to_original_ids = defaultdict(list)
-        all_original_ids = set()
-        if same_as_results:
-            for row in same_as_results:
-                pangen_id = row['subject']
-                original_id = row['object']
-                pangen_to_original_ids[pangen_id].append(original_id)
-                all_original_ids.add(original_id)
-
-        if all_original_ids:
-            original_list = list(all_original_ids)
-            placeholders_orig = ','.join('?' * len(original_list))
-
-            # 2. Get Labels for OriginalGenes
-            original_labels = get_labels_in_batches(db, original_list)
-
-            # 3. Get Database IDs for OriginalGenes
-            db_query = f"""
-                SELECT subject, object FROM triples
-                WHERE predicate = ? AND subject IN ({placeholders_orig})
-            """
-            db_results = query_db(db_query, (IS_FROM_DATABASE, *original_list), db_conn=db)
-            original_to_db_id = {}
-            all_db_ids = set()
-            if db_results:
-                for row in db_results:
-                    original_id = row['subject']
-                    db_id = row['object']
-                    original_to_db_id[original_id] = db_id
-                    all_db_ids.add(db_id)
-
-            # 4. Get Labels for Databases
-            db_labels = get_labels_in_batches(db, list(all_db_ids))
-
-            # 5. Construct the info string for each PanGene
-            for pangen_id, original_ids in pangen_to_original_ids.items():
-                info_parts = []
-                for original_id in sorted(original_ids): # Sort for consistency
-                    original_label = original_labels.get(original_id, original_id)
-                    db_id = original_to_db_id.get(original_id)
-                    db_label = db_labels.get(db_id, db_id) if db_id else "Unknown DB"
-                    info_parts.append(f"{original_label} in {db_label}")
-
-                if info_parts:
-                    pangen_original_info[pangen_id] = "also called " + ", ".join(info_parts)
-    # --- End Fetch Original Gene Info ---
-
-
-    # Build the final grouped dictionary using the fetched info
-    for object_id in unique_object_ids:
-        object_label = object_labels.get(object_id, object_id)
-        subject_ids_for_object = list(set(object_to_subjects.get(object_id, []))) # Unique subjects per group
-        subject_details_list = []
-        for subject_id in subject_ids_for_object:
-            subject_label = subject_labels.get(subject_id, subject_id)
-            original_info_str = pangen_original_info.get(subject_id, "") # Get the pre-formatted string
-            subject_details_list.append({
-                'id': subject_id,
-                'label': subject_label,
-                'original_info': original_info_str
-            })
+    if not pangen_ids:
+        return pangen_original_info
+    snapshot = get_graph_snapshot()
+    if snapshot is not None:
+        return get_pangen_original_info_from_snapshot(snapshot, pangen_ids, pangen_original_info)
+    # 1. Find OriginalGene IDs linked via 'same_as' (ID sets are passed as one JSON array parameter)
+    same_as_query = "SELECT subject, object FROM triples WHERE predicate = 'same_as' AND subject IN (SELECT value FROM json_each(?))"
+    same_as_results = query_db(same_as_query, (json.dumps(list(pangen_ids)),), db_conn=db)
+    pangen_to_original_ids = defaultdict(list)
+    all_original_ids = set()
+    if same_as_results:
+        for row in same_as_results:
+            pangen_id = row['subject']
+            original_id = row['object']
+            pangen_to_original_ids[pangen_id].append(original_id)
+            all_original_ids.add(original_id)
 
-        # Sort subjects within the group by label
-        subject_details_list.sort(key=lambda x: x['label'])
-        if subject_details_list: # Only add group if it has subjects
-             grouped_data[object_label] = subject_details_list
+    if all_original_ids:
+        original_list = list(all_original_ids)
 
-    # Sort groups by object label (group name)
-    sorted_grouped_data = dict(sorted(grouped_data.items(), key=lambda item: (item[0].startswith("No "), item[0])))
+        # 2. Get Labels for OriginalGenes
+        original_labels = get_labels_in_batches(db, original_list)
 
-    # Recalculate total_object_count based on groups actually having data
-    final_group_count = len(sorted_grouped_data)
+        # 3. Get Database IDs for OriginalGenes
+        db_query = """
+            SELECT subject, object FROM triples
+            WHERE predicate = ? AND subject IN (SELECT value FROM json_each(?))
+        """
+        db_results = query_db(db_query, (IS_FROM_DATABASE, json.dumps(original_list)), db_conn=db)
+        original_to_db_id = {}
+        all_db_ids = set()
+        if db_results:
+            for row in db_results:
+                original_id = row['subject']
+                db_id = row['object']
+                original_to_db_id[original_id] = db_id
+                all_db_ids.add(db_id)
+
+        # 4. Get Labels for Databases
+        db_labels = get_labels_in_batches(db, list(all_db_ids))
+
+        # 5. Construct the info string for each PanGene
+        for pangen_id, original_ids in pangen_to_original_ids.items():
+            info_parts = []
+            for original_id in sorted(original_ids): # Sort for consistency
+                original_label = original_labels.get(original_id, original_id)
+                db_id = original_to_db_id.get(original_id)
+                db_label = db_labels.get(db_id, db_id) if db_id else "Unknown DB"
+                info_parts.append(f"{original_label} in {db_label}")
+
+            if info_parts:
+                pangen_original_info[pangen_id] = "also called " + ", ".join(info_parts)
+
+    return pangen_original_info
+
+def get_pangen_original_info_from_snapshot(snapshot, pangen_ids, pangen_original_info):
+    """get_pangen_original_info() answered from the graph snapshot's same_as and is_from_database links."""
+    for pangen_id in pangen_ids:
+        info_parts = []
+        for original_id in sorted(snapshot.linked(pangen_id, 'same_as')):
+            db_ids = snapshot.linked(original_id, IS_FROM_DATABASE)
+            db_label = snapshot.label(db_ids[-1]) if db_ids else "Unknown DB"
+            info_parts.append(f"{snapshot.label(original_id)} in {db_label}")
+        if info_parts:
+            pangen_original_info[pangen_id] = "also called " + ", ".join(info_parts)
+    return pangen_original_info
+
+def annotate_genes(db_conn, gene_ids):
+    """
+    Annotation records for PanGene or OriginalGene IDs, keyed by ID: label, types,
+    resistance classes, predicted phenotypes, sequence lengths, source databases and
+    same_as aliases. Classes, phenotypes and databases include those of the genes each ID is the same
+    as (in either direction), so an OriginalGene gets its PanGene's class and a PanGene
+    the databases of its OriginalGenes. Two set-based statements do all the reading,
+    each taking its ID set as a single JSON array: one for the same_as links, one for
+    the attributes of the requested and linked genes together.
+    """
+    annotations = {gene_id: {'id': gene_id, 'found': False, 'label': None, 'types': [], 'resistance_classes': [],
+                             'predicted_phenotypes': [], 'lengths': [], 'source_databases': [], 'same_as': []}
+                   for gene_id in gene_ids}
+    if not annotations:
+        return annotations
+    cursor = db_conn.cursor()
+    cursor.row_factory = None # Plain tuples: several rows per ID, sqlite3.Row costs more than the unpacking
+
+    # 1. same_as links in both directions ('CROSS JOIN' keeps the IDs as the outer loop)
+    links_query = """
+        WITH ids(id) AS MATERIALIZED (SELECT DISTINCT value FROM json_each(?))
+        SELECT ids.id, T.object FROM ids CROSS JOIN triples T ON T.subject = ids.id AND T.predicate = 'same_as'
+        UNION
+        SELECT ids.id, T.subject FROM ids CROSS JOIN triples T ON T.predicate = 'same_as' AND T.object = ids.id
+    """
+    linked_genes = defaultdict(set) # {gene_id: {linked_id, ...}}
+    for gene_id, linked_id in cursor.execute(links_query, (json.dumps(list(annotations)),)):
+        if linked_id != gene_id:
+            linked_genes[gene_id].add(linked_id)
+
+    # 2. Attributes of the requested and the linked genes
+    fields = {HAS_RESISTANCE_CLASS: 'resistance_classes', HAS_PREDICTED_PHENOTYPE: 'predicted_phenotypes', IS_FROM_DATABASE: 'source_databases'}
+    attribute_query = """
+        SELECT subject, predicate, object FROM triples
+        WHERE subject IN (SELECT value FROM json_each(?)) AND predicate IN (?, ?, ?, ?, ?, ?)
+    """
+    all_gene_ids = set(annotations).union(*linked_genes.values())
+    attributes = defaultdict(lambda: defaultdict(set)) # {gene_id: {predicate: {value, ...}}}
+    labels = {}
+    for subject, predicate, value in cursor.execute(attribute_query, (json.dumps(list(all_gene_ids)), RDFS_LABEL, RDF_TYPE, HAS_LENGTH, *fields)):
+        if predicate == RDFS_LABEL:
+            labels.setdefault(subject, value)
+        else:
+            attributes[subject][predicate].add(value)
+
+    for gene_id, annotation in annotations.items():
+        if gene_id not in attributes and gene_id not in linked_genes:
+            continue
+        annotation['found'] = True
+        annotation['label'] = labels.get(gene_id)
+        annotation['types'] = sorted(attributes[gene_id][RDF_TYPE] - {OWL_NAMED_INDIVIDUAL})
+        annotation['lengths'] = sorted(attributes[gene_id][HAS_LENGTH])
+        annotation['same_as'] = sorted(linked_genes[gene_id])
+        for predicate, field in fields.items():
+            values = set(attributes[gene_id][predicate])
+            for linked_id in linked_genes[gene_id]:
+                values |= attributes[linked_id][predicate]
+            annotation[field] = sorted(values)
+    return annotations
+
+EXPORT_FIELDS = ('id', 'label', 'resistance_classes', 'predicted_phenotypes', 'lengths', 'same_as', 'source_databases')
+EXPORT_TSV_HEADER = '\t'.join(EXPORT_FIELDS) + '\n'
+
+def format_export_ndjson(record):
+    return json.dumps({field: record[field] for field in EXPORT_FIELDS}) + '\n'
+
+def format_export_tsv(record):
+    values = []
+    for field in EXPORT_FIELDS:
+        value = record[field]
+        value = ';'.join(value) if isinstance(value, list) else (value or '')
+        values.append(re.sub(r'[\t\r\n]', ' ', value))
+    return '\t'.join(values) + '\n'
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', format_export_ndjson),
+    'tsv': ('text/tab-separated-values', format_export_tsv),
+}
+
+def iter_export_chunks(open_connection, batch_size, format_record, header=None):
+    """
+    Yields the export one batch of PanGenes at a time, as encoded text. A single
+    cursor walks the PanGene type rows (server side, in index order) and each batch
+    of IDs it yields is annotated with annotate_genes(), so memory stays bounded by
+    the batch size however many PanGenes there are. Uses its own connection (from
+    open_connection()), as the response outlives the request context that owns g.db.
+    """
+    db = open_connection()
+    try:
+        if header:
+            yield header.encode('utf-8')
+        cursor = db.execute("SELECT subject FROM triples WHERE predicate = ? AND object = 'PanGene'", (RDF_TYPE,))
+        while True:
+            pangen_ids = [row[0] for row in cursor.fetchmany(batch_size)]
+            if not pangen_ids:
+                break
+            annotations = annotate_genes(db, pangen_ids)
+            yield ''.join(format_record(annotations[pangen_id]) for pangen_id in pangen_ids).encode('utf-8')
+    finally:
+        db.close()
 
-    return sorted_grouped_data, final_group_count
+def gzip_stream(chunks, level=6):
+    """gzip-compresses a stream of byte chunks on the fly, flushing after each chunk so data keeps flowing."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # 31: gzip header and trailer
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
@@ -0,0 +1,199 @@
+"""
+EXPLAIN QUERY PLAN audit of the SQL the web app issues while serving requests.
+
+Usage (from the repository root):
+    python audit_query_plans.py [panres_ontology.db] [--verbose]
+
+Every SQLite connection app.py opens is traced while the script walks the site
+with Flask's test client: the index page, every category list, one details page
+per item type, one related list per predicate, the next/previous pages those
+lists link to, the stats endpoints, the bulk annotation and export APIs and each
+autocomplete backend. The walk is done twice, with the graph snapshot and without
+it, so the SQL paths it replaces (fetch_entities, the role checks, the original
+gene and source database joins) are audited too; rendered pages are not cached,
+so the second walk runs its SQL again. Each distinct statement (literals and IN lists folded by
+app.normalize_sql, so the same query with other ids counts once) is then
+explained against the database, and any plan step that scans a whole table or
+index instead of searching it is reported. Statements run once at
+startup to build the FTS index, the summary tables and the autocomplete index
+read every row by design and are not audited.
+
+Exits with status 1 if any statement outside ALLOWED_SCANS does a full scan, so
+a dropped index or a planner regression fails loudly.
+"""
+import argparse
+import html
+import os
+import re
+import sqlite3
+import sys
+import logging
+from collections import OrderedDict
+from urllib.parse import quote
+
+# Full scans that are known and accepted, with the reason. Matched against the
+# normalized statement text.
+ALLOWED_SCANS = [
+    (re.compile(r"FROM triples WHERE subject (?:LIKE|GLOB) \?"),
+     "direct autocomplete fallback: a substring match on ids cannot use an index"),
+    (re.compile(r"FROM triples WHERE predicate = \? AND object (?:LIKE|GLOB) \?"),
+     "direct autocomplete fallback: a substring match on labels cannot use an index"),
+    (re.compile(r"^SELECT COUNT\(\*\) FROM triples$"),
+     "database fingerprint: counted once per change of the database file, not per request"),
+]
+
+SAMPLE_AUTOCOMPLETE_TERMS = ['pan_1', 'b', 'B', 'Gen', 'amp']
+
+
+def is_query(sql):
+    """SELECTs issued by the app; FTS5's own reads of its shadow tables are left out."""
+    if re.search(r"_(?:config|data|idx|docsize|content)\b", sql):
+        return False
+    return re.match(r"\s*(SELECT|WITH)\b", sql, re.IGNORECASE) is not None
+
+
+class StatementRecorder:
+    """Collects the statements run on every sqlite3 connection opened while active."""
+
+    def __init__(self):
+        self.active = False
+        self.statements = OrderedDict() # normalized -> first expanded statement
+        self._connect = sqlite3.connect
+
+    def install(self):
+        recorder = self
+        def connect(*args, **kwargs):
+            conn = recorder._connect(*args, **kwargs)
+            conn.set_trace_callback(recorder.record)
+            return conn
+        sqlite3.connect = connect
+
+    def record(self, sql):
+        if self.active and is_query(sql):
+            from app import normalize_sql # Imported (with the audited database) before recording starts
+            self.statements.setdefault(normalize_sql(sql), sql)
+
+
+def full_scan_steps(plan_rows, sql):
+    """Plan steps reading a whole table or index. Virtual tables (json_each, FTS5), CTEs and subqueries are fine."""
+    cte_names = {name.lower() for name in re.findall(r"(?:\bWITH(?:\s+RECURSIVE)?|,)\s+(\w+)(?:\s*\([^)]*\))?\s+AS\s+(?:NOT\s+)?(?:MATERIALIZED\s*)?\(", sql, re.IGNORECASE)}
+    steps = []
+    for row in plan_rows:
+        detail = row[3]
+        match = re.match(r"SCAN (\S+)", detail)
+        if not match or 'VIRTUAL TABLE' in detail or 'CONSTANT ROW' in detail:
+            continue
+        name = match.group(1)
+        if name.startswith('(') or name.lower() in cte_names:
+            continue
+        steps.append(detail)
+    return steps
+
+
+def sample_urls(db):
+    """Request paths covering every route and the branches inside them, parameterised from the data."""
+    import app as panres_app
+    urls = ['/', '/cache/stats', '/autocomplete/stats', '/details/__audit_missing_item__']
+    urls += [f"/list/{quote(key)}" for key in panres_app.INDEX_CATEGORIES]
+    # One details page per item type, and the type itself
+    for type_id, item_id in db.execute("SELECT object, MIN(subject) FROM triples WHERE predicate = ? GROUP BY object", (panres_app.RDF_TYPE,)):
+        urls += [f"/details/{quote(item_id)}", f"/details/{quote(type_id)}"]
+    # One related list per linking predicate
+    for predicate, object_value in db.execute("SELECT predicate, MIN(object) FROM triples WHERE object_is_literal = 0 AND predicate != ? GROUP BY predicate", (panres_app.RDF_TYPE,)):
+        urls.append(f"/list/related/{quote(predicate)}/{quote(object_value)}")
+    urls += [f"/autocomplete?q={quote(term)}" for term in SAMPLE_AUTOCOMPLETE_TERMS]
+    return urls
+
+
+def walk_site(panres_app, client, explain_db, urls):
+    """Requests `urls`, the list pages they link to, the APIs and every autocomplete backend; returns the request count."""
+    page_urls = []
+    for url in urls:
+        response = client.get(url)
+        if response.status_code >= 500:
+            print(f"Warning: {url} returned {response.status_code}")
+        # Next/previous page links of the list pages, to cover the keyset queries
+        page_urls += [html.unescape(link) for link in re.findall(r'href="([^"]*[?&](?:after|before)=[^"]*)"', response.get_data(as_text=True))[:2]]
+    for url in page_urls:
+        response = client.get(url)
+        if response.status_code >= 500:
+            print(f"Warning: {url} returned {response.status_code}")
+    # The bulk annotation API, with one ID of every item type and one that doesn't exist
+    annotate_ids = [row[0] for row in explain_db.execute("SELECT MIN(subject) FROM triples WHERE predicate = ? GROUP BY object", (panres_app.RDF_TYPE,))]
+    response = client.post('/api/annotate', json={'ids': annotate_ids + ['__audit_missing_item__']})
+    if response.status_code >= 500:
+        print(f"Warning: POST /api/annotate returned {response.status_code}")
+    # The streaming export, read to the end
+    response = client.get('/api/export/ndjson')
+    response.get_data()
+    if response.status_code >= 500:
+        print(f"Warning: GET /api/export/ndjson returned {response.status_code}")
+    # Every autocomplete backend, not only the configured one
+    with panres_app.app.test_request_context():
+        backends = [panres_app.get_autocomplete_suggestions_direct]
+        if panres_app.is_fts_ready():
+            backends.append(panres_app.get_autocomplete_suggestions_fts)
+        for backend in backends:
+            for term in SAMPLE_AUTOCOMPLETE_TERMS:
+                backend(term)
+    return len(urls) + len(page_urls) + 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('db_file', nargs='?', default=os.environ.get('PANRES_DATABASE', 'panres_ontology.db'))
+    parser.add_argument('--verbose', action='store_true', help="Print the plan of every statement, not just the failing ones")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db_file):
+        print(f"Error: Database '{args.db_file}' not found.")
+        return 1
+    os.environ['PANRES_DATABASE'] = args.db_file
+    os.environ['PANRES_PAGE_CACHE_ENDPOINTS'] = ''
+    recorder = StatementRecorder()
+    recorder.install()
+
+    import app as panres_app
+    logging.disable(logging.INFO)
+
+    explain_db = recorder._connect(f"file:{args.db_file}?mode=ro", uri=True)
+    urls = sample_urls(explain_db)
+
+    recorder.active = True
+    client = panres_app.app.test_client()
+    request_count = walk_site(panres_app, client, explain_db, urls)
+    panres_app.app.config['GRAPH_SNAPSHOT'] = False
+    panres_app.graph_snapshot = None
+    request_count += walk_site(panres_app, client, explain_db, urls)
+    recorder.active = False
+
+    violations = allowed = 0
+    for normalized, sql in recorder.statements.items():
+        try:
+            plan = explain_db.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+        except sqlite3.Error as e:
+            print(f"ERROR explaining: {normalized[:200]}\n    {e}")
+            violations += 1
+            continue
+        scans = full_scan_steps(plan, sql)
+        reason = next((why for pattern, why in ALLOWED_SCANS if pattern.search(normalized)), None) if scans else None
+        if scans and reason is None:
+            violations += 1
+            print(f"FULL SCAN: {normalized[:200]}")
+        elif scans:
+            allowed += 1
+            if args.verbose:
+                print(f"allowed ({reason}): {normalized[:200]}")
+        elif args.verbose:
+            print(f"ok: {normalized[:200]}")
+        if scans and reason is None or args.verbose:
+            for row in plan:
+                print(f"    {row[3]}")
+
+    print(f"{len(recorder.statements)} distinct statements from {request_count} requests against {args.db_file}: "
+          f"{violations} full scan(s), {allowed} allowed")
+    return 1 if violations else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Throughput benchmark for POST /api/annotate.
+
+Usage (from the repository root):
+    PANRES_DATABASE=panres_ontology.db python benchmarks/bench_annotate.py [--ids 10000] [--calls 5] [--seed 1]
+
+Each call posts --ids gene IDs, a random mix of PanGene and OriginalGene IDs from
+the database (repeated if it has fewer genes), through Flask's test client, so the
+figure covers JSON parsing, the SQL, building the records and serialising the
+response, but not the network. Responses are requested uncompressed.
+
+Target on a full PanRes build (one warm worker):
+    ANNOTATE_TARGET_IDS_PER_SECOND IDs/s for calls of 10,000 IDs
+The script exits with status 1 if the median call misses it.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ANNOTATE_TARGET_IDS_PER_SECOND = 10000
+
+
+def sample_ids(db, count, rng):
+    genes = [row[0] for row in db.execute(
+        "SELECT subject FROM triples WHERE predicate = 'rdf:type' AND object IN ('PanGene', 'OriginalGene')")]
+    if not genes:
+        return []
+    rng.shuffle(genes)
+    return [genes[i % len(genes)] for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--ids', type=int, default=10000, help="IDs per call")
+    parser.add_argument('--calls', type=int, default=5, help="Timed calls (median is reported)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    import app as panres_app
+    logging.disable(logging.INFO)
+
+    with panres_app.app.app_context():
+        gene_ids = sample_ids(panres_app.get_db(), args.ids, random.Random(args.seed))
+    if not gene_ids:
+        print("No PanGene or OriginalGene in the database.")
+        return 1
+
+    client = panres_app.app.test_client()
+    timings = []
+    for call in range(args.calls + 1):
+        start = time.perf_counter()
+        response = client.post('/api/annotate', json={'ids': gene_ids}, headers={'Accept-Encoding': 'identity'})
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            print(f"POST /api/annotate returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+            return 1
+        if call: # The first call warms the page cache of SQLite
+            timings.append(elapsed)
+    result = response.get_json()
+
+    median = statistics.median(timings)
+    ids_per_second = len(gene_ids) / median
+    print(f"{len(gene_ids)} IDs per call ({result['found']} found) against {panres_app.DATABASE}: "
+          f"median {median * 1000:.1f} ms, {ids_per_second:,.0f} IDs/s, {len(response.get_data()) / 1e6:.2f} MB response")
+    if ids_per_second < ANNOTATE_TARGET_IDS_PER_SECOND:
+        print(f"FAIL: below target ({ANNOTATE_TARGET_IDS_PER_SECOND:,} IDs/s)")
+        return 1
+    print(f"OK: within target ({ANNOTATE_TARGET_IDS_PER_SECOND:,} IDs/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Latency benchmark for /autocomplete: in-memory index and FTS5-backed lookup vs the
+direct triples scan.
+
+Usage (from the repository root):
+    PANRES_DATABASE=panres_ontology.db python benchmarks/bench_autocomplete.py [--terms 2000] [--seed 1]
+
+Terms are sampled from real subject IDs and labels, truncated to 1-6 characters
+(short prefixes dominate, as they are what the index page sends on every keystroke),
+with a random case flip on some of them so both the case-sensitive and the
+case-insensitive branches are exercised.
+
+Targets for the FTS path on a full PanRes build (one warm worker, no network):
+    p50 <= AUTOCOMPLETE_P50_TARGET_MS, p99 <= AUTOCOMPLETE_P99_TARGET_MS
+The script exits with status 1 if the FTS path misses either target. The memory
+path is timed with its per-term result cache disabled.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+AUTOCOMPLETE_P50_TARGET_MS = 10.0
+AUTOCOMPLETE_P99_TARGET_MS = 25.0
+
+
+def sample_terms(db, count, rng):
+    keys = [row[0] for row in db.execute("SELECT DISTINCT subject FROM triples")]
+    keys += [row[0] for row in db.execute("SELECT object FROM triples WHERE predicate = 'rdfs:label'")]
+    terms = []
+    for _ in range(count):
+        key = rng.choice(keys)
+        term = key[:rng.choice([1, 1, 2, 2, 3, 3, 4, 5, 6])]
+        if rng.random() < 0.3:
+            term = term.swapcase()
+        terms.append(term)
+    return terms
+
+
+def time_calls(func, terms):
+    timings_ms = []
+    for term in terms:
+        start = time.perf_counter()
+        func(term)
+        timings_ms.append((time.perf_counter() - start) * 1000)
+    return timings_ms
+
+
+def summarize(timings_ms):
+    ordered = sorted(timings_ms)
+    return {
+        'p50': statistics.median(ordered),
+        'p99': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+        'mean': statistics.fmean(ordered),
+        'max': ordered[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--terms', type=int, default=2000, help="Number of sampled search terms")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    import app as panres_app
+    logging.disable(logging.INFO) # The direct path logs every call at INFO
+
+    rng = random.Random(args.seed)
+    with panres_app.app.test_request_context():
+        if not panres_app.is_fts_ready():
+            print("FTS index is not built; cannot benchmark the FTS path.")
+            return 1
+        terms = sample_terms(panres_app.get_db(), args.terms, rng)
+
+        backends = [('direct', panres_app.get_autocomplete_suggestions_direct),
+                    ('fts', panres_app.get_autocomplete_suggestions_fts)]
+        if panres_app.autocomplete_index is not None:
+            panres_app.app.config['AUTOCOMPLETE_RESULT_CACHE_SIZE'] = 0
+            backends.append(('memory', panres_app.get_autocomplete_suggestions_memory))
+
+        results = {}
+        for name, func in backends:
+            func(terms[0]) # Warm up
+            results[name] = summarize(time_calls(func, terms))
+
+    print(f"{len(terms)} terms against {panres_app.DATABASE}")
+    print(f"{'backend':<8} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'max ms':>9}")
+    for name, stats in results.items():
+        print(f"{name:<8} {stats['p50']:>9.2f} {stats['p99']:>9.2f} {stats['mean']:>9.2f} {stats['max']:>9.2f}")
+
+    fts = results['fts']
+    if fts['p50'] > AUTOCOMPLETE_P50_TARGET_MS or fts['p99'] > AUTOCOMPLETE_P99_TARGET_MS:
+        print(f"FAIL: FTS path misses target (p50 <= {AUTOCOMPLETE_P50_TARGET_MS} ms, p99 <= {AUTOCOMPLETE_P99_TARGET_MS} ms)")
+        return 1
+    print(f"OK: FTS path within target (p50 <= {AUTOCOMPLETE_P50_TARGET_MS} ms, p99 <= {AUTOCOMPLETE_P99_TARGET_MS} ms)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
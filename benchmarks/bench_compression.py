@@ -0,0 +1,104 @@
+"""
+Bytes saved and CPU spent by response compression, per page and encoding.
+
+Usage (from the repository root):
+    PANRES_DATABASE=panres_ontology.db python benchmarks/bench_compression.py [--repeat 20]
+
+For each sample response (the index page, the PanRes Genes list, the largest
+details and related-list pages, and autocomplete for short prefixes, which return
+up to 500 suggestions) and each encoding the app offers (gzip, and br when the
+brotli package is installed), this prints the size as rendered and compressed
+and the CPU time of compressing it once (what a page cache miss or an uncached
+response pays). The last column is the median time of a page cache hit for that
+encoding, which serves the cached compressed bytes without compressing again.
+Autocomplete responses are not page-cached, so they pay the compression
+cost on every request.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import logging
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def sample_urls(db, panres_app):
+    urls = ['/', '/list/PanRes%20Genes']
+    row = db.execute("SELECT object FROM triples WHERE predicate = ? GROUP BY object ORDER BY COUNT(*) DESC LIMIT 1",
+                     (panres_app.IS_FROM_DATABASE,)).fetchone()
+    if row:
+        urls += [f"/details/{quote(row[0])}", f"/list/related/{quote(panres_app.IS_FROM_DATABASE)}/{quote(row[0])}"]
+    urls += ['/autocomplete?q=bla', '/autocomplete?q=pan']
+    return urls
+
+
+def median_ms(func, repeat):
+    """Median CPU time of func() in ms."""
+    timings = []
+    for _ in range(repeat):
+        start = time.process_time()
+        func()
+        timings.append((time.process_time() - start) * 1000)
+    return statistics.median(timings)
+
+
+def median_wall_ms(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=20, help="Timed runs per measurement (median is reported)")
+    args = parser.parse_args()
+
+    import app as panres_app
+    logging.disable(logging.INFO)
+    encodings = panres_app.app.config['COMPRESSION_ENCODINGS']
+    if not encodings:
+        print("Compression is turned off (PANRES_COMPRESSION is empty).")
+        return 1
+
+    client = panres_app.app.test_client()
+    with panres_app.app.app_context():
+        urls = sample_urls(panres_app.get_db(), panres_app)
+
+    print(f"{'response':<44} {'encoding':<9} {'bytes':>9} {'saved':>7} {'compress ms':>12} {'cache hit ms':>13}")
+    totals = {encoding: [0, 0, 0.0] for encoding in encodings} # raw bytes, encoded bytes, compress ms
+    for url in urls:
+        response = client.get(url, headers={'Accept-Encoding': 'identity'})
+        body = response.get_data()
+        cached = 'X-Page-Cache' in response.headers
+        hit_ms = median_wall_ms(lambda: client.get(url, headers={'Accept-Encoding': 'identity'}), args.repeat) if cached else None
+        print(f"{url[:44]:<44} {'identity':<9} {len(body):>9} {'':>7} {'':>12} {f'{hit_ms:.2f}' if cached else '-':>13}")
+        if len(body) < panres_app.app.config['COMPRESSION_MIN_BYTES']:
+            continue
+        for encoding in encodings:
+            with panres_app.app.app_context():
+                encoded = panres_app.compress_body(body, encoding)
+                compress_ms = median_ms(lambda: panres_app.compress_body(body, encoding), args.repeat)
+            headers = {'Accept-Encoding': encoding}
+            client.get(url, headers=headers) # Puts the variant in the page cache
+            hit_ms = median_wall_ms(lambda: client.get(url, headers=headers), args.repeat) if cached else None
+            saved = 1 - len(encoded) / len(body)
+            print(f"{'':<44} {encoding:<9} {len(encoded):>9} {saved:>7.1%} {compress_ms:>12.2f} {f'{hit_ms:.2f}' if cached else '-':>13}")
+            totals[encoding][0] += len(body)
+            totals[encoding][1] += len(encoded)
+            totals[encoding][2] += compress_ms
+
+    for encoding, (raw, encoded, compress_ms) in totals.items():
+        if raw:
+            print(f"{encoding}: {raw} -> {encoded} bytes over the sample ({1 - encoded / raw:.1%} saved), "
+                  f"{compress_ms:.2f} ms CPU to compress all of it once")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Latency of multi-hop questions on the graph snapshot's adjacency arrays vs SQL joins.
+
+Usage (from the repository root):
+    PANRES_DATABASE=panres_ontology.db python benchmarks/bench_graph_index.py [--samples 200] [--seed 1]
+
+Three questions, each asked for --samples random PanGenes, source databases or
+resistance classes:
+    pangene_databases            PanGene -same_as-> OriginalGene -is_from_database-> database
+    database_gene_classes        database <-is_from_database- OriginalGene -has_resistance_class-> class
+    class_pangenes_by_database   class <-has_resistance_class- PanGene -same_as-> OriginalGene -is_from_database-> database
+Each is answered by the GraphSnapshot method of that name and by the equivalent
+self-join on a warm connection. The answers are compared, and the script exits
+with status 1 if any differ.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import logging
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PANGENE_DATABASES_SQL = """
+    SELECT DISTINCT D.object
+    FROM triples S
+    JOIN triples O ON O.subject = S.object AND O.predicate = 'rdf:type' AND O.object = 'OriginalGene'
+    JOIN triples D ON D.subject = S.object AND D.predicate = 'is_from_database'
+    WHERE S.subject = ? AND S.predicate = 'same_as'
+"""
+DATABASE_GENE_CLASSES_SQL = """
+    SELECT T1.subject, C.object
+    FROM triples T1
+    JOIN triples T2 ON T2.subject = T1.subject AND T2.predicate = 'rdf:type' AND T2.object = 'OriginalGene'
+    LEFT JOIN triples C ON C.subject = T1.subject AND C.predicate = 'has_resistance_class'
+    WHERE T1.predicate = 'is_from_database' AND T1.object = ?
+"""
+CLASS_PANGENES_BY_DATABASE_SQL = """
+    SELECT DISTINCT D.object, P.subject
+    FROM triples P
+    JOIN triples T ON T.subject = P.subject AND T.predicate = 'rdf:type' AND T.object = 'PanGene'
+    JOIN triples S ON S.subject = P.subject AND S.predicate = 'same_as'
+    JOIN triples O ON O.subject = S.object AND O.predicate = 'rdf:type' AND O.object = 'OriginalGene'
+    JOIN triples D ON D.subject = S.object AND D.predicate = 'is_from_database'
+    WHERE P.predicate = 'has_resistance_class' AND P.object = ?
+"""
+
+
+def sql_pangene_databases(db, pangen_id):
+    return {row[0] for row in db.execute(PANGENE_DATABASES_SQL, (pangen_id,))}
+
+
+def sql_database_gene_classes(db, database_id):
+    gene_classes = defaultdict(set)
+    for gene_id, class_id in db.execute(DATABASE_GENE_CLASSES_SQL, (database_id,)):
+        gene_classes[gene_id].update([class_id] if class_id is not None else [])
+    return dict(gene_classes)
+
+
+def sql_class_pangenes_by_database(db, class_id):
+    grouped = defaultdict(set)
+    for database_id, pangen_id in db.execute(CLASS_PANGENES_BY_DATABASE_SQL, (class_id,)):
+        grouped[database_id].add(pangen_id)
+    return dict(grouped)
+
+
+def as_sets(answer):
+    """Order-free form of a snapshot answer, to compare with the SQL one."""
+    if isinstance(answer, dict):
+        return {key: set(values) for key, values in answer.items()}
+    return set(answer)
+
+
+def time_calls(function, arguments):
+    timings, answers = [], []
+    for argument in arguments:
+        start = time.perf_counter()
+        answers.append(function(argument))
+        timings.append((time.perf_counter() - start) * 1e6)
+    return timings, answers
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    return statistics.median(ordered), ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--samples', type=int, default=200, help="Items asked about per question")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    import app as panres_app
+    logging.disable(logging.INFO)
+
+    snapshot = panres_app.graph_snapshot
+    if snapshot is None:
+        print("No graph snapshot (PANRES_GRAPH_SNAPSHOT=0, or it failed to build).")
+        return 1
+    stats = snapshot.stats()
+    print(f"Snapshot: {stats['nodes']} nodes, {sum(stats['links'].values())} links, "
+          f"{stats['total_mb']} MB, built in {stats['build_seconds']}s")
+
+    rng = random.Random(args.seed)
+    db = panres_app.db_pool.open_connection()
+    def sample(query):
+        values = [row[0] for row in db.execute(query)]
+        return [rng.choice(values) for _ in range(args.samples)] if values else []
+    questions = [
+        ('pangene_databases', sql_pangene_databases,
+         sample("SELECT subject FROM triples WHERE predicate = 'rdf:type' AND object = 'PanGene'")),
+        ('database_gene_classes', sql_database_gene_classes,
+         sample("SELECT DISTINCT object FROM triples WHERE predicate = 'is_from_database'")),
+        ('class_pangenes_by_database', sql_class_pangenes_by_database,
+         sample("SELECT DISTINCT object FROM triples WHERE predicate = 'has_resistance_class'")),
+    ]
+
+    mismatches = 0
+    print(f"{'question':28} {'snapshot p50 us':>16} {'p99 us':>9} {'SQL p50 us':>11} {'p99 us':>9}")
+    for name, sql_function, arguments in questions:
+        if not arguments:
+            print(f"{name:28} (nothing to sample)")
+            continue
+        sql_function(db, arguments[0]) # Warm the connection's page cache
+        snapshot_timings, snapshot_answers = time_calls(getattr(snapshot, name), arguments)
+        sql_timings, sql_answers = time_calls(lambda argument: sql_function(db, argument), arguments)
+        mismatches += sum(as_sets(a) != b for a, b in zip(snapshot_answers, sql_answers))
+        snapshot_p50, snapshot_p99 = summarize(snapshot_timings)
+        sql_p50, sql_p99 = summarize(sql_timings)
+        print(f"{name:28} {snapshot_p50:16.1f} {snapshot_p99:9.1f} {sql_p50:11.1f} {sql_p99:9.1f}")
+    db.close()
+
+    if mismatches:
+        print(f"FAIL: {mismatches} answers differ between the snapshot and SQL")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+Scaling regression benchmark for the PanGene-wide queries: the index page
+distributions, the PanGene and source database lists, the "also called" lookup
+and the FTS rebuild, on a database and on a copy of it with N times the genes.
+
+Usage (from the repository root):
+    python owl2sqlite.py panres_v2.owl panres_ontology.db
+    python benchmarks/bench_pangene_queries.py panres_ontology.db [--scale 10] [--repeat 3]
+
+The scaled copy is written next to the work files (--work-dir, a temporary
+directory by default). Every PanGene and OriginalGene is cloned scale-1 times
+with a suffixed ID, keeping its labels, classes, phenotypes and databases and
+pointing its same_as at the matching clone, so each category, class and database
+gets scale times as many genes. Only text-layout databases can be scaled.
+
+Each database is measured in a fresh process with SQLite's variable limit
+lowered to 999, the default of many SQLite builds, so any query that still binds
+one parameter per gene fails here instead of in production, and with the label
+cache off, which would otherwise hold every label of the small database but not
+of the scaled one. The script exits
+with status 1 if a case fails on either database, or if its time grows more than
+MAX_GROWTH_FACTOR times faster than the number of genes.
+"""
+import argparse
+import gc
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import logging
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MAX_GROWTH_FACTOR = 2.0
+SQLITE_VARIABLE_LIMIT = 999
+GENE_TYPES = ('PanGene', 'OriginalGene')
+
+
+def build_scaled_copy(source_db, scaled_db, scale):
+    """Copies source_db to scaled_db with every gene cloned scale-1 times."""
+    import owl2sqlite
+
+    source = sqlite3.connect(source_db)
+    conn = sqlite3.connect(scaled_db)
+    source.backup(conn)
+    source.close()
+    cursor = conn.cursor()
+    if owl2sqlite.get_triple_store_schema(cursor) != 'text':
+        conn.close()
+        raise ValueError(f"'{source_db}' is not a text-layout database; rebuild it with --schema text to scale it")
+
+    cursor.execute("CREATE TEMP TABLE genes (id TEXT PRIMARY KEY)")
+    cursor.execute(f"""
+        INSERT OR IGNORE INTO genes SELECT subject FROM triples
+        WHERE predicate = 'rdf:type' AND object IN ({','.join('?' * len(GENE_TYPES))})
+    """, GENE_TYPES)
+    for copy_number in range(1, scale):
+        suffix = f"_x{copy_number}"
+        cursor.execute("""
+            INSERT INTO Triples (subject, predicate, object, object_is_literal, object_datatype)
+            SELECT T.subject || :suffix, T.predicate,
+                   CASE WHEN T.object_is_literal = 0 AND T.object IN (SELECT id FROM temp.genes) THEN T.object || :suffix ELSE T.object END,
+                   T.object_is_literal, T.object_datatype
+            FROM Triples T JOIN temp.genes G ON G.id = T.subject
+            ORDER BY T.rowid
+        """, {'suffix': suffix})
+    cursor.execute("ANALYZE")
+    conn.commit()
+    gene_count = cursor.execute("SELECT COUNT(*) FROM temp.genes").fetchone()[0]
+    conn.close()
+    return gene_count * scale
+
+
+def limit_variables(limit):
+    """Makes every connection opened from here on refuse more than `limit` bound parameters."""
+    connect = sqlite3.connect
+    def limited_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, limit)
+        return conn
+    sqlite3.connect = limited_connect
+
+
+def time_call(func, repeat):
+    """Median of `repeat` runs, with the garbage collector off while timing (as timeit does)."""
+    timings_ms = []
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            func()
+            timings_ms.append((time.perf_counter() - start) * 1000)
+        finally:
+            gc.enable()
+    return statistics.median(timings_ms)
+
+
+def measure(db_file, repeat):
+    """Runs every case against db_file in this process; returns {case: {'ms': ..} or {'error': ..}}."""
+    limit_variables(SQLITE_VARIABLE_LIMIT)
+    os.environ['PANRES_DATABASE'] = db_file
+    os.environ['PANRES_LABEL_CACHE_SIZE'] = '0' # Every run resolves its labels from the database
+    import app as panres_app
+    logging.disable(logging.INFO)
+
+    conn = sqlite3.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    pangen_ids = [row[0] for row in conn.execute(
+        "SELECT subject FROM triples WHERE predicate = ? AND object = 'PanGene' ORDER BY rowid", (panres_app.RDF_TYPE,))]
+    subject_ids = [row[0] for row in conn.execute("SELECT DISTINCT subject FROM triples")]
+    largest_database = conn.execute(
+        "SELECT object FROM triples WHERE predicate = ? GROUP BY object ORDER BY COUNT(*) DESC LIMIT 1",
+        (panres_app.IS_FROM_DATABASE,)).fetchone()[0]
+    client = panres_app.app.test_client()
+
+    def get(url):
+        def run():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {url} returned {response.status_code}")
+        return run
+
+    def original_info():
+        with panres_app.app.test_request_context():
+            panres_app.get_pangen_original_info(pangen_ids)
+
+    def fts_rows():
+        cur = conn.cursor()
+        labels = panres_app.fetch_fts_labels(cur, subject_ids)
+        panres_app.get_search_fts_rows(cur, subject_ids, labels)
+
+    cases = [
+        ('distribution counts', lambda: panres_app.compute_pangen_distribution_counts(conn)),
+        ('PanGenes by class', lambda: panres_app.fetch_list_groups(conn, panres_app.HAS_RESISTANCE_CLASS)),
+        ('also called, all PanGenes', original_info),
+        ('FTS rows, all subjects', fts_rows),
+        ('PanRes Genes list page', get('/list/PanRes%20Genes')),
+        ('source database details', get(f"/details/{quote(largest_database)}")),
+        ('source database list page', get(f"/list/related/{quote(panres_app.IS_FROM_DATABASE)}/{quote(largest_database)}")),
+    ]
+    results = {}
+    for name, func in cases:
+        try:
+            func() # Warm up
+            results[name] = {'ms': time_call(func, repeat)}
+        except Exception as e:
+            results[name] = {'error': f"{type(e).__name__}: {e}"}
+    conn.close()
+    return results
+
+
+def run_measure_process(db_file, repeat):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), db_file, '--measure', '--repeat', str(repeat)],
+                            capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(f"measuring {db_file} failed:\n{output.stderr}")
+    return json.loads(output.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('db_file', nargs='?', default=os.environ.get('PANRES_DATABASE', 'panres_ontology.db'))
+    parser.add_argument('--scale', type=int, default=10, help="Gene count multiplier of the scaled copy")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case (median is reported)")
+    parser.add_argument('--work-dir', help="Where the scaled copy is written (default: a temporary directory, removed afterwards)")
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS) # Child process: time db_file, print JSON
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.db_file, args.repeat)))
+        return 0
+    if not os.path.exists(args.db_file):
+        print(f"Error: Database '{args.db_file}' not found.")
+        return 1
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='panres_bench_')
+    try:
+        base_db = os.path.join(work_dir, 'base.db')
+        scaled_db = os.path.join(work_dir, f"scaled_x{args.scale}.db")
+        base_genes = build_scaled_copy(args.db_file, base_db, 1)
+        start = time.perf_counter()
+        scaled_genes = build_scaled_copy(args.db_file, scaled_db, args.scale)
+        print(f"{base_genes} genes -> {scaled_genes} genes in {scaled_db} ({time.perf_counter() - start:.1f}s)")
+
+        base = run_measure_process(base_db, args.repeat)
+        scaled = run_measure_process(scaled_db, args.repeat)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    growth_limit = args.scale * MAX_GROWTH_FACTOR
+    print(f"{'':<30} {'x1 ms':>10} {f'x{args.scale} ms':>10} {'ratio':>7}")
+    failures = 0
+    for name in base:
+        if 'error' in base[name] or 'error' in scaled[name]:
+            failures += 1
+            print(f"{name:<30} FAILED: {base[name].get('error') or scaled[name].get('error')}")
+            continue
+        base_ms, scaled_ms = base[name]['ms'], scaled[name]['ms']
+        ratio = scaled_ms / base_ms if base_ms else float('inf')
+        flag = ''
+        if ratio > growth_limit:
+            failures += 1
+            flag = ' SUPERLINEAR'
+        print(f"{name:<30} {base_ms:>10.2f} {scaled_ms:>10.2f} {ratio:>7.1f}{flag}")
+
+    if failures:
+        print(f"FAIL: {failures} case(s) failed or grew more than {growth_limit:g}x at {args.scale}x the genes")
+        return 1
+    print(f"OK: every case within {growth_limit:g}x at {args.scale}x the genes")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
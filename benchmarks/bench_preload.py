@@ -0,0 +1,167 @@
+"""
+Per-worker memory of the gunicorn deployment, with and without PANRES_PRELOAD.
+
+Usage (from the repository root, Linux only):
+    PANRES_DATABASE=panres_ontology.db python benchmarks/bench_preload.py [--workers 4] [--requests 400] [--modes 0,1] [--json]
+
+For each mode the script starts gunicorn as the Procfile does (gunicorn.conf.py,
+sync workers) on a free local port with PANRES_PRELOAD set to that mode, waits for
+the workers' memory to settle and reads /proc/<pid>/smaps_rollup of the master and
+every worker: once idle ("boot") and once more after --requests GETs spread over
+details pages, category lists and autocomplete ("warm"). Reported per worker:
+RSS, PSS (shared pages divided among the processes sharing them) and USS (pages
+only that worker holds). With preload, what the master built stays shared and
+only USS grows per worker; the PSS total over all workers is the memory the site
+really uses.
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def read_memory(pid):
+    """{'rss_mb', 'pss_mb', 'uss_mb'} of a process, from smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss_mb': round(fields['Rss'] / 1024, 1),
+        'pss_mb': round(fields['Pss'] / 1024, 1),
+        'uss_mb': round((fields['Private_Clean'] + fields['Private_Dirty']) / 1024, 1),
+    }
+
+
+def worker_pids(master_pid):
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+        return sorted(int(pid) for pid in f.read().split())
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers={'Connection': 'close'}), timeout=60) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def wait_until_settled(master_pid, workers, base_url, timeout=300):
+    """Waits for `workers` workers to be up and their combined RSS to stop growing."""
+    deadline = time.time() + timeout
+    previous = None
+    while time.time() < deadline:
+        time.sleep(1)
+        try:
+            pids = worker_pids(master_pid)
+            if len(pids) < workers or get(base_url + '/cache/stats') != 200:
+                continue
+            total = sum(read_memory(pid)['rss_mb'] for pid in pids)
+        except (OSError, urllib.error.URLError):
+            continue
+        if previous is not None and abs(total - previous) < 0.5:
+            return pids
+        previous = total
+    raise RuntimeError("gunicorn did not settle in time")
+
+
+def sample_urls(db_path, count, rng):
+    import app as panres_app
+    db = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        subjects = [row[0] for row in db.execute("SELECT DISTINCT subject FROM triples")]
+        labels = [row[0] for row in db.execute("SELECT object FROM triples WHERE predicate = 'rdfs:label' LIMIT 1000")]
+    finally:
+        db.close()
+    urls = [f"/list/{quote(key)}" for key in panres_app.INDEX_CATEGORIES]
+    while len(urls) < count:
+        if labels and rng.random() < 0.2:
+            urls.append(f"/autocomplete?q={quote(rng.choice(labels)[:3])}")
+        else:
+            urls.append(f"/details/{quote(rng.choice(subjects))}")
+    return urls[:count]
+
+
+def measure(master_pid, pids):
+    return {
+        'master': read_memory(master_pid),
+        'workers': [read_memory(pid) for pid in pids],
+    }
+
+
+def run_mode(preload, args, urls):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', str(args.workers),
+         '--bind', f"127.0.0.1:{port}", 'app:app'],
+        cwd=REPO_ROOT, env=dict(os.environ, PANRES_PRELOAD=preload), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        pids = wait_until_settled(server.pid, args.workers, base_url)
+        result = {'boot': measure(server.pid, pids)}
+        for url in urls:
+            get(base_url + url)
+        result['warm'] = measure(server.pid, wait_until_settled(server.pid, args.workers, base_url))
+        return result
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+
+def print_results(results):
+    for mode, phases in results.items():
+        for phase, memory in phases.items():
+            workers = memory['workers']
+            print(f"PANRES_PRELOAD={mode} {phase:4}  master RSS {memory['master']['rss_mb']:7.1f} MB;  per worker "
+                  f"RSS {max(w['rss_mb'] for w in workers):7.1f}  PSS {max(w['pss_mb'] for w in workers):7.1f}  "
+                  f"USS {max(w['uss_mb'] for w in workers):7.1f} MB (max);  "
+                  f"PSS of all workers {sum(w['pss_mb'] for w in workers):7.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=400, help="GETs sent between the boot and warm measurements")
+    parser.add_argument('--modes', default='0,1', help="PANRES_PRELOAD values to compare")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help="Print the raw measurements as JSON")
+    args = parser.parse_args()
+
+    db_path = os.environ.get('PANRES_DATABASE', 'panres_ontology.db')
+    if not os.path.exists(db_path):
+        print(f"Error: Database '{db_path}' not found.")
+        return 1
+    os.environ['PANRES_DATABASE'] = os.path.abspath(db_path)
+    urls = sample_urls(os.environ['PANRES_DATABASE'], args.requests, random.Random(args.seed))
+
+    results = {mode: run_mode(mode, args, urls) for mode in args.modes.split(',')}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
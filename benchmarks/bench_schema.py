@@ -0,0 +1,129 @@
+"""
+Size and latency comparison of the two owl2sqlite storage layouts.
+
+Usage (from the repository root):
+    python owl2sqlite.py panres_v2.owl text.db
+    python owl2sqlite.py panres_v2.owl dictionary.db --schema dictionary
+    python benchmarks/bench_schema.py text.db dictionary.db [--repeat 5]
+
+Both databases must come from the same OWL file. Every query is one the web app
+issues against 'triples' (label lookups, the batched resolver, and the joins in
+get_subjects_grouped_by_objects and get_pangen_distribution_data), run unchanged
+against the 'Triples' table of the text layout and the 'Triples' view of the
+dictionary layout. Results are checked to be identical before timings are shown.
+The resolver picks the first label and type stored for an ID, and the order
+triples are stored in follows rdflib's graph iteration, which depends on the hash
+seed of the conversion; for it the (ID, label) and (ID, type) pairs of the same
+IDs are compared instead, so two builds made with different seeds agree.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+
+def build_cases(db, rng):
+    """
+    Query cases parameterised from the data itself, so they work on any PanRes build:
+    (name, sql, param_sets, check_sql), where check_sql, if set, is the
+    order-independent query whose rows are compared between the layouts instead.
+    """
+    subjects = [row[0] for row in db.execute("SELECT DISTINCT subject FROM triples")]
+    pangenes = [row[0] for row in db.execute("SELECT subject FROM triples WHERE predicate = 'rdf:type' AND object = 'PanGene'")]
+    classes = [row[0] for row in db.execute("SELECT subject FROM triples WHERE predicate = 'rdf:type' AND object = 'AntibioticResistanceClass'")]
+    originals = [row[0] for row in db.execute("SELECT object FROM triples WHERE predicate = 'same_as' LIMIT 900")]
+    label_ids = rng.sample(subjects, min(200, len(subjects)))
+    resolve_ids = rng.sample(subjects, min(2000, len(subjects)))
+
+    return [
+        ('label lookup x200',
+         "SELECT object FROM triples WHERE subject = ? AND predicate = 'rdfs:label'",
+         [(item_id,) for item_id in label_ids], None),
+        ('resolver (2000 ids)',
+         """SELECT ids.value AS id,
+                   (SELECT object FROM triples WHERE subject = ids.value AND +predicate = 'rdfs:label' ORDER BY rowid LIMIT 1) AS label,
+                   (SELECT object FROM triples WHERE subject = ids.value AND +predicate = 'rdf:type' ORDER BY rowid LIMIT 1) AS primary_type
+            FROM json_each(?) AS ids""",
+         [(json.dumps(resolve_ids),)],
+         """SELECT subject, predicate, object FROM triples
+            WHERE subject IN (SELECT value FROM json_each(?)) AND predicate IN ('rdfs:label', 'rdf:type')"""),
+        ('pangenes by class (join)',
+         f"""SELECT T1.subject, T1.object FROM triples T1
+            JOIN triples T2 ON T1.subject = T2.subject
+            WHERE T1.predicate = 'has_resistance_class' AND T1.object IN ({','.join('?' * len(classes))})
+              AND T2.predicate = 'rdf:type' AND T2.object = 'PanGene'""",
+         [tuple(classes)], None),
+        ('databases of originals (join)',
+         f"""SELECT T1.subject, T1.object FROM triples T1
+            JOIN triples T2 ON T1.subject = T2.subject
+            WHERE T1.predicate = 'is_from_database' AND T1.subject IN ({','.join('?' * len(originals))})
+              AND T2.predicate = 'rdf:type' AND T2.object = 'OriginalGene'""",
+         [tuple(originals)], None),
+        ('same_as of 500 pangenes',
+         f"SELECT subject, object FROM triples WHERE predicate = 'same_as' AND subject IN ({','.join('?' * min(500, len(pangenes)))})",
+         [tuple(pangenes[:500])], None),
+        ('all labels scan',
+         "SELECT subject, object FROM triples WHERE predicate = 'rdfs:label' ORDER BY rowid",
+         [()], None),
+    ]
+
+
+def run_case(db, sql, param_sets):
+    rows = []
+    for params in param_sets:
+        rows.extend(db.execute(sql, params).fetchall())
+    return rows
+
+
+def time_case(db, sql, param_sets, repeat):
+    timings_ms = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_case(db, sql, param_sets)
+        timings_ms.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings_ms)
+
+
+def describe_file(db, path):
+    page_size = db.execute("PRAGMA page_size").fetchone()[0]
+    page_count = db.execute("PRAGMA page_count").fetchone()[0]
+    return os.path.getsize(path), page_count, page_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('text_db', help="Database built with --schema text")
+    parser.add_argument('dictionary_db', help="Database built with --schema dictionary")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per query (median is reported)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    text_db = sqlite3.connect(args.text_db)
+    dictionary_db = sqlite3.connect(args.dictionary_db)
+    cases = build_cases(text_db, random.Random(args.seed))
+
+    print(f"{'':<32} {'text':>14} {'dictionary':>14} {'ratio':>7}")
+    text_size, text_pages, page_size = describe_file(text_db, args.text_db)
+    dict_size, dict_pages, _ = describe_file(dictionary_db, args.dictionary_db)
+    print(f"{'file size (MB)':<32} {text_size / 1e6:>14.2f} {dict_size / 1e6:>14.2f} {dict_size / text_size:>7.2f}")
+    print(f"{f'pages ({page_size} B)':<32} {text_pages:>14} {dict_pages:>14} {dict_pages / text_pages:>7.2f}")
+
+    mismatches = 0
+    for name, sql, param_sets, check_sql in cases:
+        check_sql = check_sql or sql
+        if sorted(run_case(text_db, check_sql, param_sets)) != sorted(run_case(dictionary_db, check_sql, param_sets)):
+            print(f"MISMATCH: '{name}' returns different rows on the two layouts")
+            mismatches += 1
+            continue
+        text_ms = time_case(text_db, sql, param_sets, args.repeat)
+        dict_ms = time_case(dictionary_db, sql, param_sets, args.repeat)
+        print(f"{name + ' (ms)':<32} {text_ms:>14.2f} {dict_ms:>14.2f} {dict_ms / text_ms:>7.2f}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
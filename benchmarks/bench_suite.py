@@ -0,0 +1,372 @@
+"""
+End-to-end benchmark suite on synthetic PanRes-shaped ontologies, with JSON output.
+
+Usage (from the repository root):
+    python benchmarks/bench_suite.py [--triples 10000,100000,1000000] [--repeat 5] [--output run.json]
+    python benchmarks/bench_suite.py --compare before.json after.json
+
+For every scale in --triples (10k up to 10M), an RDF/XML file with about that many
+triples is generated in the PanRes shape: PanGenes with lengths, resistance
+classes, predicted phenotypes and same_as links to OriginalGenes, which carry a
+label and the database they come from, plus the class, phenotype and database
+entities and the OWL declarations. Class and phenotype use is skewed the way the
+real ontology's is, so a few classes hold most genes. The same --seed gives the
+same file.
+
+Then, per scale:
+    convert_owl_to_sqlite   the OWL -> SQLite load (--loader, streaming by default;
+                            'rdflib' parses the whole graph in memory first)
+    app startup             importing app.py: FTS index, summary tables, autocomplete index
+    create_and_populate_fts a full FTS rebuild
+    get_item_details        for a PanGene, an OriginalGene, the largest class and database
+    grouped PanGene lists   fetch_list_groups per GROUPING_PREDICATES entry, and the
+                            grouped list pages through the test client
+    get_pangen_distribution_data
+    /autocomplete           through the Flask test client, for a few prefixes
+
+The app is measured in a fresh process per database, with the label and page
+caches and the graph snapshot off, so each figure is the uncached SQL cost. The results (medians and minima
+in ms, database and OWL sizes, triple and gene counts, and the Python, SQLite and
+git versions) are printed and written to --output. --compare prints the ratio of
+every shared figure between two such files.
+"""
+import argparse
+import contextlib
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import logging
+from urllib.parse import quote
+from xml.sax.saxutils import escape, quoteattr
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+NAMESPACE = 'http://myonto.com/PanResOntology.owl#'
+RDF_NS = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+OWL_NS = 'http://www.w3.org/2002/07/owl#'
+XSD_INTEGER = 'http://www.w3.org/2001/XMLSchema#integer'
+
+RESISTANCE_CLASSES = ['aminoglycoside', 'beta_lactam', 'colistin', 'fosfomycin', 'fusidic_acid', 'glycopeptide',
+                      'lincosamide', 'macrolide', 'nitroimidazole', 'oxazolidinone', 'phenicol', 'pleuromutilin',
+                      'quinolone', 'rifamycin', 'streptogramin_a', 'streptogramin_b', 'sulphonamide', 'tetracycline',
+                      'trimethoprim', 'multidrug', 'biocide', 'metal']
+PHENOTYPE_STEMS = ['amikacin', 'ampicillin', 'azithromycin', 'aztreonam', 'cefepime', 'cefotaxime', 'ceftazidime',
+                   'chloramphenicol', 'ciprofloxacin', 'clindamycin', 'colistin', 'doxycycline', 'ertapenem',
+                   'erythromycin', 'florfenicol', 'fosfomycin', 'gentamicin', 'imipenem', 'kanamycin', 'linezolid',
+                   'meropenem', 'nalidixic_acid', 'neomycin', 'piperacillin', 'rifampicin', 'streptomycin',
+                   'sulfamethoxazole', 'teicoplanin', 'tetracycline', 'tigecycline', 'tobramycin', 'trimethoprim',
+                   'vancomycin']
+DATABASES = ['ResFinder', 'ResFinderFG', 'CARD', 'MegaRes', 'ARGANNOT', 'AMRFinderPlus', 'BacMet', 'functional_amr',
+             'CSABAPI', 'NCBI', 'Kleborate', 'ResfinderFG2']
+GENE_PREFIXES = ['bla', 'aac', 'aph', 'ant', 'tet', 'erm', 'mph', 'van', 'mcr', 'sul', 'qnr', 'dfr', 'cat', 'fos', 'lnu']
+# Average triples per PanGene the generator writes, including its OriginalGenes
+TRIPLES_PER_PANGENE = 15.9
+AUTOCOMPLETE_TERMS = ['bla', 'tet', 'pan_1', 'amino', 'ResF', 'x']
+
+
+def iter_panres_descriptions(pangene_count, rng):
+    """Yields (subject, [(predicate, kind, value)]) in the PanRes shape; kind is 'type', 'ref' or a literal datatype."""
+    for name in ('PanGene', 'OriginalGene', 'AntimicrobialResistanceGene', 'Database',
+                 'AntibioticResistanceClass', 'AntibioticResistancePhenotype'):
+        yield name, [('type', OWL_NS + 'Class')]
+    for name in ('same_as', 'has_resistance_class', 'has_predicted_phenotype', 'is_from_database'):
+        yield name, [('type', OWL_NS + 'ObjectProperty')]
+    yield 'has_length', [('type', OWL_NS + 'DatatypeProperty')]
+
+    phenotypes = [f"{stem}{suffix}" for suffix in ('', '_high', '_low') for stem in PHENOTYPE_STEMS]
+    for name in RESISTANCE_CLASSES:
+        yield name, [('type', OWL_NS + 'NamedIndividual'), ('type', NAMESPACE + 'AntibioticResistanceClass'),
+                     ('label', None, name.replace('_', ' ').title())]
+    for name in phenotypes:
+        yield name, [('type', OWL_NS + 'NamedIndividual'), ('type', NAMESPACE + 'AntibioticResistancePhenotype'),
+                     ('label', None, name), ('comment', None, f"resistance to {name.replace('_', ' ')}")]
+    for name in DATABASES:
+        yield name, [('type', OWL_NS + 'NamedIndividual'), ('type', NAMESPACE + 'Database')]
+
+    # Zipf-like weights: the first classes and phenotypes are used far more than the last
+    class_weights = [1 / (rank + 1) for rank in range(len(RESISTANCE_CLASSES))]
+    phenotype_weights = [1 / (rank + 1) for rank in range(len(phenotypes))]
+    original_number = 0
+    for gene_number in range(1, pangene_count + 1):
+        properties = [('type', OWL_NS + 'NamedIndividual'), ('type', NAMESPACE + 'PanGene')]
+        if rng.random() < 0.4:
+            properties.append(('type', NAMESPACE + 'AntimicrobialResistanceGene'))
+        properties.append(('has_length', XSD_INTEGER, str(rng.randint(300, 3000))))
+        for name in set(rng.choices(RESISTANCE_CLASSES, class_weights, k=rng.choice((1, 1, 2)))):
+            properties.append(('has_resistance_class', 'ref', name))
+        for name in set(rng.choices(phenotypes, phenotype_weights, k=rng.choice((0, 1, 1, 2)))):
+            properties.append(('has_predicted_phenotype', 'ref', name))
+        originals = []
+        for _ in range(rng.choice((1, 2, 2, 3))):
+            original_number += 1
+            label = f"{rng.choice(GENE_PREFIXES)}{chr(65 + original_number % 26)}-{original_number}"
+            database = rng.choice(DATABASES)
+            originals.append((f"{label}_{database}", label, database))
+            properties.append(('same_as', 'ref', f"{label}_{database}"))
+        yield f"pan_{gene_number}", properties
+        for original_id, label, database in originals:
+            yield original_id, [('type', OWL_NS + 'NamedIndividual'), ('type', NAMESPACE + 'OriginalGene'),
+                                ('label', None, label), ('is_from_database', 'ref', database)]
+
+
+def generate_panres_owl(owl_file, target_triples, seed):
+    """Writes an RDF/XML file of about target_triples triples in the PanRes shape; returns the PanGene count."""
+    pangene_count = max(1, int(target_triples / TRIPLES_PER_PANGENE))
+    rng = random.Random(seed)
+    with open(owl_file, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n'
+                f'<rdf:RDF\n   xmlns="{NAMESPACE}"\n   xmlns:rdf="{RDF_NS}"\n'
+                '   xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#"\n>\n')
+        for subject, properties in iter_panres_descriptions(pangene_count, rng):
+            lines = [f"  <rdf:Description rdf:about={quoteattr(NAMESPACE + subject)}>"]
+            for prop in properties:
+                if prop[0] == 'type':
+                    lines.append(f"    <rdf:type rdf:resource={quoteattr(prop[1])}/>")
+                elif prop[0] in ('label', 'comment'):
+                    lines.append(f"    <rdfs:{prop[0]}>{escape(prop[2])}</rdfs:{prop[0]}>")
+                elif prop[1] == 'ref':
+                    lines.append(f"    <{prop[0]} rdf:resource={quoteattr(NAMESPACE + prop[2])}/>")
+                else:
+                    lines.append(f"    <{prop[0]} rdf:datatype={quoteattr(prop[1])}>{escape(prop[2])}</{prop[0]}>")
+            lines.append("  </rdf:Description>\n")
+            f.write('\n'.join(lines))
+        f.write('</rdf:RDF>\n')
+    return pangene_count
+
+
+def time_call(func, repeat):
+    """{'median', 'min'} of `repeat` runs in ms, with the garbage collector off while timing."""
+    timings_ms = []
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            func()
+            timings_ms.append((time.perf_counter() - start) * 1000)
+        finally:
+            gc.enable()
+    return {'median': round(statistics.median(timings_ms), 3), 'min': round(min(timings_ms), 3)}
+
+
+def time_once(func):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()): # The build functions report progress with print()
+        func()
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+def measure(db_file, repeat):
+    """Times the app against db_file in this process; returns {case: {'median', 'min'} or {'error'}}."""
+    os.environ['PANRES_DATABASE'] = db_file
+    os.environ['PANRES_LABEL_CACHE_SIZE'] = '0'
+    os.environ['PANRES_PAGE_CACHE_ENDPOINTS'] = ''
+    os.environ['PANRES_GRAPH_SNAPSHOT'] = '0'
+    results = {}
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as panres_app
+    results['app startup'] = {'median': round((time.perf_counter() - start) * 1000, 3)}
+    logging.disable(logging.INFO)
+
+    conn = sqlite3.connect(db_file)
+    fingerprint = panres_app.get_db_fingerprint(conn)
+    def largest(predicate):
+        return conn.execute("SELECT object FROM triples WHERE predicate = ? GROUP BY object ORDER BY COUNT(*) DESC LIMIT 1",
+                            (predicate,)).fetchone()[0]
+    def first_of_type(type_id):
+        return conn.execute("SELECT MIN(subject) FROM triples WHERE predicate = ? AND object = ?",
+                            (panres_app.RDF_TYPE, type_id)).fetchone()[0]
+    client = panres_app.app.test_client()
+
+    def in_request(func, *args):
+        def run():
+            with panres_app.app.test_request_context():
+                func(*args)
+        return run
+
+    def get(url):
+        def run():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {url} returned {response.status_code}")
+        return run
+
+    cases = [
+        ('create_and_populate_fts', lambda: time_once(lambda: panres_app.create_and_populate_fts(db_file, fingerprint=fingerprint)), None),
+        ('get_item_details PanGene', in_request(panres_app.get_item_details, first_of_type('PanGene')), repeat),
+        ('get_item_details OriginalGene', in_request(panres_app.get_item_details, first_of_type('OriginalGene')), repeat),
+        ('get_item_details largest class', in_request(panres_app.get_item_details, largest(panres_app.HAS_RESISTANCE_CLASS)), repeat),
+        ('get_item_details largest database', in_request(panres_app.get_item_details, largest(panres_app.IS_FROM_DATABASE)), repeat),
+    ]
+    for predicate in panres_app.GROUPING_PREDICATES:
+        cases.append((f"fetch_list_groups {predicate}", lambda predicate=predicate: panres_app.fetch_list_groups(conn, predicate), repeat))
+    for category in panres_app.INDEX_CATEGORIES:
+        cases.append((f"GET /list/{category}", get(f"/list/{quote(category)}"), repeat))
+    cases.append(('get_pangen_distribution_data', in_request(panres_app.get_pangen_distribution_data), repeat))
+    for term in AUTOCOMPLETE_TERMS:
+        cases.append((f"GET /autocomplete?q={term}", get(f"/autocomplete?q={quote(term)}"), repeat))
+
+    for name, func, runs in cases:
+        try:
+            if runs is None: # A rebuild: timed once, without a warm-up run
+                results[name] = {'median': func()}
+                continue
+            func() # Warm up
+            results[name] = time_call(func, runs)
+        except Exception as e:
+            results[name] = {'error': f"{type(e).__name__}: {e}"}
+    conn.close()
+    return results
+
+
+def run_measure_process(db_file, repeat):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', db_file, '--repeat', str(repeat)],
+                            capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(f"measuring {db_file} failed:\n{output.stderr}")
+    return json.loads(output.stdout.splitlines()[-1])
+
+
+def run_scale(target_triples, args, work_dir):
+    import owl2sqlite
+
+    owl_file = os.path.join(work_dir, f"panres_{target_triples}.owl")
+    db_file = os.path.join(work_dir, f"panres_{target_triples}.db")
+    start = time.perf_counter()
+    pangene_count = generate_panres_owl(owl_file, target_triples, args.seed)
+    generate_ms = round((time.perf_counter() - start) * 1000, 3)
+
+    loader = {'rdflib': {}, 'bulk': {'bulk': True}, 'streaming': {'streaming': True}}[args.loader]
+    convert_ms = time_once(lambda: owl2sqlite.convert_owl_to_sqlite(owl_file, db_file, **loader))
+    conn = sqlite3.connect(db_file)
+    triple_count = conn.execute("SELECT COUNT(*) FROM triples").fetchone()[0]
+    conn.close()
+    db_bytes = os.path.getsize(db_file)
+
+    timings = {'convert_owl_to_sqlite': {'median': convert_ms}}
+    timings.update(run_measure_process(db_file, args.repeat))
+    result = {
+        'target_triples': target_triples,
+        'triples': triple_count,
+        'pangenes': pangene_count,
+        'owl_bytes': os.path.getsize(owl_file),
+        'db_bytes': db_bytes, # Before the FTS index and summary tables were added
+        'generate_ms': generate_ms,
+        'timings_ms': timings,
+    }
+    if not args.work_dir:
+        os.remove(owl_file)
+    return result
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_run(result):
+    print(f"{result['target_triples']:,} triples requested: {result['triples']:,} triples, {result['pangenes']:,} PanGenes, "
+          f"{result['owl_bytes'] / 1e6:.1f} MB OWL, {result['db_bytes'] / 1e6:.1f} MB database")
+    for name, timing in result['timings_ms'].items():
+        if 'error' in timing:
+            print(f"    {name:<44} FAILED: {timing['error']}")
+        else:
+            print(f"    {name:<44} {timing['median']:>12.2f} ms")
+
+
+def compare(before_file, after_file):
+    with open(before_file) as f:
+        before = {run['target_triples']: run for run in json.load(f)['runs']}
+    with open(after_file) as f:
+        after = json.load(f)
+    print(f"{'case':<44} {'before ms':>12} {'after ms':>12} {'ratio':>7}")
+    for run in after['runs']:
+        previous = before.get(run['target_triples'])
+        if previous is None:
+            continue
+        print(f"{run['target_triples']:,} triples")
+        for name, timing in run['timings_ms'].items():
+            old = previous['timings_ms'].get(name, {})
+            if 'median' not in timing or 'median' not in old:
+                continue
+            ratio = timing['median'] / old['median'] if old['median'] else float('inf')
+            print(f"    {name:<40} {old['median']:>12.2f} {timing['median']:>12.2f} {ratio:>7.2f}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--triples', default='10000,100000,1000000',
+                        help="Comma-separated scales, in triples (10000 to 10000000)")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per case (median is reported)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--loader', choices=('streaming', 'bulk', 'rdflib'), default='streaming',
+                        help="convert_owl_to_sqlite mode to time; 'rdflib' holds the whole graph in memory")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--work-dir', help="Keep the generated OWL files and databases here (default: a temporary directory, removed afterwards)")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="Compare two result files instead of running")
+    parser.add_argument('--measure', metavar='DB_FILE', help=argparse.SUPPRESS) # Child process: time the app on DB_FILE, print JSON
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.repeat)))
+        return 0
+    if args.compare:
+        return compare(*args.compare)
+    scales = [int(value) for value in args.triples.split(',') if value.strip()]
+    if any(not 10000 <= scale <= 10000000 for scale in scales):
+        print("Error: --triples scales must be between 10000 and 10000000.")
+        return 1
+
+    report = {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': get_git_commit(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'loader': args.loader,
+        'repeat': args.repeat,
+        'runs': [],
+    }
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='panres_suite_')
+    os.makedirs(work_dir, exist_ok=True)
+    failures = 0
+    try:
+        for scale in scales:
+            result = run_scale(scale, args, work_dir)
+            report['runs'].append(result)
+            failures += sum(1 for timing in result['timings_ms'].values() if 'error' in timing)
+            print_run(result)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if failures:
+        print(f"FAIL: {failures} case(s) failed")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+Gunicorn settings, read from the working directory when gunicorn starts (see Procfile).
+
+With PROMETHEUS_MULTIPROC_DIR set, every worker writes its Prometheus metrics to
+files in that directory and /metrics sums them over all workers (see
+create_metrics in app.py). The directory is emptied when the server starts, so
+values of an earlier run are not added in, and the live-only gauges of a worker
+are dropped when it exits.
+
+With PANRES_PRELOAD=1 the app is imported once, in the master, before the workers
+are forked: the FTS and summary table checks, the in-memory autocomplete index and
+the graph snapshot (see GraphSnapshot in app.py) are built once, and the workers
+share those pages copy-on-write instead of each building its own copy. The
+garbage collector is kept off while the app loads, so it frees nothing into holes
+in pages the workers will share, and everything loaded is frozen (gc.freeze)
+before forking, so collections in the workers never write to it. Code changes then
+need a full restart; a HUP only replaces the workers.
+"""
+import gc
+import glob
+import os
+
+preload_app = os.environ.get('PANRES_PRELOAD', '0') == '1'
+if preload_app:
+    gc.disable()
+
+
+def on_starting(server):
+    multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(multiproc_dir, '*.db')):
+            os.remove(path)
+
+
+def when_ready(server):
+    if preload_app:
+        gc.freeze()
+        gc.enable()
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        # Also covers what the master allocated since, for workers started later
+        gc.freeze()
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        try:
+            from prometheus_client import multiprocess
+        except ImportError:
+            return
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,7 +1,17 @@
 import sqlite3
 import rdflib
-from rdflib import URIRef, Literal, Namespace
+from rdflib import URIRef, Literal, Namespace, BNode, RDF
 import os
+import sys
+import pathlib
+import xml.etree.ElementTree as ET
+from urllib.parse import urljoin
+import uuid
+import datetime
+import argparse
+import time
+import functools
+from collections import OrderedDict
 
 # --- Configuration ---
 # Make sure this path points correctly to your OWL file
@@ -67,16 +77,673 @@ def get_literal_datatype(term):
         return dt_str
     return None # No datatype specified for the literal
 
+def clean_triple(s, p, o):
+    """
+    Returns the cleaned (subject, predicate, object, object_is_literal, object_datatype)
+    row for an rdflib triple, or None if a part cannot be stored (e.g., Blank Nodes).
+    """
+    subject_id = clean_identifier(s)
+    predicate_id = clean_identifier(p)
+    object_val = clean_identifier(o) # Value for literal, cleaned URI for resource
+    if subject_id is None or predicate_id is None or object_val is None:
+        return None
+    return (subject_id, predicate_id, object_val, isinstance(o, Literal), get_literal_datatype(o))
+
+@functools.lru_cache(maxsize=200000)
+def clean_term(term):
+    """Memoized (clean_identifier, get_literal_datatype) of one term; terms repeat across triples."""
+    return clean_identifier(term), get_literal_datatype(term)
+
+def clean_triple_cached(s, p, o):
+    """clean_triple() through the bounded clean_term() cache, for the bulk loader."""
+    subject_id = clean_term(s)[0]
+    predicate_id = clean_term(p)[0]
+    object_val, datatype = clean_term(o)
+    if subject_id is None or predicate_id is None or object_val is None:
+        return None
+    return (subject_id, predicate_id, object_val, isinstance(o, Literal), datatype)
+
+def write_build_info(cursor, owl_file, triple_count, parent_build_id=None):
+    """
+    (Re)creates the 'BuildInfo' key/value table describing this conversion.
+    The web app combines 'build_id' with the Triples row count as the content
+    fingerprint that decides whether its derived search index must be rebuilt.
+    Incremental updates (see update_sqlite_from_owl) also record the build they
+    were applied to as 'parent_build_id'. Returns the new build id.
+    """
+    build_id = uuid.uuid4().hex
+    cursor.execute("DROP TABLE IF EXISTS BuildInfo")
+    cursor.execute("CREATE TABLE BuildInfo (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    build_info = [
+        ('build_id', build_id),
+        ('triple_count', str(triple_count)),
+        ('source_file', os.path.basename(owl_file)),
+        ('built_at', datetime.datetime.now(datetime.timezone.utc).isoformat()),
+    ]
+    if parent_build_id:
+        build_info.append(('parent_build_id', parent_build_id))
+    cursor.executemany("INSERT INTO BuildInfo (key, value) VALUES (?, ?)", build_info)
+    return build_id
+
+# --- Storage Layouts ---
+# 'text' stores every triple as three TEXT columns in the 'Triples' table.
+# 'dictionary' stores each distinct term once in 'terms' and the triples as integer
+# ids in 'TripleIds'; a 'Triples' view with the original columns (plus rowid and the
+# integer ids) keeps every query written against the text layout working.
+SCHEMAS = ('text', 'dictionary')
+
+def get_triple_store_schema(cursor):
+    """Returns 'text' or 'dictionary' for an existing triple store, or None if there is none."""
+    row = cursor.execute("SELECT type FROM sqlite_master WHERE name = 'Triples' COLLATE NOCASE").fetchone()
+    if not row:
+        return None
+    return 'dictionary' if row[0] == 'view' else 'text'
+
+def drop_triple_store(cursor):
+    """
+    Drops the 'Triples' table or view and the dictionary tables, whichever exist,
+    along with the update history: a full conversion starts a new lineage.
+    """
+    schema = get_triple_store_schema(cursor)
+    if schema == 'dictionary':
+        cursor.execute("DROP VIEW Triples")
+    elif schema:
+        cursor.execute("DROP TABLE Triples")
+    cursor.execute("DROP TABLE IF EXISTS TripleIds")
+    cursor.execute("DROP TABLE IF EXISTS terms")
+    cursor.execute("DROP TABLE IF EXISTS BuildHistory")
+    cursor.execute("DROP TABLE IF EXISTS BuildChangelog")
+
+def create_triple_store(cursor, schema):
+    if schema == 'dictionary':
+        cursor.execute("""
+            CREATE TABLE terms (
+                id INTEGER PRIMARY KEY,
+                text TEXT NOT NULL,
+                is_literal INTEGER NOT NULL CHECK(is_literal IN (0, 1)), -- 1 for Literal, 0 for Resource/URI
+                datatype TEXT -- Cleaned datatype of a literal (e.g., 'xsd:string') or NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE TripleIds (
+                s INTEGER NOT NULL REFERENCES terms (id),
+                p INTEGER NOT NULL REFERENCES terms (id),
+                o INTEGER NOT NULL REFERENCES terms (id)
+            )
+        """)
+        cursor.execute("""
+            CREATE VIEW Triples AS
+            SELECT t.rowid AS rowid,
+                   s.text AS subject, p.text AS predicate, o.text AS object,
+                   o.is_literal AS object_is_literal, o.datatype AS object_datatype,
+                   t.s AS subject_id, t.p AS predicate_id, t.o AS object_id
+            FROM TripleIds t
+            JOIN terms s ON s.id = t.s
+            JOIN terms p ON p.id = t.p
+            JOIN terms o ON o.id = t.o
+        """)
+    else:
+        cursor.execute("""
+            CREATE TABLE Triples (
+                subject TEXT NOT NULL,
+                predicate TEXT NOT NULL,
+                object TEXT NOT NULL,
+                object_is_literal INTEGER NOT NULL CHECK(object_is_literal IN (0, 1)), -- 1 for Literal, 0 for Resource/URI
+                object_datatype TEXT -- Stores cleaned datatype (e.g., 'xsd:string') or NULL
+            )
+        """)
+
+def create_triple_store_indices(cursor, schema):
+    """
+    Creates the covering indexes the web app's lookups run on and refreshes the
+    planner statistics. (subject, predicate, object) answers 'everything about X'
+    and 'label/type of X'; (predicate, object, subject) answers 'who has
+    predicate P with value O' and 'all values of P' without touching the table.
+    These replace the single-column idx_subject/idx_predicate of earlier builds,
+    which are dropped here if present. Without ANALYZE the planner often picked
+    idx_predicate for 'subject = ? AND predicate = ?' and then filtered every
+    row with that predicate.
+    """
+    cursor.execute("DROP INDEX IF EXISTS idx_subject")
+    cursor.execute("DROP INDEX IF EXISTS idx_predicate")
+    if schema == 'dictionary':
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_terms_text ON terms (text)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_spo ON TripleIds (s, p, o)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_pos ON TripleIds (p, o, s)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_object ON TripleIds (o)")
+    else:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_spo ON Triples (subject, predicate, object)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_pos ON Triples (predicate, object, subject)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_object ON Triples (object, object_is_literal)") # Useful for finding specific values/links
+    cursor.execute("ANALYZE")
+
+def reindex_triple_store(db_file):
+    """Brings the indexes and statistics of an existing database up to date without reconverting it."""
+    if not os.path.exists(db_file):
+        print(f"Error: Database '{db_file}' not found.")
+        return
+    conn = sqlite3.connect(db_file)
+    try:
+        cursor = conn.cursor()
+        schema = get_triple_store_schema(cursor)
+        if schema is None:
+            print(f"Error: '{db_file}' has no Triples table; run a full conversion first.")
+            return
+        start_time = time.time()
+        create_triple_store_indices(cursor, schema)
+        conn.commit()
+        print(f"Indexes of the '{schema}' triple store rebuilt and analyzed in {time.time() - start_time:.2f}s.")
+    finally:
+        conn.close()
+
+class TermDictionary:
+    """
+    Assigns integer ids to terms for the 'dictionary' layout, inserting new ones into 'terms'.
+
+    With max_cached set, only that many term ids are kept in memory (least recently
+    used first out) and the rest are looked up in 'terms' again, so memory stays
+    bounded however large the vocabulary is. That needs idx_terms_text to exist
+    while loading.
+    """
+
+    def __init__(self, cursor, max_cached=None):
+        self.cursor = cursor
+        self.max_cached = max_cached
+        self.ids = OrderedDict()
+        self.count = 0
+
+    def get_id(self, text, is_literal, datatype):
+        key = (text, is_literal, datatype)
+        term_id = self.ids.get(key)
+        if term_id is not None:
+            if self.max_cached is not None:
+                self.ids.move_to_end(key)
+            return term_id
+        if self.max_cached is not None:
+            row = self.cursor.execute("SELECT id FROM terms WHERE text = ? AND is_literal = ? AND datatype IS ?",
+                                      (text, 1 if is_literal else 0, datatype)).fetchone()
+            term_id = row[0] if row else None
+        if term_id is None:
+            self.count += 1
+            term_id = self.count
+            self.cursor.execute("INSERT INTO terms (id, text, is_literal, datatype) VALUES (?, ?, ?, ?)",
+                                (term_id, text, 1 if is_literal else 0, datatype))
+        self.ids[key] = term_id
+        if self.max_cached is not None and len(self.ids) > self.max_cached:
+            self.ids.popitem(last=False)
+        return term_id
+
+# --- Bulk Loading ---
+BULK_BATCH_SIZE = 10000 # Rows per executemany() call
+BULK_CACHE_SIZE_MB = 256 # SQLite page cache for the loader connection
+BULK_TERM_CACHE_SIZE = 200000 # Term ids kept in memory by the dictionary layout
+
+def create_unique_triple_index(cursor, schema):
+    """
+    Deduplication for bulk loads: INSERT OR IGNORE against this index replaces the
+    in-memory set of inserted signatures. IFNULL() is needed because UNIQUE treats
+    NULL datatypes as distinct. Dropped again once the load is done.
+    """
+    if schema == 'dictionary':
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_terms_text ON terms (text)")
+        cursor.execute("CREATE UNIQUE INDEX idx_unique_triple ON TripleIds (s, p, o)")
+    else:
+        cursor.execute("CREATE UNIQUE INDEX idx_unique_triple ON Triples (subject, predicate, object, object_is_literal, IFNULL(object_datatype, ''))")
+
+def bulk_insert_triples(cursor, rows, schema, terms=None, batch_size=BULK_BATCH_SIZE, table='Triples'):
+    """
+    Inserts cleaned triple rows (see clean_triple) with batched executemany() and
+    INSERT OR IGNORE. Only one batch is held in memory at a time. For the 'text'
+    schema, `table` may name any table with the Triples columns.
+    Returns (rows_read, rows_inserted).
+    """
+    if schema == 'dictionary':
+        insert_sql = "INSERT OR IGNORE INTO TripleIds (s, p, o) VALUES (?, ?, ?)"
+    else:
+        insert_sql = f"""
+            INSERT OR IGNORE INTO {table} (subject, predicate, object, object_is_literal, object_datatype)
+            VALUES (?, ?, ?, ?, ?)
+        """
+    rows_read = 0
+    rows_inserted = 0
+    batch = []
+    for subject_id, predicate_id, object_val, is_literal, datatype in rows:
+        rows_read += 1
+        if terms is not None:
+            batch.append((terms.get_id(subject_id, False, None),
+                          terms.get_id(predicate_id, False, None),
+                          terms.get_id(object_val, is_literal, datatype)))
+        else:
+            batch.append((subject_id, predicate_id, object_val, 1 if is_literal else 0, datatype))
+        if len(batch) >= batch_size:
+            cursor.executemany(insert_sql, batch)
+            rows_inserted += cursor.rowcount
+            batch.clear()
+            print(f" -> Inserted {rows_inserted} of {rows_read} triples read...")
+    if batch:
+        cursor.executemany(insert_sql, batch)
+        rows_inserted += cursor.rowcount
+    return rows_read, rows_inserted
+
+def convert_owl_to_sqlite_bulk(owl_file, db_file, triples, schema, batch_size=BULK_BATCH_SIZE, cache_size_mb=BULK_CACHE_SIZE_MB):
+    """
+    Bulk-load variant of the insert steps of convert_owl_to_sqlite: one transaction
+    with journaling and fsync turned off. `triples` is any iterable of rdflib
+    (s, p, o) terms, e.g. a parsed Graph or iter_rdfxml_triples(). If the load is
+    interrupted the database file is left unusable and the conversion has to be
+    run again.
+    """
+    conn = sqlite3.connect(db_file, isolation_level=None) # Transactions are managed explicitly below
+    try:
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA journal_mode = OFF")
+        cursor.execute("PRAGMA synchronous = OFF")
+        cursor.execute(f"PRAGMA cache_size = -{int(cache_size_mb * 1024)}") # Negative = KiB
+        cursor.execute("PRAGMA temp_store = MEMORY")
+        cursor.execute("BEGIN")
+
+        print(f"Step 3: Setting up the '{schema}' triple store (dropping any existing one)...")
+        drop_triple_store(cursor)
+        create_triple_store(cursor, schema)
+        create_unique_triple_index(cursor, schema)
+        terms = TermDictionary(cursor, max_cached=BULK_TERM_CACHE_SIZE) if schema == 'dictionary' else None
+
+        print(f"Step 4: Bulk-inserting triples (batches of {batch_size})...")
+        skipped_count = 0
+        def cleaned_rows():
+            nonlocal skipped_count
+            for s, p, o in triples:
+                row = clean_triple_cached(s, p, o)
+                if row is None:
+                    skipped_count += 1
+                    continue
+                yield row
+        load_start = time.time()
+        rows_read, inserted_count = bulk_insert_triples(cursor, cleaned_rows(), schema, terms, batch_size)
+        insert_seconds = time.time() - load_start
+
+        print("Step 5: Creating database indices and statistics for faster queries...")
+        # The dedup index is only needed while loading. Keeping it would hand the query
+        # planner an extra index the row-at-a-time layout lacks, and queries without an
+        # ORDER BY would then return rows in a different order.
+        cursor.execute("DROP INDEX idx_unique_triple")
+        create_triple_store_indices(cursor, schema)
+
+        print("Step 6: Recording build metadata in 'BuildInfo'...")
+        build_id = write_build_info(cursor, owl_file, inserted_count)
+        cursor.execute("COMMIT")
+        total_seconds = time.time() - load_start
+
+        print("\n--- Conversion Summary (bulk) ---")
+        print(f"Total RDF statements read from OWL: {rows_read + skipped_count}")
+        print(f"Unique triples inserted into DB: {inserted_count}")
+        print(f"Statements skipped (duplicates, BNodes): {skipped_count + rows_read - inserted_count}")
+        if terms is not None:
+            print(f"Distinct terms in dictionary: {terms.count}")
+        print(f"Insert throughput: {rows_read / max(insert_seconds, 1e-9):,.0f} triples/sec ({insert_seconds:.2f}s)")
+        print(f"Insert + index + metadata: {rows_read / max(total_seconds, 1e-9):,.0f} triples/sec ({total_seconds:.2f}s)")
+        print(f"Build id: {build_id}")
+        print(f"Database saved successfully to: {db_file}")
+    finally:
+        conn.close()
+        print("Database connection closed.")
+
+# --- Incremental Updates ---
+RDFS_LABEL = namespaces_to_strip_prefix[rdf_schema_ns] + 'label' # As stored after clean_identifier
+def apply_triple_diff(cursor, schema):
+    """
+    Applies temp.removed_triples / temp.added_triples (Triples columns, with the
+    datatype as IFNULL(object_datatype, '') in 'dt') to the triple store.
+    Terms that are no longer used stay in the dictionary; they are harmless.
+    """
+    removed_rowids = """
+        SELECT t.rowid FROM removed_triples r CROSS JOIN Triples t
+        WHERE t.subject = r.subject AND t.predicate = r.predicate AND t.object = r.object
+          AND t.object_is_literal = r.object_is_literal AND IFNULL(t.object_datatype, '') = r.dt
+    """
+    if schema == 'dictionary':
+        cursor.execute(f"DELETE FROM TripleIds WHERE rowid IN ({removed_rowids})")
+        cursor.execute("""
+            INSERT INTO terms (text, is_literal, datatype)
+            SELECT DISTINCT text, is_literal, datatype FROM (
+                SELECT subject AS text, 0 AS is_literal, NULL AS datatype FROM added_triples
+                UNION SELECT predicate, 0, NULL FROM added_triples
+                UNION SELECT object, object_is_literal, NULLIF(dt, '') FROM added_triples
+            ) AS new_terms
+            WHERE NOT EXISTS (SELECT 1 FROM terms WHERE terms.text = new_terms.text
+                              AND terms.is_literal = new_terms.is_literal AND terms.datatype IS new_terms.datatype)
+        """)
+        cursor.execute("""
+            INSERT INTO TripleIds (s, p, o)
+            SELECT s.id, p.id, o.id FROM added_triples a
+            JOIN terms s ON s.text = a.subject AND s.is_literal = 0 AND s.datatype IS NULL
+            JOIN terms p ON p.text = a.predicate AND p.is_literal = 0 AND p.datatype IS NULL
+            JOIN terms o ON o.text = a.object AND o.is_literal = a.object_is_literal AND IFNULL(o.datatype, '') = a.dt
+        """)
+    else:
+        cursor.execute(f"DELETE FROM Triples WHERE rowid IN ({removed_rowids})")
+        cursor.execute("""
+            INSERT INTO Triples (subject, predicate, object, object_is_literal, object_datatype)
+            SELECT subject, predicate, object, object_is_literal, NULLIF(dt, '') FROM added_triples
+        """)
+
+def record_build_changes(cursor, build_id, parent_build_id, added_count, removed_count):
+    """
+    Appends this update to 'BuildHistory' and lists the items it touched in
+    'BuildChangelog': the subjects of added/removed triples plus the resources those
+    triples point to (their set of referencing items changed). Items whose label
+    changed are flagged, since text derived from labels also appears on the items
+    linking to them. The web app walks BuildHistory from its indexed build to the
+    current one to refresh only these search rows and cached labels; its summary
+    tables and autocomplete keys are recomputed whole.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS BuildHistory (
+            build_id TEXT PRIMARY KEY,
+            parent_build_id TEXT,
+            built_at TEXT NOT NULL,
+            triples_added INTEGER NOT NULL,
+            triples_removed INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS BuildChangelog (
+            build_id TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            label_changed INTEGER NOT NULL CHECK(label_changed IN (0, 1)), -- 1 if one of its rdfs:label triples changed
+            PRIMARY KEY (build_id, item_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("INSERT INTO BuildHistory (build_id, parent_build_id, built_at, triples_added, triples_removed) VALUES (?, ?, ?, ?, ?)",
+                   (build_id, parent_build_id, datetime.datetime.now(datetime.timezone.utc).isoformat(), added_count, removed_count))
+    cursor.execute("""
+        INSERT INTO BuildChangelog (build_id, item_id, label_changed)
+        SELECT ?, item_id, MAX(label_changed) FROM (
+            SELECT subject AS item_id, predicate = ? AS label_changed FROM added_triples
+            UNION ALL SELECT subject, predicate = ? FROM removed_triples
+            UNION ALL SELECT object, 0 FROM added_triples WHERE object_is_literal = 0
+            UNION ALL SELECT object, 0 FROM removed_triples WHERE object_is_literal = 0
+        )
+        GROUP BY item_id
+    """, (build_id, RDFS_LABEL, RDFS_LABEL))
+    return cursor.execute("SELECT COUNT(*) FROM BuildChangelog WHERE build_id = ?", (build_id,)).fetchone()[0]
+
+def update_sqlite_from_owl(owl_file, db_file, streaming=False, batch_size=BULK_BATCH_SIZE, cache_size_mb=BULK_CACHE_SIZE_MB):
+    """
+    Brings an existing database in line with a new OWL file by applying only the
+    difference. The new triples are staged in a temporary table, diffed against the
+    store with EXCEPT, and the removals/insertions, the changelog and the new
+    BuildInfo are written in a single transaction, so readers see either the old or
+    the new build. Works with both storage layouts.
+    """
+    if not os.path.exists(owl_file):
+        print(f"Error: Input OWL file not found at '{owl_file}'")
+        return
+    if not os.path.exists(db_file):
+        print(f"Error: Database '{db_file}' not found; run a full conversion first.")
+        return
+
+    print(f"Starting incremental update of {db_file} from: {owl_file}")
+    start_time = time.time()
+    if streaming:
+        print("Step 1: Streaming OWL file (RDF/XML)...")
+        triples = iter_rdfxml_triples(owl_file)
+    else:
+        print("Step 1: Parsing OWL file...")
+        triples = rdflib.Graph()
+        try:
+            triples.parse(owl_file)
+            print(f" -> Successfully parsed {len(triples)} RDF triples.")
+        except Exception as e:
+            print(f"Error parsing OWL file: {e}")
+            return
+
+    conn = sqlite3.connect(db_file, isolation_level=None) # Transactions are managed explicitly below
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"PRAGMA cache_size = -{int(cache_size_mb * 1024)}")
+        cursor.execute("PRAGMA temp_store = FILE") # The staged copy of the OWL can be large
+        schema = get_triple_store_schema(cursor)
+        if schema is None:
+            print(f"Error: '{db_file}' has no Triples table; run a full conversion first.")
+            return
+
+        # Staging only writes to the connection's temp database, so the live database
+        # stays unlocked until the diff is applied below
+        print(f"Step 2: Staging the new triples ('{schema}' store)...")
+        cursor.execute("BEGIN")
+        cursor.execute("""
+            CREATE TEMP TABLE new_triples (
+                subject TEXT NOT NULL, predicate TEXT NOT NULL, object TEXT NOT NULL,
+                object_is_literal INTEGER NOT NULL, object_datatype TEXT
+            )
+        """)
+        cursor.execute("CREATE UNIQUE INDEX temp.idx_new_triples ON new_triples (subject, predicate, object, object_is_literal, IFNULL(object_datatype, ''))")
+        skipped_count = 0
+        def cleaned_rows():
+            nonlocal skipped_count
+            for s, p, o in triples:
+                row = clean_triple_cached(s, p, o)
+                if row is None:
+                    skipped_count += 1
+                    continue
+                yield row
+        rows_read, staged_count = bulk_insert_triples(cursor, cleaned_rows(), 'text', batch_size=batch_size, table='temp.new_triples')
+        cursor.execute("COMMIT")
+
+        print("Step 3: Diffing against the current triples...")
+        cursor.execute("BEGIN IMMEDIATE")
+        parent_build_id = None
+        if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'BuildInfo'").fetchone():
+            row = cursor.execute("SELECT value FROM BuildInfo WHERE key = 'build_id'").fetchone()
+            parent_build_id = row[0] if row else None
+        columns = "subject, predicate, object, object_is_literal, IFNULL(object_datatype, '') AS dt"
+        cursor.execute(f"CREATE TEMP TABLE removed_triples AS SELECT {columns} FROM main.Triples EXCEPT SELECT {columns} FROM temp.new_triples")
+        cursor.execute(f"CREATE TEMP TABLE added_triples AS SELECT {columns} FROM temp.new_triples EXCEPT SELECT {columns} FROM main.Triples")
+        removed_count = cursor.execute("SELECT COUNT(*) FROM removed_triples").fetchone()[0]
+        added_count = cursor.execute("SELECT COUNT(*) FROM added_triples").fetchone()[0]
+        print(f" -> {added_count} triples to add, {removed_count} to remove.")
+
+        if not added_count and not removed_count:
+            cursor.execute("ROLLBACK")
+            print("Database already matches the OWL file; nothing to do.")
+            return
+
+        print("Step 4: Applying the changes...")
+        apply_triple_diff(cursor, schema)
+        cursor.execute("ANALYZE") # Keep planner statistics in line with the new row counts
+
+        print("Step 5: Recording the changelog and build metadata...")
+        triple_count = cursor.execute("SELECT COUNT(*) FROM Triples").fetchone()[0]
+        build_id = write_build_info(cursor, owl_file, triple_count, parent_build_id=parent_build_id)
+        touched_count = record_build_changes(cursor, build_id, parent_build_id, added_count, removed_count)
+        cursor.execute("COMMIT")
+
+        print("\n--- Update Summary ---")
+        print(f"Triples in new OWL: {staged_count} (skipped BNodes: {skipped_count})")
+        print(f"Triples added: {added_count}, removed: {removed_count}, now stored: {triple_count}")
+        print(f"Items touched (recorded in BuildChangelog): {touched_count}")
+        print(f"Build id: {build_id} (parent {parent_build_id or 'unknown'})")
+        print(f"Update completed in {time.time() - start_time:.2f}s")
+    except (sqlite3.Error, ET.ParseError, ValueError) as e:
+        print(f"Error during update, no changes were applied: {e}")
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+    finally:
+        conn.close()
+        print("Database connection closed.")
+
+# --- Streaming RDF/XML ---
+XML_NS = "http://www.w3.org/XML/1998/namespace"
+RDF_TAGS = {name: '{%s}%s' % (rdf_syntax_ns, name) for name in (
+    'RDF', 'Description', 'about', 'ID', 'nodeID', 'resource', 'datatype', 'parseType', 'type', 'li', 'first', 'rest', 'nil')}
+XML_BASE = '{%s}base' % XML_NS
+XML_LANG = '{%s}lang' % XML_NS
+# Attributes that are RDF/XML syntax rather than property attributes
+SYNTAX_ATTRIBUTES = {RDF_TAGS[name] for name in ('about', 'ID', 'nodeID', 'resource', 'datatype', 'parseType')}
+
+def tag_to_uri(tag):
+    namespace, _, local_name = tag[1:].partition('}')
+    return URIRef(namespace + local_name)
+
+def element_base(elem, base):
+    xml_base = elem.get(XML_BASE)
+    return urljoin(base, xml_base) if xml_base is not None else base
+
+def add_property_attributes(elem, subject, lang, triples):
+    for name, value in elem.attrib.items():
+        if name in SYNTAX_ATTRIBUTES or name.startswith('{%s}' % XML_NS) or not name.startswith('{'):
+            continue
+        if name == RDF_TAGS['type']:
+            triples.append((subject, RDF.type, URIRef(value)))
+        else:
+            triples.append((subject, tag_to_uri(name), Literal(value, lang=lang or None)))
+
+def describe_node(elem, base, lang, triples):
+    """Appends the triples of a node element (and everything nested in it) to `triples`; returns its subject."""
+    base = element_base(elem, base)
+    lang = elem.get(XML_LANG, lang)
+    if elem.get(RDF_TAGS['about']) is not None:
+        subject = URIRef(urljoin(base, elem.get(RDF_TAGS['about'])))
+    elif elem.get(RDF_TAGS['ID']) is not None:
+        subject = URIRef(urljoin(base, '#' + elem.get(RDF_TAGS['ID'])))
+    else:
+        subject = BNode() # rdf:nodeID or anonymous; dropped by clean_triple either way
+    if elem.tag != RDF_TAGS['Description']:
+        triples.append((subject, RDF.type, tag_to_uri(elem.tag)))
+    add_property_attributes(elem, subject, lang, triples)
+    for prop in elem:
+        describe_property(prop, subject, base, lang, triples)
+    return subject
+
+def describe_property(prop, subject, base, lang, triples):
+    base = element_base(prop, base)
+    lang = prop.get(XML_LANG, lang)
+    predicate = tag_to_uri(prop.tag)
+    parse_type = prop.get(RDF_TAGS['parseType'])
+    if prop.tag == RDF_TAGS['li'] or prop.get(RDF_TAGS['ID']) is not None:
+        raise ValueError(f"Unsupported RDF/XML construct (container item or reified statement) in <{prop.tag}>")
+
+    if parse_type == 'Resource':
+        obj = BNode()
+        triples.append((subject, predicate, obj))
+        for child in prop:
+            describe_property(child, obj, base, lang, triples)
+    elif parse_type == 'Collection':
+        # rdf:first/rdf:rest cells are blank nodes, but the members themselves and an
+        # empty list (rdf:nil) produce storable triples
+        cells = [BNode() for _ in prop]
+        triples.append((subject, predicate, cells[0] if cells else RDF.nil))
+        for i, child in enumerate(prop):
+            triples.append((cells[i], RDF.first, describe_node(child, base, lang, triples)))
+            triples.append((cells[i], RDF.rest, cells[i + 1] if i + 1 < len(cells) else RDF.nil))
+    elif parse_type is not None:
+        raise ValueError(f"Unsupported rdf:parseType='{parse_type}' in <{prop.tag}>")
+    elif prop.get(RDF_TAGS['resource']) is not None or prop.get(RDF_TAGS['nodeID']) is not None:
+        resource = prop.get(RDF_TAGS['resource'])
+        obj = URIRef(urljoin(base, resource)) if resource is not None else BNode()
+        triples.append((subject, predicate, obj))
+        add_property_attributes(prop, obj, lang, triples)
+    elif len(prop):
+        triples.append((subject, predicate, describe_node(prop[0], base, lang, triples)))
+    elif any(name not in SYNTAX_ATTRIBUTES and name.startswith('{') and not name.startswith('{%s}' % XML_NS) for name in prop.attrib):
+        obj = BNode() # Empty property element with property attributes
+        triples.append((subject, predicate, obj))
+        add_property_attributes(prop, obj, lang, triples)
+    else:
+        datatype = prop.get(RDF_TAGS['datatype'])
+        if datatype is not None:
+            obj = Literal(prop.text or '', datatype=URIRef(urljoin(base, datatype)))
+        else:
+            obj = Literal(prop.text or '', lang=lang or None)
+        triples.append((subject, predicate, obj))
+
+def iter_rdfxml_triples(owl_file):
+    """
+    Streams the triples of an RDF/XML file as rdflib terms without building a Graph.
+    Each top-level description is parsed with iterparse, turned into triples and
+    then discarded, so memory is bounded by the largest single description rather
+    than by the file. Literals are built with rdflib's Literal, so cleaning them
+    gives exactly the values the rdflib path stores. Constructs PanRes does not use
+    (containers, reification, XML literals) raise ValueError.
+    """
+    base = pathlib.Path(owl_file).absolute().as_uri() # rdflib's default base for a local file
+    lang = None
+    depth = 0
+    root = None
+    for event, elem in ET.iterparse(owl_file, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 1:
+                root = elem
+                if elem.tag != RDF_TAGS['RDF']:
+                    raise ValueError(f"Expected <rdf:RDF> as the document element, found <{elem.tag}>")
+                base = element_base(elem, base)
+                lang = elem.get(XML_LANG)
+            continue
+        depth -= 1
+        if depth == 1:
+            triples = []
+            describe_node(elem, base, lang, triples)
+            yield from triples
+            root.clear() # Drop the finished description (and any before it)
+
+def verify_streaming_parity(owl_file):
+    """
+    Compares the cleaned rows produced by iter_rdfxml_triples() with those from a
+    full rdflib parse of the same file. Prints a summary (and a sample of any
+    differences) and returns True if both sets are identical.
+    """
+    print(f"Parsing {owl_file} with rdflib...")
+    graph = rdflib.Graph()
+    graph.parse(owl_file)
+    rdflib_rows = {clean_triple(s, p, o) for s, p, o in graph}
+    rdflib_rows.discard(None)
+    print(f"Streaming {owl_file}...")
+    streamed_rows = {clean_triple(s, p, o) for s, p, o in iter_rdfxml_triples(owl_file)}
+    streamed_rows.discard(None)
+
+    missing = rdflib_rows - streamed_rows
+    extra = streamed_rows - rdflib_rows
+    print(f"rdflib rows: {len(rdflib_rows)}, streamed rows: {len(streamed_rows)}, "
+          f"missing from stream: {len(missing)}, only in stream: {len(extra)}")
+    for label, rows in (("missing", missing), ("extra", extra)):
+        for row in sorted(rows, key=repr)[:10]:
+            print(f"  {label}: {row}")
+    if missing or extra:
+        print("Parity check FAILED")
+        return False
+    print("Parity check passed: streaming ingest stores exactly the rdflib rows.")
+    return True
+
 # --- Main Script ---
-def convert_owl_to_sqlite(owl_file, db_file):
+def convert_owl_to_sqlite(owl_file, db_file, schema='text', bulk=False, streaming=False,
+                          batch_size=BULK_BATCH_SIZE, cache_size_mb=BULK_CACHE_SIZE_MB):
     """
-    Parses an OWL file and stores its triples in an SQLite database's 'Triples' table.
+    Parses an OWL file and stores its triples in an SQLite database's 'Triples' table
+    (or, with schema='dictionary', in 'terms' + 'TripleIds' behind a 'Triples' view).
+    bulk=True loads through convert_owl_to_sqlite_bulk instead of row-at-a-time inserts.
+    streaming=True (implies bulk) feeds it from iter_rdfxml_triples instead of an
+    rdflib Graph, so the file is never held in memory as a whole.
     """
+    if schema not in SCHEMAS:
+        print(f"Error: Unknown schema '{schema}', expected one of {', '.join(SCHEMAS)}")
+        return
     if not os.path.exists(owl_file):
         print(f"Error: Input OWL file not found at '{owl_file}'")
         return
 
     print(f"Starting conversion for: {owl_file}")
+    if streaming:
+        print("Step 1: Streaming OWL file (RDF/XML) during the load...")
+        print(f"Step 2: Connecting to SQLite database: {db_file} (bulk mode)")
+        try:
+            convert_owl_to_sqlite_bulk(owl_file, db_file, iter_rdfxml_triples(owl_file), schema, batch_size, cache_size_mb)
+        except (sqlite3.Error, ET.ParseError, ValueError) as e:
+            print(f"Error during streaming load: {e}")
+            print("The bulk load runs without a journal; the database file must be rebuilt.")
+        return
+
     print("Step 1: Parsing OWL file...")
     graph = rdflib.Graph()
     try:
@@ -87,23 +754,25 @@ def convert_owl_to_sqlite(owl_file, db_file):
         print(f"Error parsing OWL file: {e}")
         return
 
+    if bulk:
+        print(f"Step 2: Connecting to SQLite database: {db_file} (bulk mode)")
+        try:
+            convert_owl_to_sqlite_bulk(owl_file, db_file, graph, schema, batch_size, cache_size_mb)
+        except sqlite3.Error as e:
+            print(f"Database error occurred: {e}")
+            print("The bulk load runs without a journal; the database file must be rebuilt.")
+        return
+
     print(f"Step 2: Connecting to SQLite database: {db_file}")
     conn = None
     try:
         conn = sqlite3.connect(db_file)
         cursor = conn.cursor()
 
-        print("Step 3: Setting up database table 'Triples' (dropping if exists)...")
-        cursor.execute("DROP TABLE IF EXISTS Triples")
-        cursor.execute("""
-            CREATE TABLE Triples (
-                subject TEXT NOT NULL,
-                predicate TEXT NOT NULL,
-                object TEXT NOT NULL,
-                object_is_literal INTEGER NOT NULL CHECK(object_is_literal IN (0, 1)), -- 1 for Literal, 0 for Resource/URI
-                object_datatype TEXT -- Stores cleaned datatype (e.g., 'xsd:string') or NULL
-            )
-        """)
+        print(f"Step 3: Setting up the '{schema}' triple store (dropping any existing one)...")
+        drop_triple_store(cursor)
+        create_triple_store(cursor, schema)
+        terms = TermDictionary(cursor) if schema == 'dictionary' else None
         conn.commit() # Commit table creation
 
         print("Step 4: Inserting triples into the database...")
@@ -120,16 +789,13 @@ def convert_owl_to_sqlite(owl_file, db_file):
             count += 1
 
             # Clean the components of the triple
-            subject_id = clean_identifier(s)
-            predicate_id = clean_identifier(p)
-            object_val = clean_identifier(o) # Value for literal, cleaned URI for resource
-            is_literal = isinstance(o, Literal)
-            datatype = get_literal_datatype(o) # Cleaned datatype or None
+            cleaned = clean_triple(s, p, o)
 
             # Skip if any part couldn't be processed (e.g., Blank Nodes)
-            if subject_id is None or predicate_id is None or object_val is None:
+            if cleaned is None:
                 skipped_count += 1
                 continue
+            subject_id, predicate_id, object_val, is_literal, datatype = cleaned
 
             # Create a signature for duplicate checking
             triple_signature = (subject_id, predicate_id, object_val, is_literal, datatype)
@@ -140,10 +806,16 @@ def convert_owl_to_sqlite(owl_file, db_file):
 
             # Insert the cleaned triple
             try:
-                cursor.execute("""
-                    INSERT INTO Triples (subject, predicate, object, object_is_literal, object_datatype)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (subject_id, predicate_id, object_val, 1 if is_literal else 0, datatype))
+                if terms is not None:
+                    cursor.execute("INSERT INTO TripleIds (s, p, o) VALUES (?, ?, ?)", (
+                        terms.get_id(subject_id, False, None),
+                        terms.get_id(predicate_id, False, None),
+                        terms.get_id(object_val, is_literal, datatype)))
+                else:
+                    cursor.execute("""
+                        INSERT INTO Triples (subject, predicate, object, object_is_literal, object_datatype)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (subject_id, predicate_id, object_val, 1 if is_literal else 0, datatype))
                 inserted_count += 1
             except sqlite3.Error as insert_e:
                  print(f"Error inserting triple signature: {triple_signature}. Error: {insert_e}")
@@ -157,17 +829,22 @@ def convert_owl_to_sqlite(owl_file, db_file):
         # Final commit for any remaining inserts
         conn.commit()
 
-        print("Step 5: Creating database indices for faster queries...")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_subject ON Triples (subject)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_predicate ON Triples (predicate)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_object ON Triples (object, object_is_literal)") # Useful for finding specific values/links
+        print("Step 5: Creating database indices and statistics for faster queries...")
+        create_triple_store_indices(cursor, schema)
 
         conn.commit() # Commit index creation
 
+        print("Step 6: Recording build metadata in 'BuildInfo'...")
+        build_id = write_build_info(cursor, owl_file, inserted_count)
+        conn.commit()
+
         print("\n--- Conversion Summary ---")
         print(f"Total RDF triples read from OWL: {len(graph)}")
         print(f"Unique triples inserted into DB: {inserted_count}")
         print(f"Triples skipped (duplicates, errors, BNodes): {skipped_count}")
+        if terms is not None:
+            print(f"Distinct terms in dictionary: {terms.count}")
+        print(f"Build id: {build_id}")
         print(f"Database saved successfully to: {db_file}")
 
     except sqlite3.Error as e:
@@ -185,4 +862,31 @@ def convert_owl_to_sqlite(owl_file, db_file):
 
 # --- Run the Conversion ---
 if __name__ == "__main__":
-    convert_owl_to_sqlite(owl_file_path, db_file_path)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Convert the PanRes OWL file into the SQLite database used by the web app.")
+    parser.add_argument('owl_file', nargs='?', default=owl_file_path, help=f"Input OWL file (default: {owl_file_path})")
+    parser.add_argument('db_file', nargs='?', default=db_file_path, help=f"Output SQLite file (default: {db_file_path})")
+    parser.add_argument('--schema', choices=SCHEMAS, default='text',
+                        help="Storage layout: 'text' (one TEXT row per triple) or 'dictionary' (integer triples over a terms table, with a compatible 'Triples' view)")
+    parser.add_argument('--bulk', action='store_true',
+                        help="Load in one unjournaled transaction with batched inserts and SQLite-side deduplication (bounded memory; an interrupted run leaves an unusable file)")
+    parser.add_argument('--batch-size', type=int, default=BULK_BATCH_SIZE, help=f"Rows per batch in --bulk mode (default: {BULK_BATCH_SIZE})")
+    parser.add_argument('--cache-size-mb', type=float, default=BULK_CACHE_SIZE_MB, help=f"SQLite page cache in --bulk mode (default: {BULK_CACHE_SIZE_MB})")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Parse the RDF/XML incrementally instead of loading it into an rdflib Graph (implies --bulk)")
+    parser.add_argument('--verify-streaming', action='store_true',
+                        help="Only check that --streaming yields exactly the same rows as the rdflib parser, then exit")
+    parser.add_argument('--update', action='store_true',
+                        help="Apply only the difference between the OWL file and the existing database, recording the touched items in BuildChangelog")
+    parser.add_argument('--reindex', action='store_true',
+                        help="Only (re)create the indexes and planner statistics of an existing database, then exit")
+    args = parser.parse_args()
+    if args.reindex:
+        reindex_triple_store(args.db_file)
+    elif args.verify_streaming:
+        sys.exit(0 if verify_streaming_parity(args.owl_file) else 1)
+    elif args.update:
+        update_sqlite_from_owl(args.owl_file, args.db_file, streaming=args.streaming,
+                               batch_size=args.batch_size, cache_size_mb=args.cache_size_mb)
+    else:
+        convert_owl_to_sqlite(args.owl_file, args.db_file, schema=args.schema, bulk=args.bulk, streaming=args.streaming,
+                              batch_size=args.batch_size, cache_size_mb=args.cache_size_mb)
@@ -0,0 +1,119 @@
+"""
+Report of slow-query logs grouped by query shape.
+
+Usage (from the repository root):
+    python slow_query_report.py slow_queries.log slow_queries.log.1 [--top 20] [--since 2026-01-31] [--json]
+
+Reads the JSON records the web app's log_slow_queries() writes, either from the
+file set with PANRES_SLOW_QUERY_LOG (and its rotated copies) or from the
+application log, where other lines are skipped. Records are grouped by shape
+(the SQL with literals and IN lists folded), and for each shape the report shows
+how often it was slow, the total, median, 95th percentile and worst time, the
+most rows and the longest ID list it was run with, the endpoints it came from,
+and the query plan of its slowest run, with full scans marked. Shapes are sorted
+by total time, so the first one is where a fix saves the most.
+"""
+import argparse
+import json
+import re
+import statistics
+import sys
+from collections import defaultdict
+
+
+def read_records(paths, since=None):
+    """Slow-query records from the log files, optionally only those at or after `since` (an ISO date or time)."""
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                start = line.find('{')
+                if start < 0:
+                    continue
+                try:
+                    record = json.loads(line[start:])
+                except ValueError:
+                    continue
+                if not isinstance(record, dict) or 'shape' not in record or 'ms' not in record:
+                    continue
+                if since and record.get('time', '') < since:
+                    continue
+                yield record
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def aggregate(records):
+    """{shape: summary}, see the module docstring for the fields."""
+    groups = defaultdict(list)
+    for record in records:
+        groups[record['shape']].append(record)
+    summaries = {}
+    for shape, group in groups.items():
+        timings = [record['ms'] for record in group]
+        slowest = max(group, key=lambda record: record['ms'])
+        list_lengths = [length for record in group for length in record.get('parameters', {}).get('list_lengths', [])]
+        endpoints = defaultdict(int)
+        for record in group:
+            endpoints[record.get('endpoint') or 'unknown'] += 1
+        plan = slowest.get('plan') or []
+        summaries[shape] = {
+            'count': len(group),
+            'total_ms': round(sum(timings), 2),
+            'median_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'max_ms': round(max(timings), 2),
+            'max_rows': max(record.get('rows', 0) for record in group),
+            'max_list_length': max(list_lengths) if list_lengths else None,
+            'endpoints': dict(sorted(endpoints.items(), key=lambda item: -item[1])),
+            'first': min(record.get('time', '') for record in group),
+            'last': max(record.get('time', '') for record in group),
+            'slowest_path': slowest.get('path'),
+            'plan': plan,
+            'full_scan': any(re.match(r"\s*SCAN (?!.*(?:VIRTUAL TABLE|CONSTANT ROW))", line) for line in plan),
+        }
+    return dict(sorted(summaries.items(), key=lambda item: -item[1]['total_ms']))
+
+
+def print_report(summaries, top):
+    total = sum(summary['total_ms'] for summary in summaries.values())
+    print(f"{sum(summary['count'] for summary in summaries.values())} slow statements in {len(summaries)} shapes, "
+          f"{total / 1000:.1f}s in total")
+    for rank, (shape, summary) in enumerate(list(summaries.items())[:top], 1):
+        print()
+        print(f"#{rank} {summary['count']}x, total {summary['total_ms']:.0f} ms ({summary['total_ms'] / total:.0%}), "
+              f"median {summary['median_ms']:.0f} ms, p95 {summary['p95_ms']:.0f} ms, max {summary['max_ms']:.0f} ms"
+              f"{'  FULL SCAN' if summary['full_scan'] else ''}")
+        print(f"    {shape[:300]}")
+        details = [f"up to {summary['max_rows']} rows"]
+        if summary['max_list_length'] is not None:
+            details.append(f"ID lists of up to {summary['max_list_length']}")
+        details.append(', '.join(f"{endpoint} {count}x" for endpoint, count in summary['endpoints'].items()))
+        print(f"    {'; '.join(details)}")
+        print(f"    slowest: {summary['slowest_path']}, seen {summary['first']} .. {summary['last']}")
+        for line in summary['plan']:
+            print(f"      {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('log_files', nargs='+')
+    parser.add_argument('--top', type=int, default=20, help="Shapes to show (default 20)")
+    parser.add_argument('--since', help="Only records at or after this ISO date/time (UTC)")
+    parser.add_argument('--json', action='store_true', help="Print the summary per shape as JSON instead")
+    args = parser.parse_args()
+
+    summaries = aggregate(read_records(args.log_files, args.since))
+    if args.json:
+        print(json.dumps(summaries, indent=2))
+    elif not summaries:
+        print("No slow-query records found.")
+    else:
+        print_report(summaries, args.top)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())